@@ -1,7 +1,7 @@
 from django import forms
 from django.conf import settings
 from django.urls import re_path as url
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.core.management import get_commands
 from django.urls import reverse, NoReverseMatch
 from django.db import models
@@ -12,11 +12,13 @@ from django.http import HttpResponseRedirect, Http404, HttpResponse
 from django.utils import dateformat, timezone
 from django.utils.datastructures import MultiValueDict
 from django.utils.formats import get_format
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.utils.text import capfirst
 from django.utils.translation import gettext_lazy as _
+from toposort import CircularDependencyError
 
-from chroniker.models import Job, Log, JobDependency, Monitor, CallbackMethod
+from chroniker.chains import get_chain_estimate
+from chroniker.models import Job, Log, JobDependency, Monitor, CallbackMethod, SchedulerTick, WorkerHost, SchedulerLease, DispatchEntry
 from chroniker import utils
 from chroniker.widgets import ImproveRawIdFieldsFormTabularInline
 
@@ -73,6 +75,8 @@ class JobAdmin(admin.ModelAdmin):
         'stop_button',
         'view_logs_button',
     )
+    # The progress columns read each job's runtime state.
+    list_select_related = ('runtime',)
 
     @admin.display(
         description='type'
@@ -88,6 +92,7 @@ class JobAdmin(admin.ModelAdmin):
     readonly_fields = (
         'check_is_complete',
         'view_logs_button',
+        'is_running',
         'last_run_successful',
         'last_heartbeat',
         'is_fresh',
@@ -98,6 +103,7 @@ class JobAdmin(admin.ModelAdmin):
         'progress_percent_str',
         'estimated_completion_datetime_str',
         'monitor_records',
+        'monitor_records_strategy',
         'current_hostname',
         'current_pid',
         'job_type',
@@ -122,6 +128,7 @@ class JobAdmin(admin.ModelAdmin):
                 'args',
                 'raw_command',
                 'hostname',
+                'host_group',
                 'current_hostname',
                 'current_pid',
             )
@@ -168,7 +175,13 @@ class JobAdmin(admin.ModelAdmin):
                 'monitor_url',
                 'monitor_error_template',
                 'monitor_description',
+                'monitor_count_strategy',
+                'monitor_count_cap',
                 'monitor_records',
+                'monitor_records_strategy',
+                'monitor_alert_threshold',
+                'monitor_alert_increase',
+                'monitor_alert_sustained_checks',
             )
         }),
         ('E-mail subscriptions', {
@@ -398,12 +411,52 @@ class JobAdmin(admin.ModelAdmin):
 
         return render(request, 'admin/chroniker/job/duration_graph.html', context)
 
+    def view_chain(self, request, object_id):
+        """
+        Shows the critical path and estimated duration of the chain of jobs
+        waiting on this job, or with ?live=1, when the running chain will finish.
+        """
+        model = self.model
+        opts = model._meta
+        try:
+            object_id = int(object_id)
+        except (TypeError, ValueError) as exc:
+            raise Http404 from exc
+        obj = self.get_object(request, object_id)
+        if obj is None:
+            raise Http404
+
+        live = utils.parse_bool(request.GET.get('live'))
+        try:
+            estimate = get_chain_estimate(obj, live=live)
+        except CircularDependencyError as exc:
+            self.message_user(
+                request,
+                _('The chain of jobs waiting on %(job)s has a dependency cycle: %(error)s') % {'job': obj, 'error': exc},
+                messages.ERROR,
+            )
+            return HttpResponseRedirect(utils.get_admin_change_url(obj))
+        context = {
+            'title': _('Chain estimate for %s') % obj,
+            'object_id': object_id,
+            'original': obj,
+            'is_popup': False,
+            'media': self.media,
+            'app_label': opts.app_label,
+            'opts': opts,
+            'live': live,
+            'estimate': estimate,
+        }
+
+        return render(request, 'admin/chroniker/job/chain.html', context)
+
     def get_urls(self):
         urls = super().get_urls()
         my_urls = [
             url(r'^(.+)/run/$', self.admin_site.admin_view(self.run_job_view), name="chroniker_job_run"),
             url(r'^(.+)/stop/$', self.admin_site.admin_view(self.stop_job_view), name="chroniker_job_stop"),
             url(r'^(.+)/graph/duration/$', self.admin_site.admin_view(self.view_duration_graph), name='chroniker_job_duration_graph'),
+            url(r'^(.+)/chain/$', self.admin_site.admin_view(self.view_chain), name='chroniker_job_chain'),
         ]
         return my_urls + urls
 
@@ -522,6 +575,21 @@ class LogAdmin(admin.ModelAdmin):
         'stderr_link',
         'duration_str',
         'hostname',
+        'scheduled_datetime',
+        'claimed_datetime',
+        'process_start_datetime',
+        'command_start_datetime',
+        'dispatch_lag_seconds',
+        'cpu_user_seconds',
+        'cpu_system_seconds',
+        'peak_rss_bytes',
+        'read_bytes',
+        'write_bytes',
+        'max_child_processes',
+        'kill_seconds',
+        'processes_reaped',
+        'kill_escalated',
+        'callbacks_table',
     )
     date_hierarchy = 'run_start_datetime'
     fieldsets = (
@@ -535,6 +603,39 @@ class LogAdmin(admin.ModelAdmin):
                 'hostname',
             )
         }),
+        ('Dispatch', {
+            'classes': ('collapse',),
+            'fields': (
+                'scheduled_datetime',
+                'claimed_datetime',
+                'process_start_datetime',
+                'command_start_datetime',
+                'dispatch_lag_seconds',
+            )
+        }),
+        ('Resources', {
+            'classes': ('collapse',),
+            'fields': (
+                'cpu_user_seconds',
+                'cpu_system_seconds',
+                'peak_rss_bytes',
+                'read_bytes',
+                'write_bytes',
+                'max_child_processes',
+            )
+        }),
+        ('Termination', {
+            'classes': ('collapse',),
+            'fields': (
+                'kill_seconds',
+                'processes_reaped',
+                'kill_escalated',
+            )
+        }),
+        ('Callbacks', {
+            'classes': ('collapse',),
+            'fields': ('callbacks_table',)
+        }),
         ('Output', {
             'fields': (
                 'stderr_link',
@@ -545,6 +646,21 @@ class LogAdmin(admin.ModelAdmin):
         }),
     )
 
+    @admin.display(description='Callbacks')
+    def callbacks_table(self, obj):
+        return format_html(
+            '<table><tr><th>Callback</th><th>Seconds</th><th>Success</th><th>Error</th></tr>{}</table>',
+            format_html_join(
+                '', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+                ((
+                    result['reference'],
+                    '' if result['seconds'] is None else '%.3f' % result['seconds'],
+                    result['success'],
+                    result['error'],
+                ) for result in obj.callback_results or [])
+            ),
+        )
+
     def queryset(self, *args, **kwargs):
         qs = super().queryset(*args, **kwargs)
         qs = qs.only(
@@ -619,6 +735,115 @@ except admin.sites.AlreadyRegistered:
     pass
 
 
+@admin.register(SchedulerTick)
+class SchedulerTickAdmin(admin.ModelAdmin):
+    list_display = (
+        'start_datetime',
+        'hostname',
+        'total_seconds',
+        'planning_seconds',
+        'queries',
+        'jobs_evaluated',
+        'jobs_skipped',
+        'jobs_dispatched',
+        'connection_opens',
+    )
+
+    list_filter = ('hostname',)
+
+    date_hierarchy = 'start_datetime'
+
+    readonly_fields = (
+        'hostname',
+        'start_datetime',
+        'end_datetime',
+        'total_seconds',
+        'planning_seconds',
+        'queries',
+        'jobs_evaluated',
+        'jobs_skipped',
+        'jobs_dispatched',
+        'connection_opens',
+        'phases_table',
+    )
+
+    @admin.display(description='Seconds')
+    def total_seconds(self, obj):
+        if obj.end_datetime:
+            return round((obj.end_datetime - obj.start_datetime).total_seconds(), 3)
+
+    @admin.display(description='Phases')
+    def phases_table(self, obj):
+        rows = sorted((obj.phases or {}).items(), key=lambda item: -item[1]['seconds'])
+        return format_html(
+            '<table><tr><th>Phase</th><th>Seconds</th><th>Queries</th></tr>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td>{:.3f}</td><td>{}</td></tr>', ((name, stats['seconds'], stats['queries']) for name, stats in rows)),
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WorkerHost)
+class WorkerHostAdmin(admin.ModelAdmin):
+    list_display = (
+        'hostname',
+        'group',
+        'last_heartbeat',
+        'capacity',
+        'running_count',
+        'load_average',
+        'free_memory',
+        'draining',
+    )
+
+    list_filter = ('group', 'draining')
+
+    list_editable = ('draining',)
+
+    readonly_fields = (
+        'hostname',
+        'group',
+        'last_heartbeat',
+        'capacity',
+        'running_count',
+        'cpu_count',
+        'load_average',
+        'free_memory',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(SchedulerLease)
+class SchedulerLeaseAdmin(admin.ModelAdmin):
+    list_display = ('name', 'holder', 'acquired_datetime', 'expires_datetime')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DispatchEntry)
+class DispatchEntryAdmin(admin.ModelAdmin):
+    list_display = ('job', 'target_hostname', 'queued_datetime', 'claimed_by', 'claimed_datetime')
+
+    list_filter = ('target_hostname',)
+
+    raw_id_fields = ('job',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Monitor)
 class MonitorAdmin(admin.ModelAdmin):
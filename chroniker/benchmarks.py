@@ -0,0 +1,256 @@
+"""
+Benchmarks for chroniker's hot paths.
+
+Each benchmark returns a JSON-serializable dict of results.
+"""
+import contextlib
+import io
+import os
+import platform
+import random
+import signal
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import timedelta
+
+import psutil
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+import chroniker
+from chroniker import constants as c, utils
+from chroniker.graph import invalidate_dependency_graph
+from chroniker.management.commands.cron import run_cron
+from chroniker.models import Job, JobDependency, JobRuntime, Log
+
+# The default relative weights of the frequencies of generated jobs.
+FREQUENCY_MIX = {c.MINUTELY: 1, c.HOURLY: 3, c.DAILY: 6}
+
+
+def _legacy_cpu_seconds(process):
+    # The full rescan TimedProcess used to do on every check.
+    total = process.cpu_times().user
+    for child in process.children(recursive=True):
+        try:
+            total += child.cpu_times().user
+        except psutil.Error:
+            pass
+    return total
+
+
+def benchmark_sampler(jobs=200, checks=10, check_freq=1):
+    """
+    Measures the CPU time the supervising process spends checking the CPU usage
+    of many concurrent job process trees, comparing the original full rescan
+    against ``utils.ProcessTreeSampler``.
+
+    Each simulated job is a shell with two sleeping children.
+    """
+    lifetime = int(checks * check_freq * 2 + 30)
+    procs = [
+        subprocess.Popen(['sh', '-c', 'sleep %i & sleep %i; wait' % (lifetime, lifetime)], start_new_session=True)
+        for _ in range(jobs)
+    ]
+    try:
+        # Give the shells a moment to spawn their children.
+        time.sleep(1)
+        roots = [psutil.Process(_.pid) for _ in procs]
+        process_count = sum(1 + len(_.children(recursive=True)) for _ in roots)
+
+        def run(check):
+            cpu_seconds = 0
+            for _ in range(checks):
+                t0 = time.process_time()
+                for i in range(len(roots)):
+                    check(i)
+                cpu_seconds += time.process_time() - t0
+                time.sleep(check_freq)
+            return cpu_seconds / checks
+
+        legacy = run(lambda i: _legacy_cpu_seconds(roots[i]))
+        samplers = [utils.ProcessTreeSampler(_.pid) for _ in procs]
+        sampler = run(lambda i: samplers[i].sample())
+    finally:
+        for proc in procs:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            proc.wait()
+
+    return dict(
+        jobs=jobs,
+        processes=process_count,
+        checks=checks,
+        check_freq=check_freq,
+        legacy_cpu_seconds_per_check=legacy,
+        sampler_cpu_seconds_per_check=sampler,
+        # The original cpu_percent(interval=1) blocked one second per process
+        # in each tree, so it wasn't practical to run here.
+        legacy_cpu_percent_blocking_seconds_per_check=float(process_count),
+        sampler_cpu_percent_blocking_seconds_per_check=0.,
+    )
+
+
+def populate(jobs=1000, logs=10, dependency_density=0.1, frequency_mix=None, stale_ratio=0.01, seed=0):
+    """
+    Creates a synthetic population of jobs, dependencies and logs, and returns
+    the ids of the jobs created.
+
+    Each job depends on up to three earlier jobs, each with a probability of
+    dependency_density, so the dependencies are always acyclic. About half the
+    jobs are due, and a stale_ratio of them appear to be running but stalled.
+    """
+    rng = random.Random(seed)
+    frequency_mix = frequency_mix or FREQUENCY_MIX
+    frequencies = list(frequency_mix)
+    weights = [frequency_mix[_] for _ in frequencies]
+    now = timezone.now()
+    stale_heartbeat = now - timedelta(days=1)
+
+    new_jobs = []
+    for i in range(jobs):
+        stale = rng.random() < stale_ratio
+        new_jobs.append(Job(
+            name='benchmark %i' % i,
+            raw_command='true',
+            frequency=rng.choices(frequencies, weights)[0],
+            enabled=True,
+            next_run=now + timedelta(minutes=rng.randint(-60, 60)),
+            last_run_successful=rng.random() < 0.9,
+            is_running=stale,
+        ))
+    job_ids = [_.id for _ in Job.objects.bulk_create(new_jobs)]
+    JobRuntime.objects.bulk_create(
+        JobRuntime(job_id=job_id, last_heartbeat=stale_heartbeat) for job_id, job in zip(job_ids, new_jobs) if job.is_running
+    )
+
+    dependencies = set()
+    for i, job_id in enumerate(job_ids[1:], 1):
+        for _ in range(3):
+            if rng.random() < dependency_density:
+                dependencies.add((job_id, job_ids[rng.randrange(i)]))
+    JobDependency.objects.bulk_create(
+        JobDependency(dependent_id=dependent_id, dependee_id=dependee_id, wait_for_next_run=False) for dependent_id, dependee_id in dependencies
+    )
+    # Bulk creation doesn't send the signals that normally do this.
+    invalidate_dependency_graph()
+
+    new_logs = []
+    for job_id in job_ids:
+        for i in range(logs):
+            start = now - timedelta(hours=i + 1, seconds=rng.randint(0, 600))
+            duration = rng.uniform(1, 300)
+            new_logs.append(Log(
+                job_id=job_id,
+                run_start_datetime=start,
+                run_end_datetime=start + timedelta(seconds=duration),
+                duration_seconds=duration,
+                success=rng.random() < 0.9,
+                hostname='benchmark',
+                stdout='output %i' % i,
+            ))
+    Log.objects.bulk_create(new_logs, batch_size=1000)
+    return job_ids
+
+
+def measure(func, repeat=3):
+    """
+    Times func, then runs it once more to count its queries and peak memory.
+
+    Each run's database changes are rolled back, so every run starts from the
+    same state.
+    """
+
+    def run():
+        with transaction.atomic():
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+            transaction.set_rollback(True)
+
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return dict(
+        min_seconds=min(timings),
+        median_seconds=statistics.median(timings),
+        queries=len(queries),
+        peak_memory_bytes=peak_memory_bytes,
+    )
+
+
+def benchmark_scheduler(jobs=1000, logs=10, dependency_density=0.1, frequency_mix=None, repeat=3, seed=0):
+    """
+    Times the scheduler's and admin's hot paths against a synthetic population.
+
+    Everything runs in a transaction that's rolled back, so the database is
+    left unchanged.
+    """
+    results = {}
+    with transaction.atomic():
+        t0 = time.perf_counter()
+        job_ids = populate(jobs=jobs, logs=logs, dependency_density=dependency_density, frequency_mix=frequency_mix, seed=seed)
+        populate_seconds = time.perf_counter() - t0
+
+        # An unsaved superuser is enough to render the admin.
+        user = User(username='benchmark', is_active=True, is_staff=True, is_superuser=True)
+        factory = RequestFactory()
+
+        def get(path):
+            request = factory.get(path)
+            request.user = user
+            return request
+
+        job_admin = admin.site._registry[Job]
+        log_admin = admin.site._registry[Log]
+        cutoff = timezone.now() - timedelta(hours=logs / 2.)
+
+        def due_with_met_dependencies_ordered():
+            invalidate_dependency_graph()
+            Job.objects.due_with_met_dependencies_ordered()
+
+        benchmarks = [
+            ('due_with_met_dependencies_ordered', due_with_met_dependencies_ordered),
+            ('cron_dryrun', lambda: run_cron(dryrun=True, update_heartbeat=0)),
+            ('job_changelist', lambda: job_admin.changelist_view(get('/admin/chroniker/job/')).render()),
+            ('log_changelist', lambda: log_admin.changelist_view(get('/admin/chroniker/log/')).render()),
+            ('duration_graph', lambda: job_admin.view_duration_graph(get('/admin/chroniker/job/%i/graph/duration/' % job_ids[0]), job_ids[0])),
+            ('end_all_stale', Job.objects.end_all_stale),
+            ('log_cleanup', lambda: Log.cleanup(time_ago=cutoff)),
+        ]
+        for name, func in benchmarks:
+            results[name] = measure(func, repeat=repeat)
+
+        transaction.set_rollback(True)
+
+    return dict(
+        version=chroniker.__version__,
+        python=platform.python_version(),
+        database=connection.vendor,
+        jobs=jobs,
+        logs_per_job=logs,
+        dependency_density=dependency_density,
+        frequency_mix=frequency_mix or FREQUENCY_MIX,
+        repeat=repeat,
+        seed=seed,
+        populate_seconds=populate_seconds,
+        benchmarks=results,
+    )
@@ -0,0 +1,220 @@
+"""
+Runs a job's success and error callbacks.
+
+Callbacks run concurrently on a process-wide pool of at most
+CHRONIKER_CALLBACK_WORKERS daemon threads, and each is given
+CHRONIKER_CALLBACK_TIMEOUT_SECONDS to finish. A callback that hangs is
+abandoned rather than keeping the job's process alive, since daemon threads
+don't block the process from exiting. It still ties up one of the pool's
+threads, so hung callbacks can't pile up more threads than the pool has.
+
+Unless CHRONIKER_CALLBACK_BACKGROUND is disabled, a finished run starts its
+callbacks in the background, so it doesn't wait for them. The process still
+waits for them, up to the timeout, before exiting.
+"""
+import queue
+import threading
+import time
+
+from django.db import connection
+
+from chroniker.utils import import_string
+
+from . import settings as _settings
+
+_callables = {} # {reference:callable}
+
+_background = [] # [thread]
+
+_cache = {} # {'pool':CallbackPool}
+
+
+def get_callable(reference):
+    """
+    Returns the function a callback reference names, importing it only once per process.
+    """
+    if reference not in _callables:
+        _callables[reference] = import_string(reference)
+    return _callables[reference]
+
+
+class CallbackPool:
+    """
+    Runs functions on at most size daemon threads, started as they're needed
+    and reused for the life of the process.
+
+    Functions report the deadline of the callback they're running with
+    ``track()``, so the pool can tell how many of its threads are stuck on
+    callbacks that have timed out.
+    """
+
+    def __init__(self, size):
+        self.size = max(size, 1)
+        self.tasks = queue.Queue()
+        self.threads = []
+        self.idle = 0
+        self.deadlines = {} # {thread ident:deadline}
+        self.lock = threading.Lock()
+
+    def submit(self, function):
+        with self.lock:
+            if self.idle <= self.tasks.qsize() and len(self.threads) < self.size:
+                thread = threading.Thread(target=self._work, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.tasks.put(function)
+
+    def _work(self):
+        while True:
+            with self.lock:
+                self.idle += 1
+            function = self.tasks.get()
+            with self.lock:
+                self.idle -= 1
+            try:
+                function()
+            finally:
+                self.track(None)
+
+    def track(self, deadline):
+        """
+        Records the deadline of the callback the current thread is running, or
+        None once it's done.
+        """
+        if deadline is None:
+            self.deadlines.pop(threading.get_ident(), None)
+        else:
+            self.deadlines[threading.get_ident()] = deadline
+
+    def stuck(self):
+        """
+        Returns the number of threads running callbacks past their deadline.
+        """
+        now = time.time()
+        return sum(1 for deadline in list(self.deadlines.values()) if deadline <= now)
+
+
+def get_pool():
+    """
+    Returns the process's callback pool, creating it on first use.
+    """
+    if 'pool' not in _cache:
+        _cache['pool'] = CallbackPool(_settings.CHRONIKER_CALLBACK_WORKERS)
+    return _cache['pool']
+
+
+class CallbackDispatcher:
+    """
+    Calls callbacks on the given pool, or the process's, with at most
+    max_workers running at once, and waits up to timeout_seconds for each to
+    finish once it has started.
+    """
+
+    def __init__(self, max_workers=None, timeout_seconds=None, pool=None):
+        if max_workers is None:
+            max_workers = _settings.CHRONIKER_CALLBACK_WORKERS
+        if timeout_seconds is None:
+            timeout_seconds = _settings.CHRONIKER_CALLBACK_TIMEOUT_SECONDS
+        self.max_workers = max(max_workers, 1)
+        self.timeout_seconds = timeout_seconds
+        self.pool = pool or get_pool()
+
+    def run(self, references, *args, **kwargs):
+        """
+        Calls the callables named by the given references with the given
+        arguments, and returns a list with each one's reference, seconds taken,
+        success, and error, if any.
+        """
+        results = [dict(reference=reference, seconds=None, success=None, error='') for reference in references]
+        started = {} # {index:start time}
+        tasks = queue.Queue()
+        for i in range(len(results)):
+            tasks.put(i)
+
+        abandoned = threading.Event()
+
+        def work():
+            while not abandoned.is_set():
+                try:
+                    i = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                result = results[i]
+                started[i] = time.time()
+                self.pool.track(started[i] + self.timeout_seconds)
+                try:
+                    get_callable(result['reference'])(*args, **kwargs)
+                    success, error = True, ''
+                except Exception as e:
+                    success, error = False, str(e)
+                finally:
+                    # Release this thread's connection, if the callback opened one.
+                    connection.close()
+                result.update(seconds=time.time() - started[i], success=success, error=error)
+
+        workers = min(self.max_workers, len(results))
+        for _ in range(workers):
+            self.pool.submit(work)
+
+        while True:
+            unfinished = [i for i, result in enumerate(results) if result['success'] is None]
+            if not unfinished:
+                break
+            running = [i for i in unfinished if i in started]
+            expired = [i for i in running if time.time() - started[i] >= self.timeout_seconds]
+            # Stop once every running callback has timed out, and either none are
+            # left to start or all workers, or the whole pool, are stuck on timed
+            # out callbacks.
+            if len(expired) == len(running) and (
+                len(running) == len(unfinished) or len(expired) >= workers or self.pool.stuck() >= self.pool.size
+            ):
+                break
+            time.sleep(0.01)
+        # Don't start any more of these callbacks once they've been given up on.
+        abandoned.set()
+
+        for i, result in enumerate(results):
+            if result['success'] is None:
+                if i in started:
+                    result.update(seconds=time.time() - started[i], success=False, error='Timed out after %s seconds.' % self.timeout_seconds)
+                else:
+                    result.update(success=False, error='Not started before other callbacks timed out.')
+        # Copy the results, since abandoned callbacks may still update them.
+        return [dict(result) for result in results]
+
+    def start(self, references, *args, on_done=None, **kwargs):
+        """
+        Runs the callbacks like ``run()``, but on a background thread, and
+        returns the thread. If given, on_done is called with the results.
+
+        If as many callbacks are already running in the background as the pool
+        has threads, they're run before returning instead, and None is returned.
+        """
+        _background[:] = [_ for _ in _background if _.is_alive()]
+        if len(_background) >= self.pool.size:
+            results = self.run(references, *args, **kwargs)
+            if on_done:
+                on_done(results)
+            return None
+
+        def wait():
+            try:
+                results = self.run(references, *args, **kwargs)
+                if on_done:
+                    on_done(results)
+            finally:
+                connection.close()
+
+        # Not a daemon, so the process waits for the results to be recorded before exiting.
+        thread = threading.Thread(target=wait)
+        _background.append(thread)
+        thread.start()
+        return thread
+
+
+def join_background(timeout=None):
+    """
+    Waits for the callbacks started in the background to finish.
+    """
+    for thread in list(_background):
+        thread.join(timeout)
@@ -0,0 +1,218 @@
+"""
+Critical path and completion estimates for chains of dependent jobs.
+
+A chain is a root job plus every enabled job transitively waiting for it to
+complete. Each job's duration is estimated from a quantile of its recent
+successful runs, so a high quantile gives a pessimistic estimate suitable for
+checking whether a pipeline will fit in its window.
+"""
+import time
+from datetime import timedelta
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from chroniker import utils
+from chroniker.graph import get_dependency_graph
+from chroniker.models import Log
+
+from . import settings as _settings
+
+_cache = {} # {(root_id, quantile, samples):(timestamp, ChainEstimate)}, oldest first
+
+# The maximum number of estimates cached, since the quantile and samples may
+# be given by each request.
+MAX_CACHED_ESTIMATES = 1000
+
+
+def get_duration_quantiles(job_ids, quantile=None, samples=None):
+    """
+    Returns {job_id: seconds}, the given quantile of each job's most recent
+    successful run durations, in one query.
+    """
+    if quantile is None:
+        quantile = _settings.CHRONIKER_CHAIN_DURATION_QUANTILE
+    if samples is None:
+        samples = _settings.CHRONIKER_CHAIN_DURATION_SAMPLES
+    rows = Log.objects\
+        .filter(job_id__in=job_ids, success=True, duration_seconds__isnull=False)\
+        .annotate(row_number=Window(RowNumber(), partition_by=F('job_id'), order_by=F('run_end_datetime').desc()))\
+        .filter(row_number__lte=samples)\
+        .values_list('job_id', 'duration_seconds')
+    durations = {} # {job_id:[seconds]}
+    for job_id, duration_seconds in rows:
+        durations.setdefault(job_id, []).append(duration_seconds)
+    return {job_id: utils.percentile(values, quantile) for job_id, values in durations.items()}
+
+
+class ChainJob:
+    """
+    A job's place in a chain's schedule, in seconds relative to the chain's start,
+    or to now in live mode.
+    """
+
+    def __init__(self, job, duration_seconds, remaining_seconds, state):
+        self.job = job
+        self.duration_seconds = duration_seconds
+        self.remaining_seconds = remaining_seconds
+        # One of 'pending', 'running' or 'complete'.
+        self.state = state
+        self.start_seconds = 0
+        self.finish_seconds = 0
+        self.slack_seconds = 0
+        self.critical = False
+
+    def as_dict(self):
+        return dict(
+            job_id=self.job.id,
+            name=self.job.name,
+            state=self.state,
+            duration_seconds=self.duration_seconds,
+            remaining_seconds=self.remaining_seconds,
+            start_seconds=self.start_seconds,
+            finish_seconds=self.finish_seconds,
+            slack_seconds=self.slack_seconds,
+            critical=self.critical,
+        )
+
+
+class ChainEstimate:
+    """
+    The critical path and total duration of the chain rooted at a job.
+
+    In live mode, the chain's current run is the one started by the root's
+    latest run. Jobs that have successfully run since then take no time,
+    running jobs take their estimated remaining time, and the total is the time
+    from now until the chain is expected to finish.
+    """
+
+    def __init__(self, root, jobs, critical_path, live, computed_datetime):
+        self.root = root
+        self.jobs = jobs # [ChainJob] in dependency order
+        self.critical_path = critical_path # [job_id]
+        self.live = live
+        self.computed_datetime = computed_datetime
+        self.duration_seconds = max([_.finish_seconds for _ in jobs] or [0])
+
+    @property
+    def estimated_completion_datetime(self):
+        if not self.live:
+            return
+        return self.computed_datetime + timedelta(seconds=self.duration_seconds)
+
+    @property
+    def unestimated_job_ids(self):
+        """
+        The ids of jobs with no successful runs to estimate their durations from.
+        """
+        return [_.job.id for _ in self.jobs if _.duration_seconds is None]
+
+    def as_dict(self):
+        completion = self.estimated_completion_datetime
+        return dict(
+            root_job_id=self.root.id,
+            live=self.live,
+            computed_datetime=self.computed_datetime.isoformat(),
+            duration_seconds=self.duration_seconds,
+            estimated_completion_datetime=completion.isoformat() if completion else None,
+            critical_path=self.critical_path,
+            unestimated_job_ids=self.unestimated_job_ids,
+            jobs=[_.as_dict() for _ in self.jobs],
+        )
+
+
+def _get_state(job, chain_start_datetime):
+    if job.is_running:
+        return 'running'
+    if chain_start_datetime and job.last_run and job.last_run >= chain_start_datetime and job.last_run_successful:
+        return 'complete'
+    return 'pending'
+
+
+def estimate_chain(root, quantile=None, samples=None, live=False, now=None):
+    """
+    Returns a ``ChainEstimate`` for the chain rooted at the given job.
+    """
+    now = now or timezone.now()
+    graph = get_dependency_graph()
+    jobs = {root.id: root}
+    jobs.update((job.id, job) for job in root.get_chained_jobs(graph=graph))
+    durations = get_duration_quantiles(list(jobs), quantile=quantile, samples=samples)
+
+    # The chain's current run started with the root's latest run.
+    chain_start_datetime = None
+    if live:
+        chain_start_datetime = root.last_run_start_timestamp or root.last_run
+
+    chain_jobs = {}
+    for job_id in graph.topological_order(list(jobs)):
+        if job_id not in jobs:
+            continue
+        job = jobs[job_id]
+        duration_seconds = durations.get(job_id)
+        remaining_seconds = duration_seconds or 0
+        state = 'pending'
+        if live:
+            state = _get_state(job, chain_start_datetime)
+            if state == 'complete':
+                remaining_seconds = 0
+            elif state == 'running':
+                remaining_seconds = job.estimated_seconds_to_completion
+                if remaining_seconds is None:
+                    elapsed_seconds = 0
+                    if job.last_run_start_timestamp:
+                        elapsed_seconds = (now - job.last_run_start_timestamp).total_seconds()
+                    remaining_seconds = max((duration_seconds or 0) - elapsed_seconds, 0)
+        chain_job = ChainJob(job, duration_seconds, remaining_seconds, state)
+        chain_job.start_seconds = max([chain_jobs[_].finish_seconds for _ in graph.dependees(job_id) if _ in chain_jobs] or [0])
+        chain_job.finish_seconds = chain_job.start_seconds + remaining_seconds
+        chain_jobs[job_id] = chain_job
+
+    ordered = list(chain_jobs.values())
+    total_seconds = max([_.finish_seconds for _ in ordered] or [0])
+
+    # Find how late each job can finish without delaying the chain.
+    latest_finish = {}
+    for chain_job in reversed(ordered):
+        job_id = chain_job.job.id
+        latest_starts = [latest_finish[_] - chain_jobs[_].remaining_seconds for _ in graph.dependents(job_id) if _ in chain_jobs]
+        latest_finish[job_id] = min(latest_starts or [total_seconds])
+        chain_job.slack_seconds = latest_finish[job_id] - chain_job.finish_seconds
+
+    # Walk back from the last job to finish through the dependees that delayed each start.
+    critical_path = []
+    current = max(ordered, key=lambda _: _.finish_seconds) if ordered else None
+    while current:
+        current.critical = True
+        critical_path.insert(0, current.job.id)
+        dependees = [chain_jobs[_] for _ in graph.dependees(current.job.id) if _ in chain_jobs]
+        current = max(dependees, key=lambda _: _.finish_seconds) if dependees else None
+
+    return ChainEstimate(root=root, jobs=ordered, critical_path=critical_path, live=live, computed_datetime=now)
+
+
+def get_chain_estimate(root, quantile=None, samples=None, live=False):
+    """
+    Returns the ``ChainEstimate`` for the chain rooted at the given job.
+
+    Estimates not in live mode are cached for CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS,
+    since they only change as jobs' run histories grow.
+    """
+    if live:
+        return estimate_chain(root, quantile=quantile, samples=samples, live=True)
+    key = (root.id, quantile, samples)
+    cached = _cache.get(key)
+    if cached and time.time() - cached[0] < _settings.CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS:
+        return cached[1]
+    estimate = estimate_chain(root, quantile=quantile, samples=samples)
+    now = time.time()
+    # Drop expired estimates, and then the oldest, so the cache can't grow
+    # without bound.
+    for old_key, (timestamp, _) in list(_cache.items()):
+        if now - timestamp < _settings.CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS and len(_cache) < MAX_CACHED_ESTIMATES:
+            break
+        del _cache[old_key]
+    _cache.pop(key, None)
+    _cache[key] = (now, estimate)
+    return estimate
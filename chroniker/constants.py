@@ -38,6 +38,21 @@ Please review this monitor at {{ url }}
 {{ stderr }}
 '''
 
+COUNT_EXACT = 'exact'
+COUNT_EXISTS = 'exists'
+COUNT_CAPPED = 'capped'
+COUNT_ESTIMATED = 'estimated'
+
+COUNT_STRATEGY_CHOICES = (
+    (COUNT_EXACT, _('Exact count')),
+    (COUNT_EXISTS, _('Exists only')),
+    (COUNT_CAPPED, _('Capped count')),
+    (COUNT_ESTIMATED, _('Estimated count')),
+)
+
+PLACEMENT_HASH = 'hash'
+PLACEMENT_LEAST_LOADED = 'least_loaded'
+
 WALL_CLOCK_TIME = 'wall-clock-time'
 
 CPU_TIME = 'cpu-time'
@@ -0,0 +1,127 @@
+"""
+Splits scheduling into one planner and many executors, when
+``CHRONIKER_DISPATCH_QUEUE`` is enabled.
+
+The ``cron`` run holding the planner lease finds the due jobs with met
+dependencies for every host at once, and queues them as ``DispatchEntry``
+rows, each targeted at the host that must run it, if any. Every ``cron`` run,
+the planner's included, then claims the queued jobs it may run, each with a
+conditional update so only one executor gets it, and runs them as usual.
+
+A claimed job stays queued, so it isn't planned again, until its executor
+marks it running and removes it. If the executor dies before then, the next
+plan after ``CHRONIKER_DISPATCH_CLAIM_TIMEOUT_SECONDS`` removes the claim and
+queues the job again.
+"""
+import socket
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from chroniker import constants as c
+from chroniker.models import DispatchEntry, Job, SchedulerLease, WorkerHost
+from chroniker.placement import place_jobs
+from chroniker.sharding import get_hash_ring
+
+from . import settings as _settings
+
+PLANNER_LEASE = 'planner'
+
+
+def acquire_planner_lease(holder=None):
+    """
+    Takes or renews the planner lease, returning true if this host is the planner.
+    """
+    return SchedulerLease.acquire(PLANNER_LEASE, _settings.CHRONIKER_PLANNER_LEASE_SECONDS, holder=holder)
+
+
+def get_target_hostnames(jobs):
+    """
+    Returns a dict of {job id: hostname} of the host each job must run on,
+    or '' if any host may run it.
+
+    Jobs in a host group with no live host to run them are left out.
+    """
+    jobs = list(jobs)
+    targets = {}
+    grouped = {} # {group:[job]}
+    for job in jobs:
+        if job.hostname:
+            targets[job.id] = job.hostname
+        elif job.host_group:
+            grouped.setdefault(job.host_group, []).append(job)
+        else:
+            targets[job.id] = ''
+    for group, group_jobs in grouped.items():
+        if _settings.CHRONIKER_HOST_PLACEMENT == c.PLACEMENT_LEAST_LOADED:
+            targets.update(place_jobs(group_jobs, WorkerHost.get_live(group)))
+        else:
+            ring = get_hash_ring(group)
+            for job in group_jobs:
+                hostname = ring.get_host(job.ring_position)
+                if hostname:
+                    targets[job.id] = hostname
+    return targets
+
+
+def plan(jobs=None, now=None):
+    """
+    Queues the due jobs with met dependencies on every host that aren't
+    already queued, and requeues those claimed by executors that never
+    removed them.
+
+    Returns the number of jobs queued.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=_settings.CHRONIKER_DISPATCH_CLAIM_TIMEOUT_SECONDS)
+    DispatchEntry.objects.exclude(claimed_by='').filter(claimed_datetime__lt=cutoff).delete()
+    queued_ids = set(DispatchEntry.objects.values_list('job_id', flat=True))
+    due = [job for job in Job.objects.due_with_met_dependencies(jobs=jobs, any_host=True) if job.id not in queued_ids]
+    targets = get_target_hostnames(due)
+    entries = [DispatchEntry(job=job, target_hostname=targets[job.id], queued_datetime=now) for job in due if job.id in targets]
+    # A job queued by another planner since is skipped by its unique constraint.
+    DispatchEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def claim(limit=0, jobs=None, hostname=None, now=None):
+    """
+    Claims the oldest queued jobs this host may run, up to limit if given.
+    Each stays queued until its executor marks it running with ``unqueue()``.
+
+    Returns the claimed jobs, in dependency order.
+    """
+    hostname = hostname or socket.gethostname()
+    now = now or timezone.now()
+    q = DispatchEntry.objects.filter(claimed_by='').filter(Q(target_hostname='') | Q(target_hostname=hostname))
+    if jobs:
+        q = q.filter(job_id__in=jobs)
+    entry_ids = q.order_by('id').values_list('id', flat=True)
+    if limit:
+        entry_ids = entry_ids[:limit]
+    claimed_ids = [
+        entry_id for entry_id in list(entry_ids)
+        # Only one executor can claim each entry, even if several read it above.
+        if DispatchEntry.objects.filter(id=entry_id, claimed_by='').update(claimed_by=hostname, claimed_datetime=now)
+    ]
+    if not claimed_ids:
+        return []
+    job_ids = list(DispatchEntry.objects.filter(id__in=claimed_ids).values_list('job_id', flat=True))
+    # Ordering also adds the jobs' dependees, which weren't claimed.
+    return [job for job in Job.objects.ordered_by_dependencies(Job.objects.filter(id__in=job_ids)) if job.id in job_ids]
+
+
+def unqueue(*job_ids):
+    """
+    Removes claimed jobs from the queue, once their executor has marked them running.
+    """
+    DispatchEntry.objects.filter(job_id__in=job_ids).delete()
+
+
+def release(job_id, hostname=None):
+    """
+    Returns a job this host claimed but didn't start to the queue, so it can be claimed again.
+    """
+    hostname = hostname or socket.gethostname()
+    DispatchEntry.objects.filter(job_id=job_id, claimed_by=hostname).update(claimed_by='', claimed_datetime=None)
@@ -0,0 +1,282 @@
+"""
+Runs raw command jobs as direct children of the scheduler process.
+
+Each ``JobProcess`` forks a copy of the scheduler, which then runs the job's
+command as yet another process. For raw commands, the ``AsyncCommandExecutor``
+instead starts each command with asyncio and waits on all of them from one
+event loop, so many I/O-bound scripts only cost the scheduler process plus the
+scripts themselves.
+
+The loop only handles the commands' processes, output and timeouts. It's
+advanced by the scheduler's wait loop, which does all database work itself,
+since the ORM can't be used from inside a running event loop.
+"""
+import asyncio
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import time
+
+import psutil
+
+from django.utils import timezone
+
+from chroniker import utils
+from chroniker.models import Job, JobRuntime, Log
+
+from . import settings as _settings
+
+# The number of seconds between heartbeats, matching ``JobHeartbeatThread``.
+HEARTBEAT_SECONDS = 5
+
+# The number of bytes read from a command's output at a time.
+READ_SIZE = 2**16
+
+
+class CommandRun:
+    """
+    The state of one job's raw command in an ``AsyncCommandExecutor``.
+
+    Has the same ``job``, ``is_alive()`` and ``is_expired`` interface as
+    ``JobProcess``, so the scheduler can track both together.
+    """
+
+    # Timeouts are enforced by the executor's loop.
+    is_expired = False
+
+    def __init__(self, job, scheduled_datetime=None, claimed_datetime=None):
+        self.job = job
+        self.scheduled_datetime = scheduled_datetime
+        self.claimed_datetime = claimed_datetime
+        self.run_start_datetime = timezone.now()
+        self.command_start_datetime = None
+        self.process = None
+        # Tracks the command's process tree once it has started.
+        self.sampler = None
+        self.returncode = None
+        self.stdout = []
+        self.stderr = []
+        self.task = None
+        self.timer = None
+        # Set if the command was killed, and why.
+        self.killed_reason = None
+        self.kill_start = None
+        self.kill_info = {}
+        # Set once the run has been recorded.
+        self.log = None
+
+    def __str__(self):
+        return 'CommandRun(%s, pid=%s)' % (self.job, self.process.pid if self.process else None)
+
+    def is_alive(self):
+        return self.log is None
+
+    @property
+    def success(self):
+        return self.returncode == 0 and not self.killed_reason
+
+
+class AsyncCommandExecutor:
+    """
+    Starts jobs' raw commands with ``asyncio.create_subprocess_exec``, streams
+    their output, and kills any running past the job's timeout_seconds.
+
+    Call ``poll()`` periodically to advance the commands, heartbeat all running
+    jobs and record the runs that have finished.
+    """
+
+    def __init__(self, grace_seconds=None):
+        if grace_seconds is None:
+            grace_seconds = _settings.CHRONIKER_KILL_GRACE_SECONDS
+        self.grace_seconds = grace_seconds
+        self.loop = asyncio.new_event_loop()
+        self.runs = [] # [CommandRun]
+        self.last_heartbeat = time.time()
+
+    def start(self, job, scheduled_datetime=None, claimed_datetime=None):
+        """
+        Marks the job as running and starts its command, returning its ``CommandRun``.
+        """
+        run = CommandRun(job, scheduled_datetime=scheduled_datetime, claimed_datetime=claimed_datetime)
+        job.mark_running()
+        run.task = self.loop.create_task(self._run(run))
+        self.runs.append(run)
+        # Let the command start without waiting for the next poll.
+        self.loop.run_until_complete(asyncio.sleep(0))
+        return run
+
+    async def _run(self, run):
+        run.command_start_datetime = timezone.now()
+        args = shlex.split(run.job.raw_command)
+        try:
+            run.process = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                # Lead a new process group, so a timeout kills any children too.
+                start_new_session=True,
+            )
+        except OSError as e:
+            run.stderr.append(('%s\n' % e).encode('utf-8'))
+            return
+        try:
+            run.sampler = utils.ProcessTreeSampler(run.process.pid, track_usage=True)
+        except psutil.Error:
+            # The command has already exited.
+            pass
+        if run.job.timeout_seconds:
+            run.timer = self.loop.call_later(run.job.timeout_seconds, self.kill, run, 'Job exceeded timeout')
+        await asyncio.gather(self._stream(run.process.stdout, run.stdout), self._stream(run.process.stderr, run.stderr))
+        # Take a last sample in case the command hasn't been reaped yet, since
+        # its CPU times are gone once it has been. The time used after the last
+        # sample by processes that have exited isn't counted.
+        self.sample(run)
+        run.returncode = await run.process.wait()
+        if run.timer:
+            run.timer.cancel()
+        if run.kill_start is not None:
+            run.kill_info['kill_seconds'] = time.time() - run.kill_start
+        elif run.returncode:
+            # Match the error recorded when a job's command raises an exception.
+            run.stderr.append(('%s\n' % subprocess.CalledProcessError(run.returncode, args)).encode('utf-8'))
+
+    async def _stream(self, reader, chunks):
+        while True:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                break
+            chunks.append(data)
+
+    def kill(self, run, reason):
+        """
+        Signals the command's process group, and kills it after the grace period
+        if it hasn't exited.
+        """
+        if run.process is None or run.returncode is not None or run.killed_reason:
+            return
+        run.killed_reason = reason
+        run.kill_start = time.time()
+        processes_reaped = 1
+        if run.sampler:
+            # Count the command's tree as last sampled, rather than scanning the
+            # whole process table for its group.
+            processes_reaped += len(run.sampler.sample(discover=True).descendants())
+        run.kill_info.update(
+            processes_reaped=processes_reaped,
+            kill_escalated=False,
+        )
+        self._signal(run, signal.SIGTERM)
+        run.timer = self.loop.call_later(self.grace_seconds, self._escalate, run)
+
+    def _escalate(self, run):
+        if run.returncode is None:
+            run.kill_info['kill_escalated'] = True
+            self._signal(run, signal.SIGKILL)
+
+    def _signal(self, run, sig):
+        try:
+            os.killpg(run.process.pid, sig)
+        except OSError:
+            # The group has already exited.
+            pass
+
+    def sample(self, run):
+        """
+        Samples the resources used by the run's command and its descendants.
+        """
+        if run.sampler and run.returncode is None:
+            run.sampler.sample()
+
+    def heartbeat(self):
+        """
+        Updates the heartbeat of every running job at once, and kills those
+        that have been told to stop.
+        """
+        job_ids = [run.job.id for run in self.runs if not run.task.done()]
+        if not job_ids:
+            return
+        stop_ids = set(Job.objects.filter(id__in=job_ids, force_stop=True).values_list('id', flat=True))
+        JobRuntime.set_state(job_ids, last_heartbeat=timezone.now())
+        if stop_ids:
+            Job.objects.filter(id__in=stop_ids).update(force_stop=False)
+        for run in self.runs:
+            if run.job.id in stop_ids:
+                self.kill(run, 'Job was stopped')
+
+    def poll(self, seconds=0):
+        """
+        Advances the loop for the given number of seconds, samples the
+        resources used by running commands, heartbeats running jobs when due,
+        and records finished runs.
+
+        Returns the runs that finished since the last poll.
+        """
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+        for run in self.runs:
+            if not run.task.done():
+                self.sample(run)
+        if time.time() - self.last_heartbeat >= HEARTBEAT_SECONDS:
+            self.heartbeat()
+            self.last_heartbeat = time.time()
+        finished = [run for run in self.runs if run.task.done()]
+        for run in finished:
+            self.runs.remove(run)
+            self.finish(run)
+        return finished
+
+    def finish(self, run):
+        """
+        Records a finished run the same way ``Job.handle_run`` does.
+        """
+        job = Job.objects.get(id=run.job.id)
+        stdout = b''.join(run.stdout).decode('utf-8', 'replace')
+        stderr = b''.join(run.stderr).decode('utf-8', 'replace')
+        if run.killed_reason:
+            stderr += '%s\n' % run.killed_reason
+        run_end_datetime = timezone.now()
+        Job.objects.filter(id=job.id).update(
+            is_running=False,
+            lock_file='',
+            # The scheduler's PID was recorded, and it may outlive the run, so
+            # don't leave it to be mistaken for a stalled process.
+            current_pid=None,
+            last_run=run.run_start_datetime,
+            force_run=False,
+            force_stop=False,
+            next_run=job.next_run if run.killed_reason else job.get_next_run_after_run(),
+            last_run_successful=run.success,
+        )
+        JobRuntime.set_state([job.id], total_parts_complete=0)
+        log = Log.objects.create(
+            job=job,
+            run_start_datetime=run.run_start_datetime,
+            run_end_datetime=run_end_datetime,
+            duration_seconds=(run_end_datetime - run.run_start_datetime).total_seconds(),
+            hostname=socket.gethostname(),
+            stdout=stdout if job.log_stdout else '',
+            stderr=stderr if job.log_stderr else '',
+            success=run.success,
+            on_time=not run.killed_reason,
+            scheduled_datetime=run.scheduled_datetime,
+            claimed_datetime=run.claimed_datetime,
+            process_start_datetime=run.run_start_datetime,
+            command_start_datetime=run.command_start_datetime,
+            **(run.sampler.usage() if run.sampler else {}),
+            **run.kill_info
+        )
+        job.notify_subscribers(log, stdout=log.stdout, stderr=log.stderr)
+        job.trim_logs()
+        run.log = log
+        return log
+
+    def close(self):
+        """
+        Kills any commands still running, records them, and closes the loop.
+        """
+        for run in list(self.runs):
+            self.kill(run, 'Scheduler exited')
+        while self.runs:
+            self.poll(0.1)
+        self.loop.close()
@@ -0,0 +1,182 @@
+"""
+An in-memory graph of the scheduling dependencies between jobs.
+
+The edge set is loaded in a single query, or, when only the jobs downstream of
+some roots are needed, with a single recursive query on backends that support
+it. Traversals, cycle detection and ordering are then done in memory.
+"""
+import time
+from collections import defaultdict, namedtuple
+
+from django.apps import apps
+from django.db import connection
+from toposort import toposort_flatten
+
+from . import settings as _settings
+
+Edge = namedtuple('Edge', ['dependent_id', 'dependee_id', 'wait_for_completion', 'wait_for_success', 'wait_for_next_run'])
+
+_cache = {} # {'graph':DependencyGraph, 'loaded':timestamp}
+
+
+def supports_recursive_queries():
+    """
+    Returns true if the default database supports ``WITH RECURSIVE``.
+    """
+    if connection.vendor in ('postgresql', 'sqlite'):
+        return True
+    if connection.vendor == 'mysql':
+        if connection.mysql_is_mariadb:
+            return connection.mysql_version >= (10, 2)
+        return connection.mysql_version >= (8,)
+    return False
+
+
+class DependencyGraph:
+    """
+    The dependencies between jobs, where each edge points from a dependee to
+    the dependent waiting on it.
+    """
+
+    def __init__(self, edges=()):
+        self.edges = list(edges)
+        self._dependees = defaultdict(dict) # {dependent_id:{dependee_id:edge}}
+        self._dependents = defaultdict(dict) # {dependee_id:{dependent_id:edge}}
+        for edge in self.edges:
+            self._dependees[edge.dependent_id][edge.dependee_id] = edge
+            self._dependents[edge.dependee_id][edge.dependent_id] = edge
+
+    @classmethod
+    def load(cls, root_ids=None):
+        """
+        Loads the graph in one query.
+
+        If root ids are given, and the backend supports it, only the edges
+        downstream of those jobs are loaded.
+        """
+        JobDependency = apps.get_model('chroniker', 'JobDependency')
+        fields = Edge._fields
+        if root_ids is None or not supports_recursive_queries():
+            return cls(Edge(*row) for row in JobDependency.objects.order_by().values_list(*fields))
+        root_ids = [int(_) for _ in root_ids]
+        if not root_ids:
+            return cls()
+        table = connection.ops.quote_name(JobDependency._meta.db_table)
+        sql = '''
+            WITH RECURSIVE chain(job_id) AS (
+                SELECT id FROM {job_table} WHERE id IN ({roots})
+                UNION
+                SELECT d.dependent_id FROM {table} d INNER JOIN chain ON d.dependee_id = chain.job_id
+            )
+            SELECT {columns} FROM {table} d WHERE d.dependee_id IN (SELECT job_id FROM chain)
+        '''.format(
+            job_table=connection.ops.quote_name(apps.get_model('chroniker', 'Job')._meta.db_table),
+            roots=', '.join(['%s'] * len(root_ids)),
+            table=table,
+            columns=', '.join('d.%s' % _ for _ in fields),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, root_ids)
+            return cls(Edge(*row[:2], *map(bool, row[2:])) for row in cursor.fetchall())
+
+    def dependees(self, job_id):
+        """
+        Returns the ids of the jobs the given job directly waits on.
+        """
+        return set(self._dependees.get(job_id, ()))
+
+    def dependents(self, job_id):
+        """
+        Returns the ids of the jobs directly waiting on the given job.
+        """
+        return set(self._dependents.get(job_id, ()))
+
+    def _walk(self, job_id, neighbours, wait_for_completion=None, include=None):
+        seen = {job_id}
+        pending = [job_id]
+        found = set()
+        while pending:
+            for other_id, edge in neighbours.get(pending.pop(), {}).items():
+                if other_id in seen:
+                    continue
+                if wait_for_completion is not None and edge.wait_for_completion != wait_for_completion:
+                    continue
+                if include is not None and other_id not in include:
+                    continue
+                seen.add(other_id)
+                found.add(other_id)
+                pending.append(other_id)
+        return found
+
+    def descendants(self, job_id, wait_for_completion=None, include=None):
+        """
+        Returns the ids of all jobs transitively waiting on the given job.
+
+        Only edges with a matching wait_for_completion flag, and only jobs in
+        include, are followed, if given.
+        """
+        return self._walk(job_id, self._dependents, wait_for_completion=wait_for_completion, include=include)
+
+    def ancestors(self, job_id, wait_for_completion=None, include=None):
+        """
+        Returns the ids of all jobs the given job transitively waits on.
+        """
+        return self._walk(job_id, self._dependees, wait_for_completion=wait_for_completion, include=include)
+
+    def find_cycle(self):
+        """
+        Returns a list of job ids forming a dependency cycle, with the first id
+        repeated at the end, or None if the graph is acyclic.
+        """
+        visiting = 1
+        done = 2
+        state = {}
+        for start in list(self._dependents):
+            if state.get(start):
+                continue
+            path = [start]
+            stack = [iter(self._dependents.get(start, ()))]
+            state[start] = visiting
+            while stack:
+                for other_id in stack[-1]:
+                    if state.get(other_id) == visiting:
+                        return path[path.index(other_id):] + [other_id]
+                    if not state.get(other_id):
+                        state[other_id] = visiting
+                        path.append(other_id)
+                        stack.append(iter(self._dependents.get(other_id, ())))
+                        break
+                else:
+                    state[path.pop()] = done
+                    stack.pop()
+        return None
+
+    def topological_order(self, job_ids):
+        """
+        Returns the given job ids, and their direct dependees, ordered so every
+        job comes after the jobs it waits on.
+
+        Raises ``toposort.CircularDependencyError`` if the jobs form a cycle.
+        """
+        return toposort_flatten({job_id: self.dependees(job_id) for job_id in job_ids})
+
+
+def get_dependency_graph():
+    """
+    Returns the cached graph of all job dependencies, reloading it if it has
+    been invalidated or is older than CHRONIKER_DEPENDENCY_GRAPH_CACHE_SECONDS.
+    """
+    graph = _cache.get('graph')
+    if graph is None or time.time() - _cache['loaded'] >= _settings.CHRONIKER_DEPENDENCY_GRAPH_CACHE_SECONDS:
+        graph = DependencyGraph.load()
+        _cache.update(graph=graph, loaded=time.time())
+    return graph
+
+
+def invalidate_dependency_graph(*args, **kwargs):
+    """
+    Discards the cached graph, so the next use reloads it.
+
+    Connected to ``JobDependency``'s save and delete signals.
+    """
+    _cache.pop('graph', None)
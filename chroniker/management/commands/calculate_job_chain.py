@@ -1,10 +1,11 @@
-import sys
+import json
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from chroniker.models import Job, JobDependency
-
-from criticalpath import Node
+from chroniker import utils
+from chroniker.chains import estimate_chain
+from chroniker.graph import DependencyGraph
+from chroniker.models import Job
 
 
 class Command(BaseCommand):
@@ -12,49 +13,36 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('root_job_id')
-        parser.add_argument('--samples', default=20, help='The number of log samples to use when estimating mean job run time.')
+        parser.add_argument('--samples', type=int, default=None, help='The number of log samples to use when estimating job run time.')
+        parser.add_argument('--quantile', type=float, default=None, help='The percentile of recent run times to use as each job\'s estimate.')
+        parser.add_argument('--live', action='store_true', default=False, help='If given, estimates when the currently running chain will finish.')
+        parser.add_argument('--json', action='store_true', default=False, help='If given, outputs the estimate as JSON.')
 
     def handle(self, root_job_id, **options):
         root_job = Job.objects.get(id=int(root_job_id))
-        samples = int(options['samples'])
-
-        # Add all system task nodes.
-        system = Node('system')
-        system.add(Node(root_job.id, duration=root_job.get_run_length_estimate(samples=samples)))
-        print('%s takes about %s seconds' \
-            % (root_job, root_job.get_run_length_estimate(samples=samples)))
-        chain = root_job.get_chained_jobs()
-        for job in chain:
-            print('%s takes about %s seconds' \
-                % (job, job.get_run_length_estimate(samples=samples)))
-            node = Node(job.id, duration=job.get_run_length_estimate(samples=samples))
-            node.description = job.name
-            system.add(node)
-
-        # Add all links between task nodes.
-        print('-' * 80)
-        for job in chain:
-            if not job.enabled:
-                continue
-            dependees = JobDependency.objects.filter(dependent=job, dependee__enabled=True)
-            dependees = dependees.values_list('dependee_id', flat=True)
-            print(job, dependees)
-            for dependee in dependees:
-                # Link dependent job to dependee.
-                assert job.id != 1
-                system.link(from_node=dependee, to_node=job.id)
-
-        root_node = system.lookup_node(1)
-        print('root_node:', root_node, root_node.to_nodes, root_node.incoming_nodes)
-        system.add_exit()
-        sys.stdout.flush()
-
-        #return
-        print('Updating values...')
-        system.update_all()
-
-        critical_path = system.get_critical_path()
-        print('critical_path:', critical_path)
-        system.print_times()
-
-        print('min hours:', system.duration * (1 / 60.) * (1 / 60.))
+
+        cycle = DependencyGraph.load(root_ids=[root_job.id]).find_cycle()
+        if cycle:
+            raise CommandError('Jobs have a circular dependency: %s' % ' -> '.join(map(str, cycle)))
+
+        estimate = estimate_chain(root_job, quantile=options['quantile'], samples=options['samples'], live=options['live'])
+        if options['json']:
+            self.stdout.write(json.dumps(estimate.as_dict(), indent=4))
+            return
+
+        rows = [(
+            chain_job.job.id,
+            chain_job.job.name,
+            chain_job.state,
+            '-' if chain_job.duration_seconds is None else '%.0f' % chain_job.duration_seconds,
+            '%.0f' % chain_job.start_seconds,
+            '%.0f' % chain_job.finish_seconds,
+            '%.0f' % chain_job.slack_seconds,
+            '*' if chain_job.critical else '',
+        ) for chain_job in estimate.jobs]
+        for line in utils.format_table(['id', 'name', 'state', 'duration', 'start', 'finish', 'slack', 'critical'], rows):
+            self.stdout.write(line)
+        self.stdout.write('critical path: %s' % ' -> '.join(map(str, estimate.critical_path)))
+        self.stdout.write('total seconds: %.0f' % estimate.duration_seconds)
+        if estimate.live:
+            self.stdout.write('estimated completion: %s' % estimate.estimated_completion_datetime)
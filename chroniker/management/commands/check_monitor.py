@@ -1,8 +1,11 @@
 import sys
+import time
 
 from django.core.management.base import BaseCommand
 
-from chroniker.models import get_current_job
+from chroniker import constants as c
+from chroniker.models import MonitorRecord, get_current_job
+from chroniker.monitors import count_records, evaluate_monitor, format_records, get_count_strategy, get_history_depth, parse_imports, should_alert
 
 
 class Command(BaseCommand):
@@ -20,29 +23,31 @@ class Command(BaseCommand):
         verbose = options['verbose']
         assert imports, 'No imports specified.'
         assert query, 'No query specified.'
-        for imp in imports.strip().split('|'):
-            imp_parts = tuple(imp.split(','))
-            if len(imp_parts) == 1:
-                cmd = ('import %s' % imp_parts)
-            elif len(imp_parts) == 2:
-                cmd = ('from %s import %s' % imp_parts)
-            elif len(imp_parts) == 3:
-                cmd = ('from %s import %s as %s' % imp_parts)
-            else:
-                raise Exception('Invalid import: %s' % (imp,))
-            if verbose:
-                print(cmd)
-            exec(cmd) # pylint: disable=exec-used
         if verbose:
+            for statement in parse_imports(imports):
+                print(statement)
             print(query)
-        q = eval(query, globals(), locals()) # pylint: disable=W0123
+        q = evaluate_monitor(imports, query)
 
         job = get_current_job()
+        strategy, cap = c.COUNT_EXACT, None
         if job:
-            job.monitor_records = q.count()
+            strategy, cap = get_count_strategy(job)
+        t0 = time.time()
+        records, strategy = count_records(q, strategy=strategy, cap=cap)
+        duration_seconds = time.time() - t0
+
+        alert = bool(records)
+        if job:
+            depth = get_history_depth([job])
+            previous = MonitorRecord.get_recent([job.id], depth).get(job.id, []) if depth else []
+            alert = should_alert(job, records, previous)
+            MonitorRecord.objects.create(job=job, records=records, duration_seconds=duration_seconds)
+            job.monitor_records = records
+            job.monitor_records_strategy = strategy
             job.save()
 
-        if q.count():
-            print('%i records require attention.' % (q.count(),), file=sys.stderr)
+        if alert:
+            print(format_records(records, strategy=strategy, cap=cap), file=sys.stderr)
         else:
-            print('%i records require attention.' % (q.count(),), file=sys.stdout)
+            print(format_records(records, strategy=strategy, cap=cap), file=sys.stdout)
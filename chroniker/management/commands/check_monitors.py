@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from chroniker import settings as _settings
+from chroniker.models import Job
+from chroniker.monitors import run_monitors
+
+
+class Command(BaseCommand):
+    help = 'Evaluates all due monitors in one process.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=_settings.CHRONIKER_MONITOR_WORKERS, help='The number of threads evaluating monitors.')
+        parser.add_argument('--cap', type=int, default=_settings.CHRONIKER_MONITOR_COUNT_CAP, help='If non-zero, stops counting records past this many.')
+        parser.add_argument(
+            '--timeout_seconds',
+            type=float,
+            default=_settings.CHRONIKER_MONITOR_TIMEOUT_SECONDS,
+            help='The maximum number of seconds each monitor\'s query may run.'
+        )
+        parser.add_argument('--force_run', action='store_true', default=False, help='If given, evaluates all enabled monitors, due or not.')
+
+    def handle(self, *args, **options):
+        if options['force_run']:
+            q = Job.objects.filter(enabled=True, is_running=False)
+        else:
+            q = Job.objects.due()
+        q = q.filter(command='check_monitor')
+        results = run_monitors(q, workers=options['workers'], cap=options['cap'], timeout_seconds=options['timeout_seconds'])
+        for result in results:
+            self.stdout.write('%s: %s' % (result.job, 'error' if result.error else result.records))
+        self.stdout.write('Evaluated %i monitors, %i failed.' % (len(results), len([_ for _ in results if not _.success])))
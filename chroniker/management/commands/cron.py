@@ -1,3 +1,5 @@
+import cProfile
+import json
 import logging
 import os
 import socket
@@ -10,83 +12,115 @@ from optparse import make_option
 
 import psutil
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import connection
 from django.utils import timezone
 
-from chroniker import settings as _settings, utils
-from chroniker.models import Job, Log
+from chroniker import dispatch, settings as _settings, utils
+from chroniker.executors import AsyncCommandExecutor
+from chroniker.graph import get_dependency_graph, invalidate_dependency_graph
+from chroniker.models import Job, Log, SchedulerTick, WorkerHost
+from chroniker.monitors import run_monitors
+from chroniker.sharding import invalidate_hash_rings
 
+logger = logging.getLogger('chroniker.cron')
 
-def kill_stalled_processes(dryrun=True):
+
+def reap_due(now=None):
+    """
+    Returns true if this host hasn't scanned for stalled processes within the
+    last CHRONIKER_REAP_INTERVAL_SECONDS.
+    """
+    now = now or time.time()
+    try:
+        last_reap = os.path.getmtime(_settings.CHRONIKER_REAP_STAMP_FN)
+    except OSError:
+        return True
+    return now - last_reap >= _settings.CHRONIKER_REAP_INTERVAL_SECONDS
+
+
+def kill_stalled_processes(dryrun=True, force=False):
     """
     Due to a bug in the Django|Postgres backend, occassionally
     the `manage.py cron` process will hang even through all processes
     have been marked completed.
     We compare all recorded PIDs against those still running,
     and kill any associated with complete jobs.
+
+    This costs one query and one pass over the process table, and is skipped
+    if this host has already done it within the reap interval, unless forced.
     """
-    pids = set(map(int, Job.objects\
-        .filter(is_running=False, current_pid__isnull=False)\
+    if not force and not reap_due():
+        return
+    if not dryrun:
+        with open(_settings.CHRONIKER_REAP_STAMP_FN, 'w'):
+            pass
+
+    jobs = {} # {pid:job}
+    job_rows = Job.objects\
+        .filter(is_running=False, current_pid__isnull=False, current_hostname=socket.gethostname())\
         .exclude(current_pid='')\
-        .values_list('current_pid', flat=True)))
-    for pid in pids:
+        .order_by()
+    for job in job_rows:
         try:
-            if utils.pid_exists(pid): # and not utils.get_cpu_usage(pid):
-                p = psutil.Process(pid)
-                cmd = ' '.join(p.cmdline())
-                if 'manage.py cron' in cmd:
-                    jobs = Job.objects.filter(current_pid=pid)
-                    job = None
-                    if jobs:
-                        job = jobs[0]
-                    utils.smart_print('Killing process %s associated with %s.' % (pid, job))
-                    if not dryrun:
-                        utils.kill_process(pid)
-                else:
-                    print('PID not cron.')
-            else:
-                print('PID dead.')
-        except psutil.NoSuchProcess:
-            print('PID does not exist.')
+            jobs[int(job.current_pid)] = job
+        except ValueError:
+            pass
+    # Never kill ourselves, such as when a previous run's PID was reused.
+    jobs.pop(os.getpid(), None)
+    if not jobs:
+        return
+
+    pids = []
+    for p in psutil.process_iter(['pid', 'cmdline']):
+        if p.info['pid'] not in jobs:
+            continue
+        cmd = ' '.join(p.info['cmdline'] or [])
+        if 'manage.py cron' not in cmd:
+            continue
+        job = jobs[p.info['pid']]
+        utils.smart_print('Killing process %s associated with %s.' % (p.info['pid'], job))
+        pids.append(p.info['pid'])
+    if pids and not dryrun:
+        # Signal them all before waiting, so one stuck process doesn't hold up the rest.
+        utils.kill_processes(pids)
 
 
 class JobProcess(utils.TimedProcess):
 
-    def __init__(self, job, *args, **kwargs):
+    def __init__(self, job, *args, scheduled_datetime=None, claimed_datetime=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.job = job
+        self.scheduled_datetime = scheduled_datetime
+        self.claimed_datetime = claimed_datetime
 
 
 def run_job(job, **kwargs):
 
+    process_start_datetime = timezone.now()
     update_heartbeat = kwargs.pop('update_heartbeat', None)
     stdout_queue = kwargs.pop('stdout_queue', None)
     stderr_queue = kwargs.pop('stderr_queue', None)
     force_run = kwargs.pop('force_run', False)
+    scheduled_datetime = kwargs.pop('scheduled_datetime', None)
+    claimed_datetime = kwargs.pop('claimed_datetime', None)
 
     # TODO:causes UnicodeEncodeError: 'ascii' codec can't encode
     # character u'\xa0' in position 59: ordinal not in range(128)
     #print(u"Running Job: %i - '%s' with args: %s" \
     #    % (job.id, job, job.args))
 
-    # TODO:Fix? Remove multiprocess and just running all jobs serially?
-    # Multiprocessing does not play well with Django's PostgreSQL
-    # connection, as it seems Django's connection code is not thread-safe.
-    # It's a hacky solution, but the short-term fix seems to be to close
-    # the connection in this thread, forcing Django to open a new
-    # connection unique to this thread.
-    # Without this call to connection.close(), we'll get the error
-    # "Lost connection to MySQL server during query".
-    print('Closing connection.')
-    connection.close()
-    print('Connection closed.')
+    # Note, connections inherited from the scheduler are dropped right after
+    # the fork by utils.ConnectionLifecycle, so this process opens its own.
     job.run(
         update_heartbeat=update_heartbeat,
         check_running=False,
         stdout_queue=stdout_queue,
         stderr_queue=stderr_queue,
         force_run=force_run,
+        scheduled_datetime=scheduled_datetime,
+        claimed_datetime=claimed_datetime,
+        process_start_datetime=process_start_datetime,
     )
     #TODO:mark job as not running if still marked?
     #TODO:normalize job termination and cleanup outside of handle_run()?
@@ -99,6 +133,14 @@ def run_cron(jobs=None, **kwargs):
     dryrun = kwargs.pop('dryrun', False)
     clear_pid = kwargs.pop('clear_pid', False)
     sync = kwargs.pop('sync', False)
+    dag = kwargs.pop('dag', _settings.CHRONIKER_DAG_EXECUTOR)
+    max_processes = kwargs.pop('max_processes', _settings.CHRONIKER_MAX_PROCESSES)
+    async_raw = kwargs.pop('async_raw', _settings.CHRONIKER_ASYNC_RAW_COMMANDS)
+    batch_monitors = kwargs.pop('batch_monitors', _settings.CHRONIKER_BATCH_MONITORS)
+    dispatch_queue = kwargs.pop('dispatch_queue', _settings.CHRONIKER_DISPATCH_QUEUE)
+    # Times each phase of the tick, and may already include phases run before it.
+    timer = kwargs.pop('timer', None) or utils.PhaseTimer()
+    executor = None
 
     try:
 
@@ -112,75 +154,90 @@ def run_cron(jobs=None, **kwargs):
         stdout_queue = Queue()
         stderr_queue = Queue()
 
+        # Reuse one connection for the whole tick, and make sure job
+        # processes don't share it after forking.
+        utils.connection_lifecycle.start_tick()
+        # Dependencies may have been edited by other processes since the last tick.
+        invalidate_dependency_graph()
+        # Keep this host in its group, and see which hosts have joined or left since the last tick.
+        WorkerHost.heartbeat(capacity=max_processes)
+        last_host_heartbeat = time.time()
+        invalidate_hash_rings()
+        tick_start_datetime = timezone.now()
+        tick = None
+
         if _settings.CHRONIKER_AUTO_END_STALE_JOBS and not dryrun:
-            Job.objects.end_all_stale()
+            with timer.phase('stale_cleanup'):
+                Job.objects.end_all_stale()
 
         # Check PID file to prevent conflicts with prior executions.
         # TODO: is this still necessary? deprecate? As long as jobs run by
         # JobProcess don't wait for other jobs, multiple instances of cron
         # should be able to run simeltaneously without issue.
-        if _settings.CHRONIKER_USE_PID:
-            pid_fn = _settings.CHRONIKER_PID_FN
-            pid = str(os.getpid())
-            any_running = Job.objects.all_running().count()
-            if not any_running:
-                # If no jobs are running, then even if the PID file exists,
-                # it must be stale, so ignore it.
-                pass
-            elif os.path.isfile(pid_fn):
-                try:
-                    old_pid = int(open(pid_fn).read())
-                    if utils.pid_exists(old_pid):
-                        print('%s already exists, exiting' % pid_fn)
-                        sys.exit()
-                    else:
-                        print(('%s already exists, but contains stale ' 'PID, continuing') % pid_fn)
-                except ValueError:
-                    pass
-                except TypeError:
+        with timer.phase('pid_check'):
+            if _settings.CHRONIKER_USE_PID:
+                pid_fn = _settings.CHRONIKER_PID_FN
+                pid = str(os.getpid())
+                any_running = Job.objects.all_running().count()
+                if not any_running:
+                    # If no jobs are running, then even if the PID file exists,
+                    # it must be stale, so ignore it.
                     pass
-            open(pid_fn, 'w').write(pid)
-            clear_pid = True
+                elif os.path.isfile(pid_fn):
+                    try:
+                        old_pid = int(open(pid_fn).read())
+                        if utils.pid_exists(old_pid):
+                            print('%s already exists, exiting' % pid_fn)
+                            sys.exit()
+                        else:
+                            print(('%s already exists, but contains stale ' 'PID, continuing') % pid_fn)
+                    except ValueError:
+                        pass
+                    except TypeError:
+                        pass
+                open(pid_fn, 'w').write(pid)
+                clear_pid = True
 
         procs = []
-        if force_run:
-            q = Job.objects.all()
-            if jobs:
-                q = q.filter(id__in=jobs)
-        else:
-            q = Job.objects.due_with_met_dependencies_ordered(jobs=jobs)
+        if async_raw and not sync and not dryrun and not getattr(settings, 'CHRONIKER_DISABLE_RAW_COMMAND', False):
+            executor = AsyncCommandExecutor()
+        with timer.phase('planning'):
+            if force_run:
+                q = Job.objects.all()
+                if jobs:
+                    q = q.filter(id__in=jobs)
+            elif dispatch_queue and not dryrun:
+                # Only the planner finds due jobs, and every run claims its share of them.
+                if dispatch.acquire_planner_lease():
+                    print('Queued %i jobs.' % dispatch.plan(jobs=jobs))
+                q = dispatch.claim(limit=max_processes, jobs=jobs)
+            else:
+                q = Job.objects.due_with_met_dependencies_ordered(jobs=jobs)
+            pending = list(q)
+            graph = get_dependency_graph()
+
+            # Monitors are evaluated together in this process instead of being launched.
+            monitors = []
+            if batch_monitors:
+                monitors = [job for job in pending if job.command == 'check_monitor']
+                pending = [job for job in pending if job.command != 'check_monitor']
 
         running_ids = set()
-        for job in q:
-
-            # This is necessary, otherwise we get the exception
-            # DatabaseError: SSL error: sslv3 alert bad record mac
-            # even through we're not using SSL...
-            # We work around this by forcing Django to use separate
-            # connections for each process by explicitly closing the
-            # current connection.
-            connection.close()
-
-            # Re-check dependencies to incorporate any previous iterations
-            # that marked jobs as running, potentially causing dependencies
-            # to become unmet.
-            Job.objects.update()
-            job = Job.objects.get(id=job.id)
-            if not force_run and not job.is_due_with_dependencies_met(running_ids=running_ids):
-                utils.smart_print('Job {} {} is due but has unmet dependencies.'\
-                    .format(job.id, job))
-                continue
-
-            # Immediately mark the job as running so the next jobs can
-            # update their dependency check.
-            utils.smart_print(f'Running job {job.id} {job}.')
-            running_ids.add(job.id)
-            if dryrun:
-                continue
-            job.is_running = True
-            Job.objects.filter(id=job.id).update(is_running=job.is_running)
-
-            # Launch job.
+        counts = dict(evaluated=0, skipped=0)
+
+        def launch(job):
+            """
+            Claims the job and runs it, returning its process if run asynchronously.
+            """
+            job.write_fields(is_running=True)
+            if dispatch_queue and not force_run:
+                # Now that it's running, the job can't be planned again.
+                dispatch.unqueue(job.id)
+
+            # Record when the run was scheduled and claimed, to measure dispatch lag.
+            scheduled_datetime = None if force_run or job.force_run else job.next_run
+            claimed_datetime = timezone.now()
+
             if sync:
                 # Run job synchronously.
                 run_job(
@@ -189,33 +246,120 @@ def run_cron(jobs=None, **kwargs):
                     stdout_queue=stdout_queue,
                     stderr_queue=stderr_queue,
                     force_run=force_run or job.force_run,
+                    scheduled_datetime=scheduled_datetime,
+                    claimed_datetime=claimed_datetime,
                 )
-            else:
-                # Run job asynchronously.
-                job_func = partial(
-                    run_job,
-                    job=job,
-                    force_run=force_run or job.force_run,
-                    update_heartbeat=update_heartbeat,
-                    name=str(job),
-                )
-                proc = JobProcess(
-                    job=job,
-                    max_seconds=job.timeout_seconds,
-                    target=job_func,
-                    name=str(job),
-                    kwargs=dict(
-                        stdout_queue=stdout_queue,
-                        stderr_queue=stderr_queue,
-                    )
+                return None
+
+            if executor and job.raw_command:
+                # Run the command directly from this process's event loop.
+                return executor.start(job, scheduled_datetime=scheduled_datetime, claimed_datetime=claimed_datetime)
+
+            # Run job asynchronously.
+            job_func = partial(
+                run_job,
+                job=job,
+                force_run=force_run or job.force_run,
+                update_heartbeat=update_heartbeat,
+                name=str(job),
+                scheduled_datetime=scheduled_datetime,
+                claimed_datetime=claimed_datetime,
+            )
+            proc = JobProcess(
+                job=job,
+                scheduled_datetime=scheduled_datetime,
+                claimed_datetime=claimed_datetime,
+                max_seconds=job.timeout_seconds,
+                target=job_func,
+                name=str(job),
+                kwargs=dict(
+                    stdout_queue=stdout_queue,
+                    stderr_queue=stderr_queue,
                 )
-                proc.start()
-                procs.append(proc)
+            )
+            proc.start()
+            return proc
+
+        def queue_dependents(job_id):
+            """
+            Queues the jobs waiting on a job that just finished, so they can start
+            in this tick instead of the next.
+            """
+            for dependent_id in sorted(graph.dependents(job_id)):
+                if dependent_id in running_ids or (jobs and dependent_id not in jobs):
+                    continue
+                if dependent_id not in [_.id for _ in pending]:
+                    pending.append(Job.objects.get(id=dependent_id))
+
+        def dispatch_pending():
+            """
+            Launches pending jobs whose dependencies are met, while the worker pool has room.
+            """
+            while pending and (not max_processes or len(procs) < max_processes):
+                job = pending.pop(0)
+                counts['evaluated'] += 1
+
+                # Re-check dependencies to incorporate any previous iterations
+                # that marked jobs as running, potentially causing dependencies
+                # to become unmet.
+                job = Job.objects.get(id=job.id)
+                if dag:
+                    # Finished jobs no longer block their dependents.
+                    blocking_ids = {_.job.id for _ in procs}
+                else:
+                    blocking_ids = running_ids
+                if not force_run and not job.is_due_with_dependencies_met(running_ids=blocking_ids, graph=graph):
+                    utils.smart_print('Job {} {} is due but has unmet dependencies.'\
+                        .format(job.id, job))
+                    counts['skipped'] += 1
+                    if dispatch_queue and not force_run:
+                        dispatch.release(job.id)
+                    continue
+
+                # Immediately mark the job as running so the next jobs can
+                # update their dependency check.
+                utils.smart_print(f'Running job {job.id} {job}.')
+                running_ids.add(job.id)
+                if dryrun:
+                    continue
+
+                # Launch job.
+                proc = launch(job)
+                if proc:
+                    procs.append(proc)
+                elif dag:
+                    queue_dependents(job.id)
+
+        with timer.phase('dispatch'):
+            dispatch_pending()
+
+        if monitors:
+            with timer.phase('monitors'):
+                counts['evaluated'] += len(monitors)
+                for job in monitors:
+                    utils.smart_print(f'Running monitor {job.id} {job}.')
+                    running_ids.add(job.id)
+                if not dryrun:
+                    run_monitors(monitors, dispatched=dispatch_queue and not force_run)
+                    if dag:
+                        for job in monitors:
+                            queue_dependents(job.id)
+                        dispatch_pending()
 
         if not dryrun:
+            tick = SchedulerTick.objects.create(
+                hostname=socket.gethostname(),
+                start_datetime=tick_start_datetime,
+                planning_seconds=timer.get_seconds('planning'),
+                jobs_dispatched=len(running_ids),
+                connection_opens=utils.connection_lifecycle.opens,
+            )
+            SchedulerTick.cleanup()
+
             print("%d Jobs are due." % len(procs))
 
-            # Wait for all job processes to complete.
+        # Wait for all job processes to complete.
+        with timer.phase('wait'):
             while procs:
 
                 while not stdout_queue.empty():
@@ -231,21 +375,26 @@ def run_cron(jobs=None, **kwargs):
                     if not proc.is_alive():
                         print('Process %s ended.' % (proc,))
                         procs.remove(proc)
+                        if dag:
+                            queue_dependents(proc.job.id)
                     elif proc.is_expired:
                         print('Process %s expired.' % (proc,))
                         proc_id = proc.pid
-                        proc.terminate()
+                        kill_info = proc.terminate()
                         run_end_datetime = timezone.now()
                         procs.remove(proc)
 
-                        connection.close()
-                        Job.objects.update()
                         j = Job.objects.get(id=proc.job.id)
                         run_start_datetime = j.last_run_start_timestamp
-                        proc.job.is_running = False
-                        proc.job.force_run = False
-                        proc.job.force_stop = False
-                        proc.job.save()
+                        # Write these explicitly, since the killed run or another
+                        # process may have changed them since this copy was loaded.
+                        proc.job.write_fields(
+                            is_running=False,
+                            force_run=False,
+                            force_stop=False,
+                            current_hostname=None,
+                            current_pid=None,
+                        )
 
                         # Create log record since the job was killed before it had
                         # a chance to do so.
@@ -258,12 +407,45 @@ def run_cron(jobs=None, **kwargs):
                             hostname=socket.gethostname(),
                             stdout=''.join(stdout_map[proc_id]),
                             stderr=''.join(stderr_map[proc_id] + ['Job exceeded timeout\n']),
+                            scheduled_datetime=proc.scheduled_datetime,
+                            claimed_datetime=proc.claimed_datetime,
+                            # The process tree's user CPU time as last sampled before termination.
+                            cpu_user_seconds=proc.last_cpu_user_seconds,
+                            **kill_info
                         )
 
-                time.sleep(1)
+                # Start any queued jobs that now have room or met dependencies.
+                dispatch_pending()
+
+                if executor:
+                    # Wait while advancing any commands, and record those that finish.
+                    executor.poll(1)
+                else:
+                    time.sleep(1)
+
+                if time.time() - last_host_heartbeat >= _settings.CHRONIKER_HOST_HEARTBEAT_SECONDS:
+                    WorkerHost.heartbeat(capacity=max_processes)
+                    last_host_heartbeat = time.time()
+
+        if not dryrun:
             print('!' * 80)
             print('All jobs complete!')
+
+        summary = dict(
+            jobs_evaluated=counts['evaluated'],
+            jobs_skipped=counts['skipped'],
+            jobs_dispatched=len(running_ids),
+            connection_opens=utils.connection_lifecycle.opens,
+            queries=timer.queries,
+            phases=timer.phases,
+        )
+        logger.info('Tick summary: %s', json.dumps(summary, sort_keys=True))
+        if tick:
+            SchedulerTick.objects.filter(id=tick.id).update(end_datetime=timezone.now(), **summary)
+        print('%i database connections opened.' % utils.connection_lifecycle.opens)
     finally:
+        if executor:
+            executor.close()
         if _settings.CHRONIKER_USE_PID and os.path.isfile(pid_fn) and clear_pid:
             os.unlink(pid_fn)
 
@@ -301,6 +483,30 @@ class Command(BaseCommand):
             action='store_true',
             default=False,
             help='If given, shows debugging info.'),
+        make_option('--dag',
+            action='store_true',
+            default=_settings.CHRONIKER_DAG_EXECUTOR,
+            help='If given, starts dependent jobs as soon as their dependencies finish.'),
+        make_option('--max_processes',
+            dest='max_processes',
+            default=_settings.CHRONIKER_MAX_PROCESSES,
+            help='The maximum number of jobs to run at once.'),
+        make_option('--async_raw',
+            action='store_true',
+            default=_settings.CHRONIKER_ASYNC_RAW_COMMANDS,
+            help='If given, runs raw command jobs from this process instead of forking a process for each.'),
+        make_option('--batch_monitors',
+            action='store_true',
+            default=_settings.CHRONIKER_BATCH_MONITORS,
+            help='If given, evaluates all due monitors together in this process.'),
+        make_option('--dispatch_queue',
+            action='store_true',
+            default=_settings.CHRONIKER_DISPATCH_QUEUE,
+            help='If given, runs queued jobs, and queues due jobs if this host is the planner.'),
+        make_option('--profile',
+            dest='profile',
+            default='',
+            help='If given, writes a cProfile stats file of the whole run to this path.'),
     )
 
     def add_arguments(self, parser):
@@ -315,21 +521,65 @@ class Command(BaseCommand):
         parser.add_argument('--name', dest='name', default='', help='A name to give this process.')
         parser.add_argument('--sync', action='store_true', default=False, help='If given, runs jobs one at a time.')
         parser.add_argument('--verbose', action='store_true', default=False, help='If given, shows debugging info.')
+        parser.add_argument('--dag',
+            action='store_true',
+            default=_settings.CHRONIKER_DAG_EXECUTOR,
+            help='If given, starts dependent jobs as soon as their dependencies finish.')
+        parser.add_argument('--max_processes',
+            dest='max_processes',
+            type=int,
+            default=_settings.CHRONIKER_MAX_PROCESSES,
+            help='The maximum number of jobs to run at once.')
+        parser.add_argument('--async_raw',
+            action='store_true',
+            default=_settings.CHRONIKER_ASYNC_RAW_COMMANDS,
+            help='If given, runs raw command jobs from this process instead of forking a process for each.')
+        parser.add_argument('--batch_monitors',
+            action='store_true',
+            default=_settings.CHRONIKER_BATCH_MONITORS,
+            help='If given, evaluates all due monitors together in this process.')
+        parser.add_argument('--dispatch_queue',
+            action='store_true',
+            default=_settings.CHRONIKER_DISPATCH_QUEUE,
+            help='If given, runs queued jobs, and queues due jobs if this host is the planner.')
+        parser.add_argument('--profile',
+            dest='profile',
+            default='',
+            help='If given, writes a cProfile stats file of the whole run to this path.')
 
     def handle(self, *args, **options):
         verbose = options['verbose']
         if verbose:
             logging.basicConfig(level=logging.DEBUG)
 
-        kill_stalled_processes(dryrun=False)
-
-        # Find specific job ids to run, if any.
-        jobs = [int(_.strip()) for _ in options.get('jobs', '').strip().split(',') if _.strip().isdigit()]
+        profiler = None
+        if options.get('profile'):
+            profiler = cProfile.Profile()
+            profiler.enable()
 
-        run_cron(
-            jobs,
-            update_heartbeat=int(options['update_heartbeat']),
-            force_run=options['force_run'],
-            dryrun=options['dryrun'],
-            sync=options['sync'],
-        )
+        try:
+            timer = utils.PhaseTimer()
+            with timer.phase('reap'):
+                kill_stalled_processes(dryrun=False)
+
+            # Find specific job ids to run, if any.
+            jobs = [int(_.strip()) for _ in options.get('jobs', '').strip().split(',') if _.strip().isdigit()]
+
+            run_cron(
+                jobs,
+                update_heartbeat=int(options['update_heartbeat']),
+                force_run=options['force_run'],
+                dryrun=options['dryrun'],
+                sync=options['sync'],
+                dag=options['dag'],
+                max_processes=int(options['max_processes'] or 0),
+                async_raw=options['async_raw'],
+                batch_monitors=options['batch_monitors'],
+                dispatch_queue=options['dispatch_queue'],
+                timer=timer,
+            )
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(options['profile'])
+                print('Wrote profile to %s.' % options['profile'])
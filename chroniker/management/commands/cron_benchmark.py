@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chroniker.benchmarks import benchmark_sampler, benchmark_scheduler
+
+
+def parse_frequency_mix(value):
+    """
+    Parses a frequency mix like "MINUTELY:1,HOURLY:3,DAILY:6".
+    """
+    if not value:
+        return None
+    try:
+        return {name.strip().upper(): float(weight) for name, weight in (_.split(':') for _ in value.split(','))}
+    except ValueError as exc:
+        raise CommandError('Invalid frequency mix: %s' % value) from exc
+
+
+class Command(BaseCommand):
+    help = 'Runs benchmarks of chroniker\'s hot paths and outputs the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['sampler', 'scheduler'], help='The benchmark to run.')
+        parser.add_argument('--jobs', type=int, default=None,
+            help='The number of concurrent jobs to simulate, or of jobs to generate. Defaults to 200 for sampler and 1000 for scheduler.')
+        parser.add_argument('--checks', type=int, default=10, help='The number of supervisor checks to time.')
+        parser.add_argument('--logs', type=int, default=10, help='The number of historical logs to generate per job.')
+        parser.add_argument('--dependency_density', type=float, default=0.1, help='The probability of each of a job\'s up to 3 dependencies.')
+        parser.add_argument('--frequencies', default='', help='The relative weights of job frequencies, e.g. "MINUTELY:1,HOURLY:3,DAILY:6".')
+        parser.add_argument('--repeat', type=int, default=3, help='The number of times to time each benchmark.')
+        parser.add_argument('--seed', type=int, default=0, help='The random seed used to generate jobs.')
+        parser.add_argument('--output', default='', help='If given, also writes the results to this file.')
+
+    def handle(self, *args, **options):
+        if options['suite'] == 'sampler':
+            results = benchmark_sampler(jobs=options['jobs'] or 200, checks=options['checks'])
+        else:
+            results = benchmark_scheduler(
+                jobs=options['jobs'] or 1000,
+                logs=options['logs'],
+                dependency_density=options['dependency_density'],
+                frequency_mix=parse_frequency_mix(options['frequencies']),
+                repeat=options['repeat'],
+                seed=options['seed'],
+            )
+        content = json.dumps(dict(suite=options['suite'], results=results), indent=4, sort_keys=True)
+        self.stdout.write(content)
+        if options['output']:
+            with open(options['output'], 'w') as fout:
+                fout.write(content)
@@ -3,11 +3,11 @@ from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from chroniker.models import Log
+from chroniker.models import Job, Log, MonitorRecord
 
 
 class Command(BaseCommand):
-    help = 'Deletes old job logs.'
+    help = 'Deletes old job logs and those beyond each job\'s maximum, and down-samples and deletes old monitor history.'
 
     def add_arguments(self, parser):
         parser.add_argument('unit', choices=['minutes', 'hours', 'days', 'weeks'])
@@ -19,3 +19,5 @@ class Command(BaseCommand):
         kwargs = {unit: amount}
         time_ago = timezone.now() - timedelta(**kwargs)
         Log.cleanup(time_ago)
+        Job.objects.trim_logs()
+        MonitorRecord.cleanup()
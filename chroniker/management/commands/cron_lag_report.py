@@ -0,0 +1,67 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chroniker import utils
+from chroniker.models import Log
+
+# (name, start field, end field)
+STAGES = (
+    # Time for the scheduler to notice and claim a due job.
+    ('claim', 'scheduled_datetime', 'claimed_datetime'),
+    # Time for the claimed job's process to start.
+    ('spawn', 'claimed_datetime', 'process_start_datetime'),
+    # Time from process start to the job's command being invoked.
+    ('startup', 'process_start_datetime', 'command_start_datetime'),
+    ('total', 'scheduled_datetime', 'command_start_datetime'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Shows percentiles of the lag between when jobs were scheduled and when they started, per job and per host.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='The size of the time window to report on, ending now.')
+        parser.add_argument('--by', choices=['job', 'host', 'both'], default='both', help='How to group the results.')
+        parser.add_argument('--percentiles', default='50,90,99', help='A comma-delimited list of percentiles to show.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        percentiles = [float(_) for _ in options['percentiles'].split(',') if _.strip()]
+        fields = sorted({_ for stage in STAGES for _ in stage[1:]})
+
+        # {(grouping, key): {stage: [seconds]}}
+        samples = defaultdict(lambda: defaultdict(list))
+        q = Log.objects.filter(run_start_datetime__gte=cutoff, claimed_datetime__isnull=False)
+        for row in q.values('job__name', 'hostname', *fields).order_by().iterator():
+            groups = []
+            if options['by'] in ('job', 'both'):
+                groups.append(('job', row['job__name']))
+            if options['by'] in ('host', 'both'):
+                groups.append(('host', row['hostname'] or ''))
+            for stage, start_field, end_field in STAGES:
+                if row[start_field] is None or row[end_field] is None:
+                    continue
+                seconds = (row[end_field] - row[start_field]).total_seconds()
+                for group in groups:
+                    samples[group][stage].append(seconds)
+
+        headers = ['group', 'name', 'stage', 'runs'] + ['p%g' % _ for _ in percentiles] + ['max']
+        rows = []
+        for (grouping, name), stages in sorted(samples.items()):
+            for stage, _, _ in STAGES:
+                values = stages.get(stage)
+                if not values:
+                    continue
+                rows.append(
+                    [grouping, name, stage, str(len(values))] + ['%.1f' % utils.percentile(values, pct) for pct in percentiles] +
+                    ['%.1f' % max(values)]
+                )
+
+        if not rows:
+            self.stdout.write('No dispatched runs in the last %g hours.' % options['hours'])
+            return
+        for line in utils.format_table(headers, rows):
+            self.stdout.write(line)
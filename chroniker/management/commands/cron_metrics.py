@@ -0,0 +1,29 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from chroniker.metrics import render_metrics
+
+
+class Command(BaseCommand):
+    help = 'Outputs scheduler and job metrics in the Prometheus text format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--textfile',
+            dest='textfile',
+            default='',
+            help='If given, atomically writes the metrics to this file, e.g. for the node_exporter textfile collector.'
+        )
+
+    def handle(self, *args, **options):
+        textfile = options['textfile']
+        content = render_metrics()
+        if not textfile:
+            self.stdout.write(content, ending='')
+            return
+        # Write to a temporary file first so the collector never reads a partial file.
+        tmp_fn = '%s.%i.tmp' % (textfile, os.getpid())
+        with open(tmp_fn, 'w') as fout:
+            fout.write(content)
+        os.replace(tmp_fn, textfile)
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, F, Max, Sum
+from django.utils import timezone
+
+from chroniker import utils
+from chroniker.models import Log
+
+ORDERINGS = {
+    'cpu': '-cpu_seconds',
+    'memory': '-peak_rss_bytes',
+    'io': '-io_bytes',
+}
+
+
+def format_bytes(value):
+    if value is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(value) < 1024:
+            return '%.1f%s' % (value, unit)
+        value /= 1024.
+    return '%.1fTB' % value
+
+
+class Command(BaseCommand):
+    help = 'Ranks the jobs that consumed the most CPU, memory or I/O on each host.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help='The size of the time window to report on, ending now.')
+        parser.add_argument('--order', choices=sorted(ORDERINGS), default='cpu', help='The resource to rank jobs by.')
+        parser.add_argument('--limit', type=int, default=10, help='The maximum number of jobs to show per host.')
+        parser.add_argument('--hostname', default='', help='If given, only reports on this host.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        q = Log.objects.filter(run_start_datetime__gte=cutoff, cpu_user_seconds__isnull=False)
+        if options['hostname']:
+            q = q.filter(hostname=options['hostname'])
+        q = q.order_by().values('hostname', 'job_id', 'job__name').annotate(
+            runs=Count('id'),
+            cpu_seconds=Sum(F('cpu_user_seconds') + F('cpu_system_seconds')),
+            avg_cpu_seconds=Avg(F('cpu_user_seconds') + F('cpu_system_seconds')),
+            peak_rss_bytes=Max('peak_rss_bytes'),
+            io_bytes=Sum(F('read_bytes') + F('write_bytes')),
+            max_child_processes=Max('max_child_processes'),
+        ).order_by('hostname', ORDERINGS[options['order']], 'job__name')
+
+        headers = ['host', 'job', 'runs', 'cpu_total_s', 'cpu_avg_s', 'peak_rss', 'io', 'max_children']
+        rows = []
+        counts = {}
+        for row in q:
+            hostname = row['hostname'] or ''
+            counts[hostname] = counts.get(hostname, 0) + 1
+            if counts[hostname] > options['limit']:
+                continue
+            rows.append([
+                hostname,
+                row['job__name'],
+                str(row['runs']),
+                '%.1f' % (row['cpu_seconds'] or 0),
+                '%.1f' % (row['avg_cpu_seconds'] or 0),
+                format_bytes(row['peak_rss_bytes']),
+                format_bytes(row['io_bytes']),
+                str(row['max_child_processes'] or 0),
+            ])
+
+        if not rows:
+            self.stdout.write('No runs with resource usage in the last %g hours.' % options['hours'])
+            return
+        for line in utils.format_table(headers, rows):
+            self.stdout.write(line)
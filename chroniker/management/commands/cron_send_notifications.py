@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from chroniker import settings as _settings
+from chroniker.notifications import send_notifications
+
+
+class Command(BaseCommand):
+    help = 'Sends the emails queued for job subscribers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=_settings.CHRONIKER_EMAIL_OUTBOX_BATCH_SIZE,
+            help='The maximum number of queued emails to load at a time.'
+        )
+        parser.add_argument(
+            '--digest_seconds',
+            type=int,
+            default=_settings.CHRONIKER_EMAIL_DIGEST_SECONDS,
+            help='If non-zero, sends error emails to each subscriber as one digest once the oldest is this many seconds old.'
+        )
+
+    def handle(self, *args, **options):
+        sent = send_notifications(batch_size=options['batch_size'], digest_seconds=options['digest_seconds'])
+        self.stdout.write('Sent %i emails.' % sent)
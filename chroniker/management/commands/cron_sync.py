@@ -0,0 +1,75 @@
+import json
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from chroniker.sync import export_jobs, sync_jobs
+
+
+def get_format(path, format_name=None):
+    if format_name:
+        return format_name
+    if path.endswith(('.yaml', '.yml')):
+        return 'yaml'
+    return 'json'
+
+
+def load_yaml():
+    try:
+        import yaml
+    except ImportError as e:
+        raise CommandError('PyYAML must be installed to read and write YAML specs.') from e
+    return yaml
+
+
+class Command(BaseCommand):
+    help = 'Syncs jobs with a JSON or YAML spec, applying only the differences, or exports jobs as a spec.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The spec file, or - for stdin or stdout.')
+        parser.add_argument('--export', action='store_true', default=False, help='If given, writes the current jobs to the spec instead of syncing from it.')
+        parser.add_argument('--format', choices=['json', 'yaml'], default=None, help='The spec format. Defaults to the file extension, or JSON.')
+        parser.add_argument('--delete', action='store_true', default=False, help='If given, deletes jobs not in the spec.')
+        parser.add_argument('--dryrun', action='store_true', default=False, help='If given, only displays the changes that would be made.')
+
+    def handle(self, path, **options):
+        format_name = get_format(path, options['format'])
+
+        if options['export']:
+            spec = export_jobs()
+            if format_name == 'yaml':
+                content = load_yaml().safe_dump(spec, sort_keys=False)
+            else:
+                content = json.dumps(spec, indent=4)
+            if path == '-':
+                self.stdout.write(content)
+            else:
+                with open(path, 'w') as fout:
+                    fout.write(content)
+            return
+
+        if path == '-':
+            content = sys.stdin.read()
+        else:
+            with open(path) as fin:
+                content = fin.read()
+        if format_name == 'yaml':
+            spec = load_yaml().safe_load(content)
+        else:
+            spec = json.loads(content)
+
+        try:
+            result = sync_jobs(spec or {}, delete=options['delete'], dryrun=options['dryrun'])
+        except (ValueError, ValidationError) as e:
+            raise CommandError(str(e)) from e
+
+        for key in result.created:
+            self.stdout.write('Created %s.' % (key,))
+        for key, fields in result.updated.items():
+            self.stdout.write('Updated %s: %s.' % (key, ', '.join(fields)))
+        for key in result.deleted:
+            self.stdout.write('Deleted %s.' % (key,))
+        if options['dryrun']:
+            self.stdout.write('Dry run, no changes saved.')
+        self.stdout.write(result.summary())
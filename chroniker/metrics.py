@@ -0,0 +1,126 @@
+"""
+Prometheus text-format metrics for the scheduler and job runs.
+
+Everything is computed from a fixed number of aggregate queries, regardless
+of how many jobs or logs exist, so the metrics can be scraped frequently.
+"""
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from chroniker.models import Job, Log, SchedulerTick
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricFamily:
+    """
+    A named metric and its samples, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, name, metric_type, help_text):
+        self.name = name
+        self.metric_type = metric_type
+        self.help_text = help_text
+        self.samples = [] # [(labels, value)]
+
+    def add(self, value, **labels):
+        if value is None:
+            return
+        self.samples.append((labels, float(value)))
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.help_text),
+            '# TYPE %s %s' % (self.name, self.metric_type),
+        ]
+        for labels, value in self.samples:
+            label_str = ','.join('%s="%s"' % (k, _escape(v)) for k, v in sorted(labels.items()))
+            if label_str:
+                lines.append('%s{%s} %r' % (self.name, label_str, value))
+            else:
+                lines.append('%s %r' % (self.name, value))
+        return '\n'.join(lines)
+
+
+def collect_metrics(now=None):
+    """
+    Returns a list of ``MetricFamily`` instances describing the current state
+    of the scheduler and its jobs.
+    """
+    now = now or timezone.now()
+
+    last_duration = MetricFamily('chroniker_job_last_duration_seconds', 'gauge', 'Duration of the most recent logged run.')
+    last_success = MetricFamily('chroniker_job_last_success', 'gauge', '1 if the most recent run succeeded, 0 otherwise.')
+    runs = MetricFamily('chroniker_job_runs_total', 'counter', 'Total number of logged runs.')
+    failures = MetricFamily('chroniker_job_failures_total', 'counter', 'Total number of logged unsuccessful runs.')
+    heartbeat_age = MetricFamily('chroniker_job_heartbeat_age_seconds', 'gauge', 'Seconds since a running job last reported its heartbeat.')
+    running = MetricFamily('chroniker_jobs_running', 'gauge', 'Number of jobs currently marked as running.')
+    due = MetricFamily('chroniker_jobs_due_not_started', 'gauge', 'Number of enabled jobs that are due but not running.')
+    dispatch_lag = MetricFamily('chroniker_dispatch_lag_seconds', 'gauge', 'Seconds the longest-waiting due job is past its scheduled time.')
+    planning = MetricFamily('chroniker_tick_planning_seconds', 'gauge', 'Seconds spent finding due jobs in the most recent tick.')
+    tick_dispatched = MetricFamily('chroniker_tick_jobs_dispatched', 'gauge', 'Number of jobs dispatched by the most recent tick.')
+    tick_age = MetricFamily('chroniker_tick_age_seconds', 'gauge', 'Seconds since the most recent tick started.')
+
+    # Per-job state, with the latest log's duration joined in.
+    latest_log = Log.objects.filter(job=OuterRef('pk')).order_by('-run_start_datetime')
+    job_rows = Job.objects.order_by().annotate(last_duration=Subquery(latest_log.values('duration_seconds')[:1])).values_list(
+        'id', 'name', 'is_running', 'last_run_successful', 'runtime__last_heartbeat', 'run_count', 'failure_count', 'last_duration'
+    )
+    for job_id, name, is_running, last_run_successful, last_heartbeat, run_count, failure_count, duration in job_rows:
+        labels = dict(job_id=job_id, job_name=name)
+        last_duration.add(duration, **labels)
+        if last_run_successful is not None:
+            last_success.add(int(last_run_successful), **labels)
+        runs.add(run_count, **labels)
+        failures.add(failure_count, **labels)
+        if is_running and last_heartbeat:
+            heartbeat_age.add((now - last_heartbeat).total_seconds(), **labels)
+
+    # Scheduler-wide totals.
+    waiting = Q(enabled=True, is_running=False)
+    totals = Job.objects.order_by().aggregate(
+        running=Count('id', filter=Q(is_running=True)),
+        due=Count('id', filter=waiting & (Q(next_run__lte=now) | Q(force_run=True))),
+        oldest_due=Min('next_run', filter=waiting & Q(next_run__lte=now)),
+    )
+    running.add(totals['running'])
+    due.add(totals['due'])
+    lag = 0
+    if totals['oldest_due']:
+        lag = max((now - totals['oldest_due']).total_seconds(), 0)
+    dispatch_lag.add(lag)
+
+    # The most recent tick on each host.
+    latest_ticks = SchedulerTick.objects.order_by().values('hostname').annotate(last_id=Max('id')).values('last_id')
+    tick_rows = SchedulerTick.objects.filter(id__in=Subquery(latest_ticks)).values_list(
+        'hostname', 'start_datetime', 'planning_seconds', 'jobs_dispatched'
+    )
+    for hostname, start_datetime, planning_seconds, jobs_dispatched in tick_rows:
+        planning.add(planning_seconds, hostname=hostname)
+        tick_dispatched.add(jobs_dispatched, hostname=hostname)
+        tick_age.add((now - start_datetime).total_seconds(), hostname=hostname)
+
+    return [
+        last_duration,
+        last_success,
+        runs,
+        failures,
+        heartbeat_age,
+        running,
+        due,
+        dispatch_lag,
+        planning,
+        tick_dispatched,
+        tick_age,
+    ]
+
+
+def render_metrics(now=None):
+    """
+    Returns all metrics in the Prometheus text exposition format.
+    """
+    return '\n'.join(family.render() for family in collect_metrics(now=now)) + '\n'
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0004_auto_20240403_1154'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='progress_rate',
+            field=models.FloatField(blank=True, editable=False, help_text='The smoothed number of parts completed per second during the current run.', null=True),
+        ),
+    ]
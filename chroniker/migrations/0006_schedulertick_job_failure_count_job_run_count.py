@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:22
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0005_job_progress_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerTick',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hostname', models.CharField(editable=False, help_text='The hostname the scheduler ran on.', max_length=700)),
+                ('start_datetime', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False)),
+                ('end_datetime', models.DateTimeField(blank=True, editable=False, help_text='When all jobs dispatched by this tick completed.', null=True)),
+                ('planning_seconds', models.FloatField(blank=True, editable=False, help_text='The number of seconds spent finding due jobs.', null=True)),
+                ('jobs_dispatched', models.PositiveIntegerField(default=0, editable=False)),
+                ('connection_opens', models.PositiveIntegerField(default=0, editable=False, help_text='The number of database connections opened.')),
+            ],
+            options={
+                'ordering': ('-start_datetime',),
+            },
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='failure_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The total number of logged unsuccessful runs. Unaffected by log deletion.'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='run_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The total number of logged runs. Unaffected by log deletion.'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0006_schedulertick_job_failure_count_job_run_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='claimed_datetime',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the scheduler marked the job as running.', null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='command_start_datetime',
+            field=models.DateTimeField(blank=True, editable=False, help_text="When the job's command was invoked.", null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='process_start_datetime',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the process running the job started.', null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='scheduled_datetime',
+            field=models.DateTimeField(blank=True, editable=False, help_text='The next run time the job was scheduled for. Empty for forced runs.', null=True),
+        ),
+    ]
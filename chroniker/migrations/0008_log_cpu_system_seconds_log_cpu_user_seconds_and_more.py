@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0007_log_claimed_datetime_log_command_start_datetime_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='cpu_system_seconds',
+            field=models.FloatField(blank=True, editable=False, help_text="System CPU time used by the job's process tree.", null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='cpu_user_seconds',
+            field=models.FloatField(blank=True, editable=False, help_text="User CPU time used by the job's process tree.", null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='max_child_processes',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='The largest number of child processes observed at once.', null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='peak_rss_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text="The largest resident memory observed for the job's process tree.", null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='read_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text="Bytes read from storage by the job's process tree.", null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='write_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text="Bytes written to storage by the job's process tree.", null=True),
+        ),
+    ]
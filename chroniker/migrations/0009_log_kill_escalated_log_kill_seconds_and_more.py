@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0008_log_cpu_system_seconds_log_cpu_user_seconds_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='kill_escalated',
+            field=models.BooleanField(blank=True, editable=False, help_text='If checked, processes ignored the termination signal and had to be killed.', null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='kill_seconds',
+            field=models.FloatField(blank=True, editable=False, help_text="Seconds taken to terminate the job's processes after a timeout.", null=True),
+        ),
+        migrations.AddField(
+            model_name='log',
+            name='processes_reaped',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='The number of processes terminated after a timeout.', null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0009_log_kill_escalated_log_kill_seconds_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedulertick',
+            name='jobs_evaluated',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of due jobs checked for dispatch.'),
+        ),
+        migrations.AddField(
+            model_name='schedulertick',
+            name='jobs_skipped',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of due jobs not dispatched because of unmet dependencies.'),
+        ),
+        migrations.AddField(
+            model_name='schedulertick',
+            name='phases',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='The seconds and database queries spent in each phase of the tick, keyed by phase name.'),
+        ),
+        migrations.AddField(
+            model_name='schedulertick',
+            name='queries',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of database queries made by the scheduler.'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0010_schedulertick_jobs_evaluated_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(editable=False, help_text='The address the email is sent to.', max_length=700)),
+                ('is_error', models.BooleanField(default=False, editable=False, help_text='If checked, the log is of a failed run.')),
+                ('created_datetime', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False)),
+                ('send_attempts', models.PositiveIntegerField(default=0, editable=False, help_text='The number of failed attempts to send the email.')),
+                ('last_error', models.TextField(blank=True, editable=False, help_text='The error from the last failed attempt to send the email.')),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='chroniker.log')),
+            ],
+            options={
+                'ordering': ('send_attempts', 'id'),
+            },
+        ),
+    ]
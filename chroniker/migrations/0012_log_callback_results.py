@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0011_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='log',
+            name='callback_results',
+            field=models.JSONField(blank=True, editable=False, help_text='The reference, seconds taken, success and error of each callback called after the run.', null=True),
+        ),
+    ]
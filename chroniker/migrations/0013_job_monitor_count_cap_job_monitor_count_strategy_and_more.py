@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0012_log_callback_results'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='monitor_count_cap',
+            field=models.PositiveIntegerField(blank=True, help_text='If this is a monitor with a capped count, the number of records to stop counting at.<br/>Defaults to CHRONIKER_MONITOR_COUNT_CAP.', null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='monitor_count_strategy',
+            field=models.CharField(choices=[('exact', 'Exact count'), ('exists', 'Exists only'), ('capped', 'Capped count'), ('estimated', 'Estimated count')], default='exact', help_text="If this is a monitor, how its records are counted. Exists only and capped counts stop at the first or first few records, and estimated counts use the database's query planner, so checks of huge tables stay cheap.", max_length=20),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='monitor_records_strategy',
+            field=models.CharField(blank=True, choices=[('exact', 'Exact count'), ('exists', 'Exists only'), ('capped', 'Capped count'), ('estimated', 'Estimated count')], editable=False, help_text='How the number of records that need attention was counted.', max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0013_job_monitor_count_cap_job_monitor_count_strategy_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='monitor_alert_increase',
+            field=models.PositiveIntegerField(blank=True, help_text='If this is a monitor, it also fails when the number of records rose by at least this many since the previous check.', null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='monitor_alert_sustained_checks',
+            field=models.PositiveIntegerField(blank=True, help_text='If this is a monitor, it fails on its threshold only after this many consecutive checks over it.', null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='monitor_alert_threshold',
+            field=models.PositiveIntegerField(blank=True, help_text='If this is a monitor, it fails only when more than this many records need attention.<br/>If neither this nor an increase is given, any records fail it.', null=True),
+        ),
+        migrations.CreateModel(
+            name='MonitorRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('records', models.IntegerField(blank=True, editable=False, help_text='The number of records that needed attention, if counted.', null=True)),
+                ('duration_seconds', models.FloatField(blank=True, editable=False, help_text='The number of seconds the check took.', null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monitor_history', to='chroniker.job')),
+            ],
+            options={
+                'ordering': ('-timestamp',),
+                'indexes': [models.Index(fields=['job', 'timestamp'], name='chroniker_m_job_id_3df8af_idx')],
+            },
+        ),
+    ]
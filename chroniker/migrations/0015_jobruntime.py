@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_runtime(apps, schema_editor):
+    Job = apps.get_model('chroniker', 'Job')
+    JobRuntime = apps.get_model('chroniker', 'JobRuntime')
+    rows = Job.objects.values_list('id', 'last_heartbeat', 'total_parts', 'total_parts_complete', 'progress_rate')
+    JobRuntime.objects.bulk_create(
+        [
+            JobRuntime(job_id=job_id, last_heartbeat=last_heartbeat, total_parts=total_parts, total_parts_complete=total_parts_complete, progress_rate=progress_rate)
+            for job_id, last_heartbeat, total_parts, total_parts_complete, progress_rate in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0014_job_monitor_alert_increase_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRuntime',
+            fields=[
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='runtime', serialize=False, to='chroniker.job')),
+                ('last_heartbeat', models.DateTimeField(blank=True, editable=False, null=True, verbose_name='last heartbeat')),
+                ('total_parts', models.PositiveIntegerField(default=0, editable=False, help_text='The total number of parts of the task.')),
+                ('total_parts_complete', models.PositiveIntegerField(default=0, editable=False, help_text='The total number of complete parts.')),
+                ('progress_rate', models.FloatField(blank=True, editable=False, help_text='The smoothed number of parts completed per second during the current run.', null=True)),
+            ],
+            options={
+                'verbose_name': 'job runtime',
+            },
+        ),
+        migrations.RunPython(copy_runtime, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='job',
+            name='last_heartbeat',
+        ),
+        migrations.RemoveField(
+            model_name='job',
+            name='progress_rate',
+        ),
+        migrations.RemoveField(
+            model_name='job',
+            name='total_parts',
+        ),
+        migrations.RemoveField(
+            model_name='job',
+            name='total_parts_complete',
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:21
+
+import chroniker.sharding
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def spread_ring_positions(apps, schema_editor):
+    # The field's default is only evaluated once for existing jobs.
+    Job = apps.get_model('chroniker', 'Job')
+    jobs = list(Job.objects.only('id'))
+    for job in jobs:
+        job.ring_position = chroniker.sharding.random_ring_position()
+    Job.objects.bulk_update(jobs, ['ring_position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0015_jobruntime'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerHost',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hostname', models.CharField(editable=False, max_length=700, unique=True)),
+                ('group', models.CharField(blank=True, db_index=True, default='', editable=False, help_text='The host group the host claims jobs for.', max_length=200)),
+                ('last_heartbeat', models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False)),
+            ],
+            options={
+                'ordering': ('group', 'hostname'),
+            },
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='host_group',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='If set, the job only runs on one of the live hosts in this group, chosen by consistent hashing.', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='ring_position',
+            field=models.BigIntegerField(db_index=True, default=chroniker.sharding.random_ring_position, editable=False, help_text="The job's position on its host group's hash ring."),
+        ),
+        migrations.RunPython(spread_ring_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0016_workerhost_job_host_group'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='last_hostname',
+            field=models.CharField(blank=True, editable=False, help_text='The name of the host that last ran the job.', max_length=700, null=True),
+        ),
+        migrations.AddField(
+            model_name='workerhost',
+            name='capacity',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of jobs the host runs at once.'),
+        ),
+        migrations.AddField(
+            model_name='workerhost',
+            name='cpu_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='workerhost',
+            name='draining',
+            field=models.BooleanField(default=False, help_text="If checked, the host finishes the jobs it's running, but its group's jobs are placed on its other hosts."),
+        ),
+        migrations.AddField(
+            model_name='workerhost',
+            name='free_memory',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='The number of bytes of memory available on the host.', null=True),
+        ),
+        migrations.AddField(
+            model_name='workerhost',
+            name='load_average',
+            field=models.FloatField(blank=True, editable=False, help_text="The host's one minute load average.", null=True),
+        ),
+        migrations.AddField(
+            model_name='workerhost',
+            name='running_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='The number of jobs the host was running.'),
+        ),
+    ]
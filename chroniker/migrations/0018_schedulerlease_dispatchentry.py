@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-19 02:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0017_workerhost_load'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(editable=False, max_length=100, unique=True)),
+                ('holder', models.CharField(blank=True, default='', editable=False, help_text='The host holding the lease.', max_length=700)),
+                ('acquired_datetime', models.DateTimeField(blank=True, editable=False, help_text='When the holder took the lease.', null=True)),
+                ('expires_datetime', models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text='When the lease lapses unless renewed.')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DispatchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_hostname', models.CharField(blank=True, db_index=True, default='', editable=False, help_text='If set, only this host may claim the job.', max_length=700)),
+                ('queued_datetime', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('claimed_by', models.CharField(blank=True, default='', editable=False, help_text='The host that claimed the job.', max_length=700)),
+                ('claimed_datetime', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dispatch_entry', to='chroniker.job')),
+            ],
+            options={
+                'verbose_name_plural': 'dispatch entries',
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0018_schedulerlease_dispatchentry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='send_attempts',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="The number of failed attempts to send the email. It's dropped after CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS."),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:40
+
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+def backfill_run_counts(apps, schema_editor):
+    # The counters were added without counting the runs already logged.
+    # Jobs counting more runs than they have logs, since logs were deleted
+    # after the counters were added, are left alone.
+    Job = apps.get_model('chroniker', 'Job')
+    Log = apps.get_model('chroniker', 'Log')
+    counts = Log.objects.order_by().values('job_id').annotate(runs=Count('id'), failures=Count('id', filter=Q(success=False)))
+    for row in counts.iterator():
+        Job.objects.filter(id=row['job_id'], run_count__lt=row['runs']).update(run_count=row['runs'], failure_count=row['failures'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chroniker', '0019_alter_notification_send_attempts'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_run_counts, migrations.RunPython.noop),
+    ]
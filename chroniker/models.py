@@ -21,6 +21,7 @@ except ImportError:
     except ImportError:
         import dummy_thread as thread
 
+import psutil
 from dateutil import rrule
 
 from django.conf import settings
@@ -28,7 +29,8 @@ from django.contrib.sites.models import Site
 from django.core.mail import send_mail
 from django.core.management import call_command
 from django.db import models, connection, transaction
-from django.db.models import Q
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber, TruncHour
 from django.template import loader, Template, Context
 from django.utils import timezone
 from django.utils.encoding import smart_str
@@ -37,10 +39,11 @@ from django.utils.timesince import timeuntil
 from django.utils.translation import ngettext, gettext, gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.utils.html import format_html
-from toposort import toposort_flatten
-
 import chroniker.constants as c
 from chroniker import utils
+from chroniker.callbacks import CallbackDispatcher
+from chroniker.graph import get_dependency_graph, invalidate_dependency_graph
+from chroniker.sharding import get_hash_ring, random_ring_position
 from chroniker.utils import import_string, clean_samples
 
 from . import settings as _settings # pylint: disable=unused-import
@@ -51,12 +54,20 @@ logger = logging.getLogger('chroniker.models')
 
 _state = {} # {thread_ident:job_id}
 _state_heartbeat = {} # {thread_ident:heartbeat thread object}
+_state_context = {} # {thread_ident:job context object}
+_templates = {} # {template source:Template}
 
 
 def get_current_job():
     """
     Retrieves the job associated with the current thread.
+
+    Inside a running job, the record is cached by the job's context, so
+    repeated calls don't query the database.
     """
+    context = get_current_context()
+    if context is not None:
+        return context.job
     thread_ident = thread.get_ident()
     if thread_ident in _state:
         try:
@@ -95,6 +106,39 @@ def set_current_heartbeat(obj):
         _state_heartbeat[thread_ident] = obj
 
 
+def get_current_context():
+    """
+    Retrieves the job context associated with the current thread.
+    """
+    return _state_context.get(thread.get_ident())
+
+
+def set_current_context(obj):
+    """
+    Associates a job context with the current thread.
+    Passing None removes the association.
+    """
+    thread_ident = thread.get_ident()
+    if obj is None:
+        _state_context.pop(thread_ident, None)
+    else:
+        _state_context[thread_ident] = obj
+
+
+def get_compiled_template(source):
+    """
+    Returns the compiled template for the given source, compiling each
+    distinct source only once per process.
+    """
+    if source not in _templates:
+        _templates[source] = Template(source)
+    return _templates[source]
+
+
+def get_email_sender():
+    return '"%s" <%s>' % (_settings.CHRONIKER_EMAIL_SENDER, _settings.CHRONIKER_EMAIL_HOST_USER)
+
+
 def hostname_help_text_setter():
     return _('If given, ensures the job is only run on the server ' + \
              'with the equivalent host name.<br/>Not setting any hostname ' + \
@@ -104,6 +148,114 @@ def hostname_help_text_setter():
              % socket.gethostname()
 
 
+class JobContext:
+    """
+    Runtime state made available to code executing inside a job.
+
+    Caches the job record, so ``get_current_job()`` doesn't query the
+    database on every call, and coalesces progress updates in memory, writing
+    them at most once every ``CHRONIKER_PROGRESS_FLUSH_SECONDS``.
+
+    Also tracks an exponentially weighted moving average of the processing
+    rate, in parts per second, which is used to estimate time to completion.
+    """
+
+    # The minimum number of seconds between rate samples. Shorter intervals
+    # make the instantaneous rate too noisy to be useful.
+    rate_sample_seconds = 1
+
+    def __init__(self, job_id, lock=None, flush_seconds=None, alpha=None):
+        self.job_id = job_id
+        self.lock = lock or threading.RLock()
+        if flush_seconds is None:
+            flush_seconds = _settings.CHRONIKER_PROGRESS_FLUSH_SECONDS
+        self.flush_seconds = flush_seconds
+        self.alpha = alpha or _settings.CHRONIKER_PROGRESS_RATE_ALPHA
+        self.total_parts = 0
+        self.total_parts_complete = 0
+        self.rate = None
+        self._job = None
+        self._dirty = False
+        self._last_flush = None
+        self._last_sample = None # (timestamp, total_parts_complete)
+
+    @property
+    def job(self):
+        if self._job is None:
+            self.refresh()
+        return self._job
+
+    def refresh(self):
+        """
+        Reloads the cached job record from the database.
+        """
+        try:
+            self._job = Job.objects.get(id=self.job_id)
+        except Job.DoesNotExist:
+            self._job = None
+        return self._job
+
+    def _sample_rate(self, total_parts_complete, now):
+        if self._last_sample is None or total_parts_complete < self._last_sample[1]:
+            # First sample, or the job restarted its count.
+            self._last_sample = (now, total_parts_complete)
+            return
+        last_time, last_complete = self._last_sample
+        elapsed = now - last_time
+        if elapsed < self.rate_sample_seconds:
+            return
+        rate = (total_parts_complete - last_complete) / elapsed
+        if self.rate is None:
+            self.rate = rate
+        else:
+            self.rate = self.alpha * rate + (1 - self.alpha) * self.rate
+        self._last_sample = (now, total_parts_complete)
+
+    def update_progress(self, total_parts, total_parts_complete, lock=True):
+        """
+        Records the job's progress, writing it to the database if the last
+        write was more than ``flush_seconds`` ago.
+        """
+        now = time.time()
+        with self.lock:
+            self._sample_rate(total_parts_complete, now)
+            self.total_parts = total_parts
+            self.total_parts_complete = total_parts_complete
+            self._dirty = True
+            if self._last_flush is None or now - self._last_flush >= self.flush_seconds:
+                self.flush()
+
+    def pop_pending(self):
+        """
+        Returns a dict of the progress fields not yet written to the database,
+        and marks them as written.
+        """
+        with self.lock:
+            if not self._dirty:
+                return {}
+            self._dirty = False
+            self._last_flush = time.time()
+            fields = dict(
+                total_parts=self.total_parts,
+                total_parts_complete=self.total_parts_complete,
+                progress_rate=self.rate,
+            )
+            if self._job is not None:
+                runtime = self._job.get_runtime()
+                for name, value in fields.items():
+                    setattr(runtime, name, value)
+            return fields
+
+    def flush(self):
+        """
+        Writes any pending progress to the database.
+        """
+        with self.lock:
+            fields = self.pop_pending()
+            if fields:
+                JobRuntime.set_state([self.job_id], last_heartbeat=timezone.now(), **fields)
+
+
 class JobHeartbeatThread(threading.Thread):
     """
     A very simple thread that updates a temporary "lock" file every second.
@@ -119,9 +271,11 @@ class JobHeartbeatThread(threading.Thread):
 
     halt = False
 
-    def __init__(self, job_id, lock, *args, **kwargs):
+    def __init__(self, job_id, lock, *args, context=None, resource_monitor=None, **kwargs):
         self.job_id = job_id
         self.lock = lock
+        self.context = context
+        self.resource_monitor = resource_monitor
         self.lock_file = tempfile.NamedTemporaryFile()
         self.original_pid = os.getpid()
         set_current_job(job_id)
@@ -144,16 +298,19 @@ class JobHeartbeatThread(threading.Thread):
 
             utils.write_lock(self.lock_file)
 
+            if self.resource_monitor:
+                self.resource_monitor.sample()
+
             # Check job status and save heartbeat timestamp.
             with self.lock:
-                Job.objects.update()
-                job = Job.objects.only('id', 'force_stop').get(id=self.job_id)
+                job = Job.objects.only('id', 'force_stop', 'force_run').get(id=self.job_id)
                 force_stop = job.force_stop
-                Job.objects.filter(id=self.job_id).update(
-                    last_heartbeat=timezone.now(),
-                    force_stop=False,
-                    force_run=False,
-                )
+                # Piggyback any coalesced progress on the heartbeat write.
+                pending = self.context.pop_pending() if self.context else {}
+                JobRuntime.set_state([self.job_id], last_heartbeat=timezone.now(), **pending)
+                # Only write to the job itself when there's a flag to clear.
+                if job.force_stop or job.force_run:
+                    Job.objects.filter(id=self.job_id).update(force_stop=False, force_run=False)
 
             # If we noticed we're being forced to stop, then interrupt
             # the entire process.
@@ -166,6 +323,9 @@ class JobHeartbeatThread(threading.Thread):
 
         set_current_heartbeat(None)
 
+        # Release this thread's connection.
+        connection.close()
+
     def stop(self):
         """
         Call this to stop the heartbeat.
@@ -179,8 +339,11 @@ class JobHeartbeatThread(threading.Thread):
         """
         JobHeartbeatThread
         """
+        if self.context:
+            return self.context.update_progress(total_parts, total_parts_complete)
         with self.lock:
-            Job.objects.filter(id=self.job_id).update(
+            JobRuntime.set_state(
+                [self.job_id],
                 total_parts=total_parts,
                 total_parts_complete=total_parts_complete,
                 last_heartbeat=timezone.now(),
@@ -237,18 +400,28 @@ class JobDependency(models.Model):
         return str(self.dependent) + ' -> ' + str(self.dependee)
 
 
+models.signals.post_save.connect(invalidate_dependency_graph, sender=JobDependency, dispatch_uid='chroniker_dependency_graph_save')
+models.signals.post_delete.connect(invalidate_dependency_graph, sender=JobDependency, dispatch_uid='chroniker_dependency_graph_delete')
+
+
+# The fields that set when a job is due.
+SCHEDULE_FIELDS = ('frequency', 'params')
+
+
 class JobManager(models.Manager):
 
     def get_by_natural_key(self, *args):
         kwargs = {_name: _value for _name, _value in zip(_settings.CHRONIKER_JOB_NK, args)}
         return self.get(**kwargs)
 
-    def due(self, job=None, check_running=True):
+    def due(self, job=None, check_running=True, any_host=False):
         """
         Returns a ``QuerySet`` of all jobs waiting to be run.  NOTE: this may
         return ``Job``s that are still currently running; it is your
         responsibility to call ``Job.check_is_running()`` to determine whether
         or not the ``Job`` actually needs to be run.
+
+        Unless any_host is true, only returns the jobs this host may run.
         """
 
         # Lock the Job record if possible with the backend.
@@ -261,10 +434,18 @@ class JobManager(models.Manager):
         else:
             q = self.all()
         q = q.filter(Q(next_run__lte=timezone.now()) | Q(force_run=True))
-        q = q.filter(
-            Q(hostname__isnull=True) | \
-            Q(hostname='') | \
-            Q(hostname=socket.gethostname()))
+        if not any_host:
+            q = q.filter(
+                Q(hostname__isnull=True) | \
+                Q(hostname='') | \
+                Q(hostname=socket.gethostname()))
+            # Of the jobs in this host's group, only claim those on its segments of
+            # the ring. Placement by load is only done by the dispatch planner.
+            group_q = Q(host_group='')
+            if _settings.CHRONIKER_HOST_GROUP:
+                ring = get_hash_ring(_settings.CHRONIKER_HOST_GROUP)
+                group_q |= Q(host_group=_settings.CHRONIKER_HOST_GROUP) & ring.get_q(socket.gethostname())
+            q = q.filter(group_q)
         q = q.filter(enabled=True)
         if check_running:
             q = q.filter(is_running=False)
@@ -274,31 +455,33 @@ class JobManager(models.Manager):
             q = q.filter(id=job.id)
         return q
 
-    def due_with_met_dependencies(self, jobs=None):
+    def due_with_met_dependencies(self, jobs=None, any_host=False):
         """
         Iterates over the results of due(), ignoring jobs
         that are dependent on another job that is also due.
         """
 
         jobs = jobs or []
-
-        # Fixes the "Lost connection to MySQL server during query" error when
-        # called from cron command?
-        connection.close()
+        graph = get_dependency_graph()
 
         skipped_job_ids = set()
-        for job in self.due():
+        for job in self.due(any_host=any_host):
             if jobs and job.id not in jobs:
                 skipped_job_ids.add(job.id)
                 continue
 
-            deps = job.dependencies.all()
-            valid = True
-
             if job.check_is_running():
                 #print('Skipping job %i (%s) which is already running.' % (job.id, job))
                 continue
 
+            # Jobs without dependencies need no further checks.
+            if not graph.dependees(job.id):
+                yield job
+                continue
+
+            deps = job.dependencies.select_related('dependee', 'dependent')
+            valid = True
+
             failed_dep = None
             for dep in deps:
                 if dep.dependee.id in skipped_job_ids:
@@ -323,25 +506,24 @@ class JobManager(models.Manager):
 
             yield job
 
-    def due_with_met_dependencies_ordered(self, jobs=None):
+    def _in_dependency_order(self, job_ids):
+        ids = get_dependency_graph().topological_order(job_ids)
+        jobs = self.in_bulk(ids)
+        return [jobs[_] for _ in ids if _ in jobs]
+
+    def due_with_met_dependencies_ordered(self, jobs=None, any_host=False):
         """
         Returns a list of jobs sorted by dependency, with dependents after
         all their dependees.
         """
-        data = {j.id: {_.dependee.id for _ in j.dependencies.all()} for j in self.due_with_met_dependencies(jobs=jobs)}
-        lst = toposort_flatten(data)
-        lst = [Job.objects.get(id=_) for _ in lst]
-        return lst
+        return self._in_dependency_order([j.id for j in self.due_with_met_dependencies(jobs=jobs, any_host=any_host)])
 
     def ordered_by_dependencies(self, jobs=None):
         """
         Orders the given jobs so that all dependents are ordered after their dependencies.
         """
         jobs = jobs or []
-        data = {j.id: {_.dependee.id for _ in j.dependencies.all()} for j in jobs}
-        lst = toposort_flatten(data)
-        lst = [Job.objects.get(id=_) for _ in lst]
-        return lst
+        return self._in_dependency_order([j.id for j in jobs])
 
     def stale(self):
         """
@@ -350,7 +532,7 @@ class JobManager(models.Manager):
         """
         threshold = timezone.now() - timedelta(minutes=_settings.CHRONIKER_STALE_MINUTES)
         q = self.filter(is_running=True)
-        q = q.filter(Q(last_heartbeat__isnull=True) | Q(last_heartbeat__lt=threshold))
+        q = q.filter(Q(runtime__last_heartbeat__isnull=True) | Q(runtime__last_heartbeat__lt=threshold))
         return q
 
     def all_running(self):
@@ -364,19 +546,7 @@ class JobManager(models.Manager):
         """
 
         @transaction.atomic
-        def kill_job(job):
-            # If we know the PID and it's running locally, and the process
-            # appears inactive, then attempt to forcibly kill the job.
-            if job.current_pid and job.current_hostname and job.current_hostname == socket.gethostname():
-                if utils.pid_exists(job.current_pid):
-                    print(f'Killing process {job.current_pid}...')
-                    utils.kill_process(job.current_pid)
-                    #TODO:record log entry
-                else:
-                    print(f'Process with PID {job.current_pid} is not running.')
-            else:
-                print(f'Process with PID {job.current_pid} is not elligible for killing.')
-
+        def end_job(job):
             job.is_running = False
             job.last_run_successful = False
             job.save()
@@ -393,17 +563,42 @@ class JobManager(models.Manager):
                 success=False,
             )
 
-        q = self.stale()
-        total = q.count()
-        print(f'{total} total stale jobs.')
-        for job in q.iterator():
+        stale = list(self.stale())
+        print(f'{len(stale)} total stale jobs.')
+
+        # If we know the PID and it's running locally, and the process
+        # appears inactive, then attempt to forcibly kill the job. Every
+        # process is signalled before waiting on any, so one stuck process
+        # doesn't hold up the rest.
+        pids = []
+        for job in stale:
             print(f'Checking stale job {job.id}: {job}')
+            if job.current_pid and job.current_hostname and job.current_hostname == socket.gethostname():
+                if utils.pid_exists(job.current_pid):
+                    print(f'Killing process {job.current_pid}...')
+                    pids.append(job.current_pid)
+                    #TODO:record log entry
+                else:
+                    print(f'Process with PID {job.current_pid} is not running.')
+            else:
+                print(f'Process with PID {job.current_pid} is not elligible for killing.')
+        if pids:
+            utils.kill_processes(pids)
 
-            kill_job(job)
+        for job in stale:
+            end_job(job)
             #transaction.commit()
 
             create_log(job)
             #transaction.commit()
+            job.trim_logs()
+
+    def trim_logs(self):
+        """
+        Deletes the logs of each job beyond its ``maximum_log_entries``.
+        """
+        for job in self.filter(maximum_log_entries__gt=0).only('id', 'maximum_log_entries'):
+            job.trim_logs()
 
 class CallbackMethod(models.Model):
 
@@ -462,8 +657,6 @@ class Job(models.Model):
 
     last_run = models.DateTimeField(_("last run end timestamp"), editable=False, blank=True, null=True)
 
-    last_heartbeat = models.DateTimeField(_("last heartbeat"), editable=False, blank=True, null=True)
-
     is_running = models.BooleanField(
         default=False,
         editable=True,
@@ -511,15 +704,31 @@ class Job(models.Model):
 
     hostname = models.CharField(max_length=700, blank=True, null=True, verbose_name='target hostname', help_text=hostname_help_text_setter)
 
+    host_group = models.CharField(
+        max_length=200,
+        blank=True,
+        default='',
+        db_index=True,
+        help_text=_('If set, the job only runs on one of the live hosts in this group, chosen by consistent hashing.'),
+    )
+
+    ring_position = models.BigIntegerField(
+        default=random_ring_position, editable=False, db_index=True, help_text=_("The job's position on its host group's hash ring.")
+    )
+
     current_hostname = models.CharField(max_length=700, blank=True, null=True, editable=False, help_text=_('The name of the host currently running the job.'))
 
+    last_hostname = models.CharField(max_length=700, blank=True, null=True, editable=False, help_text=_('The name of the host that last ran the job.'))
+
     current_pid = models.CharField(
         max_length=50, blank=True, null=True, editable=False, db_index=True, help_text=_('The ID of the process currently running the job.')
     )
 
-    total_parts_complete = models.PositiveIntegerField(default=0, editable=False, blank=False, null=False, help_text=_('The total number of complete parts.'))
+    run_count = models.PositiveIntegerField(default=0, editable=False, help_text=_('The total number of logged runs. Unaffected by log deletion.'))
 
-    total_parts = models.PositiveIntegerField(default=0, editable=False, blank=False, null=False, help_text=_('The total number of parts of the task.'))
+    failure_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text=_('The total number of logged unsuccessful runs. Unaffected by log deletion.')
+    )
 
     is_monitor = models.BooleanField(default=False, help_text=_('If checked, will appear in the monitors section.'))
 
@@ -542,6 +751,51 @@ class Job(models.Model):
         help_text=_('The number of records that need attention.')
     )
 
+    monitor_count_strategy = models.CharField(
+        max_length=20,
+        choices=c.COUNT_STRATEGY_CHOICES,
+        default=c.COUNT_EXACT,
+        help_text=_(
+            'If this is a monitor, how its records are counted. Exists only and capped counts stop at the first or '
+            'first few records, and estimated counts use the database\'s query planner, so checks of huge tables stay cheap.'
+        )
+    )
+
+    monitor_count_cap = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text=_('If this is a monitor with a capped count, the number of records to stop counting at.<br/>'
+                    'Defaults to CHRONIKER_MONITOR_COUNT_CAP.')
+    )
+
+    monitor_records_strategy = models.CharField(
+        max_length=20,
+        choices=c.COUNT_STRATEGY_CHOICES,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text=_('How the number of records that need attention was counted.')
+    )
+
+    monitor_alert_threshold = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text=_('If this is a monitor, it fails only when more than this many records need attention.<br/>'
+                    'If neither this nor an increase is given, any records fail it.')
+    )
+
+    monitor_alert_increase = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text=_('If this is a monitor, it also fails when the number of records rose by at least this many since the previous check.')
+    )
+
+    monitor_alert_sustained_checks = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text=_('If this is a monitor, it fails on its threshold only after this many consecutive checks over it.')
+    )
+
     maximum_log_entries = models.PositiveIntegerField(
         default=1000,
         help_text='The maximum number of most recent log entries to keep.' + \
@@ -590,6 +844,33 @@ class Job(models.Model):
     def monitor_description_safe(self):
         return mark_safe(self.monitor_description)
 
+    def get_runtime(self):
+        """
+        Returns the job's runtime state, or an unsaved default one if it has
+        never run. The default is cached on the job, so changes to it are kept.
+        """
+        runtime = getattr(self, 'runtime', None)
+        if runtime is None:
+            runtime = JobRuntime(job=self)
+            self.runtime = runtime
+        return runtime
+
+    @property
+    def last_heartbeat(self):
+        return self.get_runtime().last_heartbeat
+
+    @property
+    def total_parts(self):
+        return self.get_runtime().total_parts
+
+    @property
+    def total_parts_complete(self):
+        return self.get_runtime().total_parts_complete
+
+    @property
+    def progress_rate(self):
+        return self.get_runtime().progress_rate
+
     @property
     def progress_ratio(self):
         if not self.total_parts_complete and not self.total_parts:
@@ -611,27 +892,16 @@ class Job(models.Model):
 
     progress_percent_str.short_description = 'Progress'
 
-    def get_chained_jobs(self):
+    def get_chained_jobs(self, graph=None):
         """
         Returns a list of jobs that depend on this job.
         Retrieves jobs recursively, stopping if it detects cycles.
         """
-        priors = {self.id}
-        pending = list(self.dependents.all()\
-            .filter(dependent__enabled=True, wait_for_completion=True)\
-            .values_list('dependent_id', flat=True))
-        chained = set()
-        while pending:
-            job_id = pending.pop(0)
-            if job_id in priors:
-                continue
-            priors.add(job_id)
-            job = Job.objects.only('id').get(id=job_id)
-            chained.add(job)
-            pending.extend(job.dependents.all()\
-                .filter(dependent__enabled=True, wait_for_completion=True)\
-                .values_list('dependent_id', flat=True))
-        return chained
+        graph = graph or get_dependency_graph()
+        candidate_ids = graph.descendants(self.id, wait_for_completion=True)
+        enabled_ids = set(Job.objects.filter(id__in=candidate_ids, enabled=True).values_list('id', flat=True))
+        chained_ids = graph.descendants(self.id, wait_for_completion=True, include=enabled_ids)
+        return set(Job.objects.filter(id__in=chained_ids))
 
     def get_run_length_estimate(self, samples=20):
         """
@@ -652,6 +922,9 @@ class Job(models.Model):
         """
         Returns an estimate of how many seconds are remaining until processing
         is complete.
+
+        Uses the smoothed processing rate reported by the job's context when
+        available, falling back to a linear projection from the run's start.
         """
         if not self.is_running:
             return
@@ -660,12 +933,14 @@ class Job(models.Model):
             return
         if not self.last_run_start_timestamp:
             return
-        td = timezone.now() - self.last_run_start_timestamp
-        if not progress_ratio:
+        if not progress_ratio and not self.progress_rate:
             return
-        total_sec = td.total_seconds() / progress_ratio
-        remaining_sec = total_sec - td.total_seconds()
-        return remaining_sec
+        return utils.get_remaining_seconds(
+            complete_parts=self.total_parts_complete,
+            total_parts=self.total_parts,
+            start_datetime=self.last_run_start_timestamp,
+            rate=self.progress_rate,
+        )
 
     @property
     def estimated_completion_datetime(self):
@@ -710,51 +985,110 @@ class Job(models.Model):
     def full_clean(self, exclude=None, validate_unique=True):
         self.clean()
 
+    def get_scheduled_run_after(self, after=None):
+        """
+        Returns the first datetime on the job's schedule after the given one,
+        or after now.
+        """
+        tz = timezone.get_default_timezone()
+        after = after or timezone.now()
+        try:
+            return self.rrule.after(utils.make_aware(after, tz))
+        except (ValueError, TypeError):
+            return utils.make_aware(self.rrule.after(utils.make_naive(after, tz)), tz)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_fields()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.snapshot_fields()
+
+    def snapshot_fields(self):
+        """
+        Records the loaded field values, so saves can write only those changed.
+        """
+        self._loaded_values = {f.attname: self.__dict__[f.attname] for f in self._meta.concrete_fields if f.attname in self.__dict__}
+
+    def write_fields(self, **fields):
+        """
+        Writes the given fields straight to the job's row and onto this
+        instance, recording them as loaded, so a later save neither misses
+        changing them back nor writes them again.
+        """
+        Job.objects.filter(id=self.id).update(**fields)
+        loaded = getattr(self, '_loaded_values', None)
+        for name, value in fields.items():
+            setattr(self, name, value)
+            if loaded is not None:
+                loaded[self._meta.get_field(name).attname] = getattr(self, self._meta.get_field(name).attname)
+
+    def get_changed_fields(self):
+        """
+        Returns the names of the fields changed since the job was loaded or
+        saved, or None if it wasn't loaded from the database.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or self._state.adding:
+            return None
+        return [
+            f.name for f in self._meta.concrete_fields
+            if not f.primary_key and f.attname in self.__dict__ and (f.attname not in loaded or loaded[f.attname] != self.__dict__[f.attname])
+        ]
+
     def save(self, **kwargs):
         self.full_clean()
 
         tz = timezone.get_default_timezone()
 
+        changed = self.get_changed_fields()
         if self.enabled:
-            if self.pk:
-                j = Job.objects.get(pk=self.pk)
-            else:
-                j = self
-            if not self.next_run or j.params != self.params:
+            if not self.next_run or (changed and set(changed) & set(SCHEDULE_FIELDS)):
                 logger.debug("Updating 'next_run")
-                next_run = self.next_run or timezone.now()
-                try:
-                    self.next_run = self.rrule.after(utils.make_aware(next_run, tz))
-                except ValueError:
-                    self.next_run = utils.make_aware(self.rrule.after(utils.make_naive(next_run, tz)), tz)
-                except TypeError:
-                    self.next_run = utils.make_aware(self.rrule.after(utils.make_naive(next_run, tz)), tz)
+                self.next_run = self.get_scheduled_run_after(self.next_run)
 
-        if not self.is_running:
+        # Only clear the process when this save stops the job, so saving a
+        # stale copy of the job doesn't clear that of a run started since.
+        if not self.is_running and (changed is None or 'is_running' in changed):
             self.current_hostname = None
             self.current_pid = None
 
         if self.next_run:
             self.next_run = utils.make_aware(self.next_run, tz)
 
+        # Only write the fields that changed, including those changed above.
+        if changed is not None and self.pk is not None and 'update_fields' not in kwargs and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = self.get_changed_fields()
+
         super().save(**kwargs)
+        self.snapshot_fields()
 
-        # Delete expired logs.
-        if self.maximum_log_entries:
-            cutoff = self.maximum_log_entries - 1
-            log_q = self.logs.all().order_by('-run_start_datetime')[cutoff:]
-            if log_q.exists():
-                cutoff_dt = log_q[0].run_start_datetime
-                qs = Log.objects.filter(run_start_datetime__lte=cutoff_dt)
-                for o in qs:
-                    o.delete()
+    def trim_logs(self):
+        """
+        Deletes all but the newest ``maximum_log_entries`` logs of the job,
+        except those with emails still queued.
+        """
+        if not self.maximum_log_entries:
+            return
+        log_ids = list(self.logs.order_by('-run_start_datetime', '-id').values_list('id', flat=True)[self.maximum_log_entries:])
+        if log_ids:
+            Log.objects.filter(id__in=log_ids).exclude(notifications__isnull=False).delete()
 
-    def dependencies_met(self, running_ids=None):
+    def dependencies_met(self, running_ids=None, graph=None):
         """
         Returns true if all dependency scheduling criteria have been met.
         Returns false otherwise.
+
+        If given a dependency graph loaded in the current tick, jobs it shows
+        without dependencies are passed without a query. The cached graph may
+        be out of date, so it's not used otherwise.
         """
-        for dep in self.dependencies.all():
+        if graph is not None and not graph.dependees(self.id):
+            return True
+        for dep in self.dependencies.select_related('dependee', 'dependent'):
             if not dep.criteria_met(running_ids=running_ids):
                 return False
         return True
@@ -903,12 +1237,12 @@ class Job(models.Model):
 
     is_due.boolean = True
 
-    def is_due_with_dependencies_met(self, running_ids=None):
+    def is_due_with_dependencies_met(self, running_ids=None, graph=None):
         """
         Return true if job is scheduled to run and all dependencies
         are satisified.
         """
-        return self.is_due() and self.dependencies_met(running_ids=running_ids)
+        return self.is_due() and self.dependencies_met(running_ids=running_ids, graph=graph)
 
     def run(self, check_running=True, force_run=False, *args, **kwargs):
         """
@@ -949,33 +1283,56 @@ class Job(models.Model):
             is_running=True,
             last_run_start_timestamp=timezone.now(),
             current_hostname=socket.gethostname(),
+            last_hostname=socket.gethostname(),
             current_pid=str(os.getpid()),
+            lock_file=lock_file or '',
+        )
+        self.write_fields(**kwargs)
+        runtime_kwargs = dict(
             total_parts=0,
             total_parts_complete=0,
-            lock_file=lock_file or '',
+            progress_rate=None,
             last_heartbeat=timezone.now(),
         )
-        Job.objects.filter(id=self.id).update(**kwargs)
-        for name, value in kwargs.items():
-            setattr(self, name, value)
-
-    def handle_run(self, update_heartbeat=True, stdout_queue=None, stderr_queue=None, *args, **kwargs):
+        JobRuntime.set_state([self.id], **runtime_kwargs)
+        runtime = self.get_runtime()
+        for name, value in runtime_kwargs.items():
+            setattr(runtime, name, value)
+
+    def handle_run(
+        self,
+        update_heartbeat=True,
+        stdout_queue=None,
+        stderr_queue=None,
+        *args,
+        scheduled_datetime=None,
+        claimed_datetime=None,
+        process_start_datetime=None,
+        **kwargs
+    ):
         """
         This method implements the code to actually run a ``Job``.  This is
         meant to be run, primarily, by the `run_job` management command as a
         subprocess, which can be invoked by calling this ``Job``\'s ``run``
         method.
+
+        The scheduled, claimed and process start datetimes are recorded on the
+        run's log so dispatch lag can be attributed to each stage.
         """
         print('Handling run...')
 
         lock = threading.RLock()
         run_start_datetime = timezone.now()
+        process_start_datetime = process_start_datetime or run_start_datetime
+        command_start_datetime = None
         last_run_successful = False
         stdout_str = ''
         stderr_str = ''
 
         original_pid = os.getpid()
 
+        resource_monitor = utils.ResourceMonitor()
+
         try:
             # Redirect output so that we can log and easily check for errors.
             stdout = utils.TeeFile(sys.stdout, auto_flush=True, queue=stdout_queue, local=self.log_stdout)
@@ -987,9 +1344,12 @@ class Job(models.Model):
 
             args, options = self.get_args()
 
+            context = JobContext(job_id=self.id, lock=lock)
+            set_current_context(context)
+
             heartbeat = None
             if update_heartbeat:
-                heartbeat = JobHeartbeatThread(job_id=self.id, lock=lock)
+                heartbeat = JobHeartbeatThread(job_id=self.id, lock=lock, context=context, resource_monitor=resource_monitor)
 
             lock_file = ''
             if heartbeat and heartbeat.lock_file:
@@ -997,9 +1357,6 @@ class Job(models.Model):
 
             try:
                 with lock:
-                    # Fixes MySQL error "Commands out of sync"?
-                    connection.close()
-
                     self.mark_running(lock_file=lock_file)
 
             except Exception as e:
@@ -1012,6 +1369,7 @@ class Job(models.Model):
                 heartbeat.start()
             try:
                 logger.debug("Calling command '%s'", self.command)
+                command_start_datetime = timezone.now()
                 if self.raw_command and not getattr(settings, 'CHRONIKER_DISABLE_RAW_COMMAND', False):
                     completed_process = subprocess.run(
                         shlex.split(self.raw_command), capture_output=True, check=True, text=True
@@ -1030,6 +1388,7 @@ class Job(models.Model):
                 logger.debug("Command '%s' completed", self.command)
                 if original_pid != os.getpid():
                     return
+                context.flush()
             except Exception as e:
                 if original_pid != os.getpid():
                     return
@@ -1044,26 +1403,13 @@ class Job(models.Model):
                 heartbeat.stop()
                 heartbeat.join()
 
-            # If this was a forced run, then don't update the
-            # next_run date.
-            # next_run = self.next_run.replace(tzinfo=None)
-            next_run = self.next_run
-            if not self.force_run:
-                print(f"Determining 'next_run' for job {self.id}...")
-                if next_run < timezone.now():
-                    next_run = timezone.now()
-                _next_run = next_run
-                next_run = self.rrule.after(next_run)
-                print(_next_run, next_run)
-                assert next_run != _next_run, 'RRule failed to increment next run datetime.'
-            # next_run = next_run.replace(tzinfo=timezone.get_current_timezone())
+            next_run = self.get_next_run_after_run()
 
             last_run_successful = not bool(stderr.length)
 
             try:
                 with lock:
-                    Job.objects.update()
-                    job = Job.objects.only('id', 'total_parts', 'last_run_successful').get(id=self.id)
+                    job = Job.objects.select_related('runtime').only('id', 'last_run_successful', 'runtime__total_parts').get(id=self.id)
                     tpc = (job.last_run_successful and job.total_parts) or 0 # pylint: disable=E0601
                     Job.objects.filter(id=self.id).update(
                         is_running=False,
@@ -1072,8 +1418,8 @@ class Job(models.Model):
                         force_run=False,
                         next_run=next_run,
                         last_run_successful=last_run_successful,
-                        total_parts_complete=tpc,
                     )
+                    JobRuntime.set_state([self.id], total_parts_complete=tpc)
             except Exception as e:
                 # The command failed to run; log the exception
                 t = loader.get_template('chroniker/error_message.txt')
@@ -1090,6 +1436,8 @@ class Job(models.Model):
             sys.stdout = ostdout
             sys.stderr = ostderr
 
+            set_current_context(None)
+
             # Record run log.
             print('Recording log...')
 
@@ -1124,45 +1472,18 @@ class Job(models.Model):
                 stdout=stdout_str,
                 stderr=stderr_str,
                 success=last_run_successful,
+                scheduled_datetime=scheduled_datetime,
+                claimed_datetime=claimed_datetime,
+                process_start_datetime=process_start_datetime,
+                command_start_datetime=command_start_datetime,
+                **resource_monitor.finish()
             )
 
-            # Email subscribers.
-            try:
-                if last_run_successful:
-                    if self.email_success_to_subscribers:
-                        log.email_subscribers()
-                else:
-                    if self.email_errors_to_subscribers:
-                        log.email_subscribers()
-            except Exception as e:
-                print('Error emailing subscribers: %s' % e, file=sys.stderr)
-                traceback.print_exc()
-
-            # Call successful callback.
-            try:
-                if self.callback_success_to_subscribers:
-                    if last_run_successful and job.callbacks.all():
-                        for callback in job.callbacks.all():
-                            cb = import_string(callback.reference)
-                            cb(self, stdout=stdout_str, stderr=stderr_str)
-            except Exception as e:
-                print('Error executing callback: %s' % e, file=sys.stderr)
-                traceback.print_exc()
-
-            # Call error callback.
-            try:
-                if self.callback_errors_to_subscribers:
-                    if not last_run_successful and job.callbacks.all():
-                        for callback in job.callbacks.all():
-                            cb = import_string(callback.reference)
-                            cb(self, stdout=stdout_str, stderr=stderr_str)
-            except Exception as e:
-                print('Error executing callback: %s' % e, file=sys.stderr)
-                traceback.print_exc()
+            self.notify_subscribers(log, stdout=stdout_str, stderr=stderr_str)
+            self.trim_logs()
 
             # If an exception occurs above, ensure we unmark is_running.
             with lock:
-                Job.objects.update()
                 job = Job.objects.get(id=self.id)
                 if job.is_running:
                     # This should only be reached if an error ocurred above.
@@ -1172,6 +1493,62 @@ class Job(models.Model):
 
             print('Job done.')
 
+    def get_next_run_after_run(self):
+        """
+        Returns the next_run to record once a run finishes. Forced runs don't
+        advance the schedule.
+        """
+        next_run = self.next_run
+        if not self.force_run:
+            print(f"Determining 'next_run' for job {self.id}...")
+            if next_run < timezone.now():
+                next_run = timezone.now()
+            _next_run = next_run
+            next_run = self.rrule.after(next_run)
+            print(_next_run, next_run)
+            assert next_run != _next_run, 'RRule failed to increment next run datetime.'
+        return next_run
+
+    def notify_subscribers(self, log, stdout='', stderr=''):
+        """
+        Emails subscribers and calls callbacks about a finished run's log,
+        as configured for its outcome.
+        """
+        # Email subscribers, or queue the emails to be sent separately.
+        email_subscribers = log.enqueue_notifications if _settings.CHRONIKER_EMAIL_OUTBOX else log.email_subscribers
+        try:
+            if log.success:
+                if self.email_success_to_subscribers:
+                    email_subscribers()
+            else:
+                if self.email_errors_to_subscribers:
+                    email_subscribers()
+        except Exception as e:
+            print('Error emailing subscribers: %s' % e, file=sys.stderr)
+            traceback.print_exc()
+
+        # Call the success or error callbacks.
+        if log.success:
+            call_callbacks = self.callback_success_to_subscribers
+        else:
+            call_callbacks = self.callback_errors_to_subscribers
+        if call_callbacks:
+            references = [callback.reference for callback in self.callbacks.all()]
+            if references:
+
+                def record(results):
+                    for result in results:
+                        if not result['success']:
+                            print('Error executing callback %s: %s' % (result['reference'], result['error']), file=sys.stderr)
+                    Log.objects.filter(id=log.id).update(callback_results=results)
+                    log.callback_results = results
+
+                if _settings.CHRONIKER_CALLBACK_BACKGROUND:
+                    # Don't hold up the finished run while the callbacks run.
+                    CallbackDispatcher().start(references, self, stdout=stdout, stderr=stderr, on_done=record)
+                else:
+                    record(CallbackDispatcher().run(references, self, stdout=stdout, stderr=stderr))
+
     def check_is_running(self):
         """
         This function actually checks to ensure that a job is running.
@@ -1200,11 +1577,55 @@ class Job(models.Model):
 
     @classmethod
     def update_progress(cls, *args, **kwargs):
+        context = get_current_context()
+        if context:
+            return context.update_progress(*args, **kwargs)
         heartbeat = get_current_heartbeat()
         if heartbeat:
             return heartbeat.update_progress(*args, **kwargs)
 
 
+class JobRuntime(models.Model):
+    """
+    The state of a job's run that's rewritten while it runs.
+
+    Heartbeats and progress updates write here instead of to the job, so they
+    don't contend with, or get overwritten by, saves of the job's definition.
+    """
+
+    job = models.OneToOneField(Job, related_name='runtime', primary_key=True, on_delete=models.CASCADE)
+
+    last_heartbeat = models.DateTimeField(_("last heartbeat"), editable=False, blank=True, null=True)
+
+    total_parts = models.PositiveIntegerField(default=0, editable=False, blank=False, null=False, help_text=_('The total number of parts of the task.'))
+
+    total_parts_complete = models.PositiveIntegerField(default=0, editable=False, blank=False, null=False, help_text=_('The total number of complete parts.'))
+
+    progress_rate = models.FloatField(
+        blank=True, null=True, editable=False, help_text=_('The smoothed number of parts completed per second during the current run.')
+    )
+
+    class Meta:
+        verbose_name = _('job runtime')
+
+    def __str__(self):
+        return str(self.job)
+
+    @classmethod
+    def set_state(cls, job_ids, **fields):
+        """
+        Sets the runtime fields of the given jobs, creating any missing rows.
+        """
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        if cls.objects.filter(job_id__in=job_ids).update(**fields) < len(job_ids):
+            cls.objects.bulk_create([cls(job_id=job_id, **fields) for job_id in job_ids], ignore_conflicts=True)
+            # Rows created by another writer since the first update were skipped
+            # by the insert, so update them again.
+            cls.objects.filter(job_id__in=job_ids).update(**fields)
+
+
 class Log(models.Model):
     """
     A record of stdout and stderr of a ``Job``.
@@ -1237,6 +1658,48 @@ class Log(models.Model):
         )
     )
 
+    scheduled_datetime = models.DateTimeField(
+        editable=False, blank=True, null=True, help_text=_('The next run time the job was scheduled for. Empty for forced runs.')
+    )
+
+    claimed_datetime = models.DateTimeField(editable=False, blank=True, null=True, help_text=_('When the scheduler marked the job as running.'))
+
+    process_start_datetime = models.DateTimeField(editable=False, blank=True, null=True, help_text=_('When the process running the job started.'))
+
+    command_start_datetime = models.DateTimeField(editable=False, blank=True, null=True, help_text=_('When the job\'s command was invoked.'))
+
+    cpu_user_seconds = models.FloatField(editable=False, blank=True, null=True, help_text=_('User CPU time used by the job\'s process tree.'))
+
+    cpu_system_seconds = models.FloatField(editable=False, blank=True, null=True, help_text=_('System CPU time used by the job\'s process tree.'))
+
+    peak_rss_bytes = models.PositiveBigIntegerField(
+        editable=False, blank=True, null=True, help_text=_('The largest resident memory observed for the job\'s process tree.')
+    )
+
+    read_bytes = models.PositiveBigIntegerField(editable=False, blank=True, null=True, help_text=_('Bytes read from storage by the job\'s process tree.'))
+
+    write_bytes = models.PositiveBigIntegerField(editable=False, blank=True, null=True, help_text=_('Bytes written to storage by the job\'s process tree.'))
+
+    max_child_processes = models.PositiveIntegerField(
+        editable=False, blank=True, null=True, help_text=_('The largest number of child processes observed at once.')
+    )
+
+    kill_seconds = models.FloatField(
+        editable=False, blank=True, null=True, help_text=_('Seconds taken to terminate the job\'s processes after a timeout.')
+    )
+
+    processes_reaped = models.PositiveIntegerField(
+        editable=False, blank=True, null=True, help_text=_('The number of processes terminated after a timeout.')
+    )
+
+    kill_escalated = models.BooleanField(
+        editable=False, blank=True, null=True, help_text=_('If checked, processes ignored the termination signal and had to be killed.')
+    )
+
+    callback_results = models.JSONField(
+        editable=False, blank=True, null=True, help_text=_('The reference, seconds taken, success and error of each callback called after the run.')
+    )
+
     class Meta:
         ordering = ('-run_start_datetime',)
 
@@ -1254,8 +1717,16 @@ class Log(models.Model):
             assert self.run_start_datetime <= self.run_end_datetime, 'Job must start before it ends.'
             time_diff = (self.run_end_datetime - self.run_start_datetime)
             self.duration_seconds = time_diff.total_seconds()
+        adding = self._state.adding
         super().save(**kwargs)
 
+        # Maintain the job's run counters, which outlive log deletion.
+        if adding:
+            Job.objects.filter(id=self.job_id).update(
+                run_count=F('run_count') + 1,
+                failure_count=F('failure_count') + (0 if self.success else 1),
+            )
+
     def duration_str(self):
         sec = timedelta(seconds=self.duration_seconds)
         d = datetime(1, 1, 1) + sec
@@ -1268,12 +1739,21 @@ class Log(models.Model):
     duration_str.short_description = 'duration (days:hours:min:sec)'
     duration_str.allow_tags = True
 
-    def email_subscribers(self):
-        current_site = Site.objects.get_current()
+    @property
+    def dispatch_lag_seconds(self):
+        """
+        Returns the number of seconds between when the job was scheduled to
+        run and when its command actually started.
+        """
+        if not self.scheduled_datetime or not self.command_start_datetime:
+            return
+        return (self.command_start_datetime - self.scheduled_datetime).total_seconds()
 
-        subscribers = []
-        for user in self.job.subscribers.all():
-            subscribers.append('"%s" <%s>' % (user.get_full_name(), user.email))
+    def render_email(self):
+        """
+        Returns the subject and body of the email about this log.
+        """
+        current_site = Site.objects.get_current()
 
         is_error = bool((self.stderr or '').strip())
         if is_error:
@@ -1286,10 +1766,10 @@ class Log(models.Model):
         args['stderr'] = self.stderr if self.job.is_monitor else None
         args['url'] = mark_safe('http://%s%s' % (current_site.domain, self.job.monitor_url_rendered))
         ctx = Context(args)
-        subject = Template(subject_tmpl).render(ctx)
+        subject = get_compiled_template(subject_tmpl).render(ctx)
 
         if is_error and self.job.is_monitor and self.job.monitor_error_template:
-            body = Template(self.job.monitor_error_template).render(ctx)
+            body = get_compiled_template(self.job.monitor_error_template).render(ctx)
         else:
             stdout_str = self.stdout
             try:
@@ -1318,13 +1798,30 @@ class Log(models.Model):
             admin_link = base_url + utils.get_admin_change_url(self.job)
             body = 'To manage this job please visit: ' + admin_link + '\n\n' + body
 
+        return subject, body
+
+    def get_subscriber_addresses(self):
+        return ['"%s" <%s>' % (user.get_full_name(), user.email) for user in self.job.subscribers.all()]
+
+    def email_subscribers(self):
+        subject, body = self.render_email()
         send_mail(
-            from_email='"%s" <%s>' % (_settings.CHRONIKER_EMAIL_SENDER, _settings.CHRONIKER_EMAIL_HOST_USER),
+            from_email=get_email_sender(),
             subject=subject,
-            recipient_list=subscribers,
+            recipient_list=self.get_subscriber_addresses(),
             message=body,
         )
 
+    def enqueue_notifications(self):
+        """
+        Queues an email about this log to each subscriber, to be sent by the
+        ``cron_send_notifications`` command.
+        """
+        is_error = bool((self.stderr or '').strip())
+        Notification.objects.bulk_create([
+            Notification(log=self, recipient=recipient, is_error=is_error) for recipient in self.get_subscriber_addresses()
+        ])
+
     def stdout_sample(self):
         result = self.stdout or ''
         if len(result) > 40:
@@ -1350,14 +1847,286 @@ class Log(models.Model):
     @classmethod
     def cleanup(cls, time_ago=None):
         """
-        Deletes all log entries older than the given date.
+        Deletes all log entries older than the given date, except those with
+        emails still queued.
         """
-        q = cls.objects.all()
+        q = cls.objects.exclude(notifications__isnull=False)
         if time_ago:
             q = q.filter(run_start_datetime__lte=time_ago)
         q.delete()
 
 
+class Notification(models.Model):
+    """
+    An email about a log, queued for one subscriber.
+    """
+
+    log = models.ForeignKey(Log, related_name='notifications', on_delete=models.CASCADE)
+
+    recipient = models.CharField(max_length=700, editable=False, help_text=_('The address the email is sent to.'))
+
+    is_error = models.BooleanField(default=False, editable=False, help_text=_('If checked, the log is of a failed run.'))
+
+    created_datetime = models.DateTimeField(editable=False, db_index=True, default=timezone.now)
+
+    send_attempts = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_('The number of failed attempts to send the email. It\'s dropped after CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS.')
+    )
+
+    last_error = models.TextField(blank=True, editable=False, help_text=_('The error from the last failed attempt to send the email.'))
+
+    class Meta:
+        ordering = ('send_attempts', 'id')
+
+    def __str__(self):
+        return '%s - %s' % (self.recipient, self.log)
+
+
+class SchedulerTick(models.Model):
+    """
+    A record of one pass of the ``cron`` command's scheduling loop.
+    """
+
+    hostname = models.CharField(max_length=700, editable=False, help_text=_('The hostname the scheduler ran on.'))
+
+    start_datetime = models.DateTimeField(editable=False, db_index=True, default=timezone.now)
+
+    end_datetime = models.DateTimeField(editable=False, blank=True, null=True, help_text=_('When all jobs dispatched by this tick completed.'))
+
+    planning_seconds = models.FloatField(editable=False, blank=True, null=True, help_text=_('The number of seconds spent finding due jobs.'))
+
+    jobs_dispatched = models.PositiveIntegerField(default=0, editable=False)
+
+    connection_opens = models.PositiveIntegerField(default=0, editable=False, help_text=_('The number of database connections opened.'))
+
+    jobs_evaluated = models.PositiveIntegerField(default=0, editable=False, help_text=_('The number of due jobs checked for dispatch.'))
+
+    jobs_skipped = models.PositiveIntegerField(default=0, editable=False, help_text=_('The number of due jobs not dispatched because of unmet dependencies.'))
+
+    queries = models.PositiveIntegerField(default=0, editable=False, help_text=_('The number of database queries made by the scheduler.'))
+
+    phases = models.JSONField(
+        default=dict, editable=False, blank=True, help_text=_('The seconds and database queries spent in each phase of the tick, keyed by phase name.')
+    )
+
+    class Meta:
+        ordering = ('-start_datetime',)
+
+    def __str__(self):
+        return '%s - %s' % (self.hostname, self.start_datetime)
+
+    @classmethod
+    def cleanup(cls):
+        """
+        Deletes ticks older than ``CHRONIKER_TICK_HISTORY_DAYS``.
+        """
+        cutoff = timezone.now() - timedelta(days=_settings.CHRONIKER_TICK_HISTORY_DAYS)
+        cls.objects.filter(start_datetime__lt=cutoff).delete()
+
+
+class WorkerHost(models.Model):
+    """
+    A host running schedulers, and its load as of its last heartbeat.
+    """
+
+    hostname = models.CharField(max_length=700, unique=True, editable=False)
+
+    group = models.CharField(max_length=200, blank=True, default='', db_index=True, editable=False, help_text=_('The host group the host claims jobs for.'))
+
+    last_heartbeat = models.DateTimeField(editable=False, db_index=True, default=timezone.now)
+
+    capacity = models.PositiveIntegerField(default=0, editable=False, help_text=_('The number of jobs the host runs at once.'))
+
+    running_count = models.PositiveIntegerField(default=0, editable=False, help_text=_('The number of jobs the host was running.'))
+
+    cpu_count = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
+    load_average = models.FloatField(blank=True, null=True, editable=False, help_text=_("The host's one minute load average."))
+
+    free_memory = models.BigIntegerField(blank=True, null=True, editable=False, help_text=_('The number of bytes of memory available on the host.'))
+
+    draining = models.BooleanField(
+        default=False, help_text=_("If checked, the host finishes the jobs it's running, but its group's jobs are placed on its other hosts.")
+    )
+
+    class Meta:
+        ordering = ('group', 'hostname')
+
+    def __str__(self):
+        return self.hostname
+
+    @classmethod
+    def heartbeat(cls, group=None, capacity=None):
+        """
+        Records that this host is live in the given group, or ``CHRONIKER_HOST_GROUP``,
+        along with its capacity and current load.
+        """
+        if group is None:
+            group = _settings.CHRONIKER_HOST_GROUP
+        cpu_count = os.cpu_count()
+        capacity = capacity or _settings.CHRONIKER_HOST_CAPACITY or _settings.CHRONIKER_MAX_PROCESSES or cpu_count or 1
+        hostname = socket.gethostname()
+        fields = dict(
+            group=group or '',
+            last_heartbeat=timezone.now(),
+            capacity=capacity,
+            running_count=Job.objects.filter(is_running=True, current_hostname=hostname).count(),
+            cpu_count=cpu_count,
+            load_average=os.getloadavg()[0] if hasattr(os, 'getloadavg') else None,
+            free_memory=psutil.virtual_memory().available,
+        )
+        if not cls.objects.filter(hostname=hostname).update(**fields):
+            cls.objects.bulk_create([cls(hostname=hostname, **fields)], ignore_conflicts=True)
+
+    @classmethod
+    def get_live(cls, group):
+        """
+        Returns the hosts in the group with a heartbeat within
+        ``CHRONIKER_HOST_TIMEOUT_SECONDS`` that aren't draining.
+        """
+        cutoff = timezone.now() - timedelta(seconds=_settings.CHRONIKER_HOST_TIMEOUT_SECONDS)
+        return cls.objects.filter(group=group, last_heartbeat__gte=cutoff, draining=False)
+
+    @classmethod
+    def get_live_hostnames(cls, group):
+        return list(cls.get_live(group).values_list('hostname', flat=True))
+
+
+class SchedulerLease(models.Model):
+    """
+    A named lease held by one host at a time, such as the planner's.
+    """
+
+    name = models.CharField(max_length=100, unique=True, editable=False)
+
+    holder = models.CharField(max_length=700, blank=True, default='', editable=False, help_text=_('The host holding the lease.'))
+
+    acquired_datetime = models.DateTimeField(blank=True, null=True, editable=False, help_text=_('When the holder took the lease.'))
+
+    expires_datetime = models.DateTimeField(editable=False, default=timezone.now, help_text=_('When the lease lapses unless renewed.'))
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def acquire(cls, name, seconds, holder=None):
+        """
+        Takes or renews the lease for the given number of seconds, returning
+        true if the holder now holds it.
+
+        Uses a single conditional update, so only one holder can take a lapsed
+        lease, on any backend.
+        """
+        holder = holder or socket.gethostname()
+        now = timezone.now()
+        expires = now + timedelta(seconds=seconds)
+        lapsed = Q(expires_datetime__lt=now) | Q(holder='')
+        if cls.objects.filter(name=name, holder=holder).exclude(lapsed).update(expires_datetime=expires):
+            return True
+        if cls.objects.filter(lapsed, name=name).update(holder=holder, acquired_datetime=now, expires_datetime=expires):
+            return True
+        # The lease may not exist yet.
+        cls.objects.bulk_create([cls(name=name, holder=holder, acquired_datetime=now, expires_datetime=expires)], ignore_conflicts=True)
+        return cls.objects.filter(name=name, holder=holder, expires_datetime=expires).exists()
+
+    @classmethod
+    def release(cls, name, holder=None):
+        """
+        Gives up the lease, if the holder holds it, so another can take it immediately.
+        """
+        holder = holder or socket.gethostname()
+        cls.objects.filter(name=name, holder=holder).update(holder='', expires_datetime=timezone.now())
+
+
+class DispatchEntry(models.Model):
+    """
+    A due job queued by the planner, waiting to be claimed and run by an
+    executor.
+    """
+
+    job = models.OneToOneField(Job, related_name='dispatch_entry', on_delete=models.CASCADE)
+
+    target_hostname = models.CharField(
+        max_length=700, blank=True, default='', db_index=True, editable=False, help_text=_('If set, only this host may claim the job.')
+    )
+
+    queued_datetime = models.DateTimeField(editable=False, default=timezone.now)
+
+    claimed_by = models.CharField(max_length=700, blank=True, default='', editable=False, help_text=_('The host that claimed the job.'))
+
+    claimed_datetime = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name_plural = _('dispatch entries')
+
+    def __str__(self):
+        return str(self.job)
+
+
+class MonitorRecord(models.Model):
+    """
+    The number of records a monitor found at one check.
+    """
+
+    job = models.ForeignKey(Job, related_name='monitor_history', on_delete=models.CASCADE)
+
+    timestamp = models.DateTimeField(editable=False, default=timezone.now)
+
+    records = models.IntegerField(editable=False, blank=True, null=True, help_text=_('The number of records that needed attention, if counted.'))
+
+    duration_seconds = models.FloatField(editable=False, blank=True, null=True, help_text=_('The number of seconds the check took.'))
+
+    class Meta:
+        ordering = ('-timestamp',)
+        indexes = [models.Index(fields=['job', 'timestamp'])]
+
+    def __str__(self):
+        return '%s - %s: %s' % (self.job.name, self.timestamp, self.records)
+
+    @classmethod
+    def get_recent(cls, job_ids, count):
+        """
+        Returns {job_id: [records]}, the counts of each monitor's latest checks,
+        newest first, in one query.
+        """
+        rows = cls.objects\
+            .filter(job_id__in=job_ids)\
+            .annotate(row_number=Window(RowNumber(), partition_by=F('job_id'), order_by=F('timestamp').desc()))\
+            .filter(row_number__lte=count)\
+            .order_by('job_id', 'row_number')\
+            .values_list('job_id', 'records')
+        recent = {}
+        for job_id, records in rows:
+            recent.setdefault(job_id, []).append(records)
+        return recent
+
+    @classmethod
+    def cleanup(cls, now=None):
+        """
+        Keeps every check from the last ``CHRONIKER_MONITOR_HISTORY_RAW_DAYS``,
+        only the check with the most records in each hour before that, and
+        nothing older than ``CHRONIKER_MONITOR_HISTORY_DAYS``.
+        """
+        now = now or timezone.now()
+        cls.objects.filter(timestamp__lt=now - timedelta(days=_settings.CHRONIKER_MONITOR_HISTORY_DAYS)).delete()
+        extra_ids = cls.objects\
+            .filter(timestamp__lt=now - timedelta(days=_settings.CHRONIKER_MONITOR_HISTORY_RAW_DAYS))\
+            .annotate(row_number=Window(
+                RowNumber(),
+                partition_by=[F('job_id'), TruncHour('timestamp')],
+                order_by=[F('records').desc(nulls_last=True), F('timestamp').desc()],
+            ))\
+            .filter(row_number__gt=1)\
+            .values_list('id', flat=True)
+        extra_ids = list(extra_ids)
+        for i in range(0, len(extra_ids), 1000):
+            cls.objects.filter(id__in=extra_ids[i:i + 1000]).delete()
+        return len(extra_ids)
+
+
 class MonitorManager(models.Manager):
 
     def all(self):
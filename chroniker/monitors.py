@@ -0,0 +1,354 @@
+"""
+Evaluates monitors in a single process.
+
+A monitor is a ``check_monitor`` job whose args name the modules to import and
+a query whose records require attention. Run as ordinary jobs, every check
+starts its own process. ``run_monitors()`` instead evaluates many monitors at
+once, compiling each distinct import and query only once per process, counting
+each query once with the monitor's counting strategy, and recording the results
+in bulk.
+"""
+import json
+import os
+import socket
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, connections
+from django.db.models import F
+from django.utils import timezone
+
+from chroniker import constants as c, dispatch, utils
+from chroniker.models import Job, JobRuntime, Log, MonitorRecord
+
+from . import settings as _settings
+
+_compiled = {} # {(imports, query):(namespace, code)}
+
+
+def parse_imports(imports):
+    """
+    Returns the import statements for a monitor's imports, a pipe-delimited
+    list of ``module``, ``module,name`` or ``module,name,alias``.
+    """
+    statements = []
+    for imp in imports.strip().split('|'):
+        imp_parts = tuple(imp.split(','))
+        if len(imp_parts) == 1:
+            statements.append('import %s' % imp_parts)
+        elif len(imp_parts) == 2:
+            statements.append('from %s import %s' % imp_parts)
+        elif len(imp_parts) == 3:
+            statements.append('from %s import %s as %s' % imp_parts)
+        else:
+            raise Exception('Invalid import: %s' % (imp,))
+    return statements
+
+
+def compile_monitor(imports, query):
+    """
+    Returns the namespace of the given imports and the compiled query, doing
+    the work only once per process for each distinct monitor.
+    """
+    key = (imports, query)
+    if key not in _compiled:
+        namespace = {}
+        for statement in parse_imports(imports):
+            exec(statement, namespace) # pylint: disable=exec-used
+        _compiled[key] = (namespace, compile(query, '<monitor>', 'eval'))
+    return _compiled[key]
+
+
+def evaluate_monitor(imports, query):
+    """
+    Returns the queryset of records a monitor reports.
+    """
+    namespace, code = compile_monitor(imports, query)
+    # Copy the namespace, so a query can't change it for later evaluations.
+    return eval(code, dict(namespace)) # pylint: disable=W0123
+
+
+def estimate_count(q):
+    """
+    Returns the database's query planner estimate of the number of records in
+    the queryset, or None if the backend doesn't provide one.
+    """
+    conn = connections[q.db]
+    if conn.vendor == 'postgresql':
+        plan = json.loads(q.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    if conn.vendor == 'mysql':
+        sql, params = q.query.sql_with_params()
+        with conn.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [_[0].lower() for _ in cursor.description]
+            row = cursor.fetchone()
+        if row is not None and 'rows' in columns:
+            return int(row[columns.index('rows')] or 0)
+    return None
+
+
+def count_records(q, strategy=c.COUNT_EXACT, cap=None):
+    """
+    Counts the records in the queryset in at most two queries, using the given
+    strategy.
+
+    Returns the count and the strategy actually used, since estimates fall
+    back to capped counts on backends without one, and capped counts without
+    a cap only check whether there are any records, rather than count them all.
+    """
+    if strategy == c.COUNT_EXACT:
+        return q.count(), strategy
+    if strategy == c.COUNT_ESTIMATED:
+        # Planners rarely estimate zero rows, so check for any first.
+        if not q.exists():
+            return 0, strategy
+        estimate = estimate_count(q)
+        if estimate is not None:
+            return max(estimate, 1), strategy
+        strategy = c.COUNT_CAPPED
+    if strategy == c.COUNT_CAPPED and cap:
+        return q[:cap + 1].count(), strategy
+    return int(q.exists()), c.COUNT_EXISTS
+
+
+def format_records(records, strategy=c.COUNT_EXACT, cap=None):
+    if strategy == c.COUNT_EXISTS and records:
+        return 'Records require attention.'
+    if strategy == c.COUNT_CAPPED and cap and records > cap:
+        return 'More than %i records require attention.' % cap
+    if strategy == c.COUNT_ESTIMATED and records:
+        return 'About %i records require attention.' % records
+    return '%i records require attention.' % records
+
+
+def get_monitor_options(job):
+    """
+    Returns the imports and query given in a ``check_monitor`` job's args.
+    """
+    _, options = job.get_args()
+    imports = options.get('imports') or options.get('--imports')
+    query = options.get('query') or options.get('--query')
+    return imports, query
+
+
+class MonitorResult:
+    """
+    The outcome of evaluating one monitor.
+    """
+
+    def __init__(self, job, start_datetime):
+        self.job = job
+        self.start_datetime = start_datetime
+        self.end_datetime = None
+        self.records = None
+        self.strategy = None
+        self.cap = None
+        self.error = ''
+        # Whether the count should fail the monitor, by default if it's non-zero.
+        self.alert = False
+
+    @property
+    def success(self):
+        return not self.error and not self.alert
+
+
+def get_history_depth(jobs):
+    """
+    Returns the number of previous checks needed to apply the given monitors' alert rules.
+    """
+    depth = 0
+    for job in jobs:
+        if job.monitor_alert_increase:
+            depth = max(depth, 1)
+        if job.monitor_alert_sustained_checks:
+            depth = max(depth, job.monitor_alert_sustained_checks - 1)
+    return depth
+
+
+def should_alert(job, records, previous=()):
+    """
+    Returns true if a monitor's count should fail it, given the counts of its
+    previous checks, newest first.
+
+    A monitor fails when its count rose by at least its alert increase since
+    the previous check, or when its count has been over its alert threshold
+    for its number of sustained checks. Without a threshold, monitors with an
+    increase only fail on increases, and others fail on any records.
+    """
+    previous = list(previous)
+    increase = job.monitor_alert_increase
+    if increase and previous and previous[0] is not None and records - previous[0] >= increase:
+        return True
+    if job.monitor_alert_threshold is None and increase:
+        return False
+    threshold = job.monitor_alert_threshold or 0
+    sustained_checks = job.monitor_alert_sustained_checks or 1
+    counts = [records] + previous[:sustained_checks - 1]
+    if len(counts) < sustained_checks:
+        return False
+    return all(count is not None and count > threshold for count in counts)
+
+
+def get_count_strategy(job, cap=None):
+    """
+    Returns the counting strategy and cap to use for a monitor job.
+
+    A monitor with an exact count is capped if a default cap is given, or
+    CHRONIKER_MONITOR_COUNT_CAP if none is.
+    """
+    if cap is None:
+        cap = _settings.CHRONIKER_MONITOR_COUNT_CAP
+    strategy = job.monitor_count_strategy or c.COUNT_EXACT
+    cap = job.monitor_count_cap or cap
+    if strategy == c.COUNT_EXACT and cap:
+        strategy = c.COUNT_CAPPED
+    return strategy, cap
+
+
+def check_monitor(job, cap=None, timeout_seconds=None):
+    """
+    Evaluates a monitor job, returning its ``MonitorResult``.
+    """
+    result = MonitorResult(job, timezone.now())
+    try:
+        imports, query = get_monitor_options(job)
+        assert imports, 'No imports specified.'
+        assert query, 'No query specified.'
+        strategy, result.cap = get_count_strategy(job, cap=cap)
+        with utils.statement_timeout(timeout_seconds):
+            result.records, result.strategy = count_records(evaluate_monitor(imports, query), strategy=strategy, cap=result.cap)
+        result.alert = bool(result.records)
+    except Exception: # pylint: disable=broad-except
+        result.error = traceback.format_exc()
+    result.end_datetime = timezone.now()
+    return result
+
+
+def _check_monitor_in_thread(job, cap=None, timeout_seconds=None):
+    try:
+        return check_monitor(job, cap=cap, timeout_seconds=timeout_seconds)
+    finally:
+        # Release this thread's connection.
+        connection.close()
+
+
+def record_results(results):
+    """
+    Applies the monitors' alert rules, updates their jobs, and creates their
+    logs and history in bulk, then notifies their subscribers.
+    """
+    logs = []
+    hostname = socket.gethostname()
+    depth = get_history_depth([_.job for _ in results])
+    recent = MonitorRecord.get_recent([_.job.id for _ in results], depth) if depth else {}
+    for result in results:
+        job = result.job
+        if not result.error:
+            result.alert = should_alert(job, result.records, recent.get(job.id, []))
+        stdout = stderr = ''
+        if result.error:
+            stderr = result.error
+        elif result.alert:
+            stderr = format_records(result.records, strategy=result.strategy, cap=result.cap) + '\n'
+        else:
+            stdout = format_records(result.records, strategy=result.strategy, cap=result.cap) + '\n'
+        job.next_run = job.get_next_run_after_run()
+        job.monitor_records = result.records
+        job.monitor_records_strategy = result.strategy
+        job.is_running = False
+        job.lock_file = ''
+        job.current_pid = None
+        job.last_run = result.start_datetime
+        job.last_run_successful = result.success
+        job.force_run = False
+        logs.append(
+            Log(
+                job=job,
+                run_start_datetime=result.start_datetime,
+                run_end_datetime=result.end_datetime,
+                duration_seconds=(result.end_datetime - result.start_datetime).total_seconds(),
+                hostname=hostname,
+                stdout=stdout if job.log_stdout else '',
+                stderr=stderr if job.log_stderr else '',
+                success=result.success,
+                process_start_datetime=result.start_datetime,
+                command_start_datetime=result.start_datetime,
+            )
+        )
+    Job.objects.bulk_update(
+        [_.job for _ in results],
+        ['next_run', 'monitor_records', 'monitor_records_strategy', 'is_running', 'lock_file', 'current_pid', 'last_run', 'last_run_successful', 'force_run'],
+    )
+    for result in results:
+        result.job.snapshot_fields()
+    if connection.features.can_return_rows_from_bulk_insert:
+        logs = Log.objects.bulk_create(logs)
+        # Bulk creation skips Log.save(), which maintains the run counters.
+        for success in (True, False):
+            job_ids = [_.job.id for _ in results if _.success == success]
+            if job_ids:
+                Job.objects.filter(id__in=job_ids).update(
+                    run_count=F('run_count') + 1,
+                    failure_count=F('failure_count') + (0 if success else 1),
+                )
+    else:
+        # Without the new logs' ids, their callback results and notifications
+        # couldn't be recorded, so create them one at a time.
+        for log in logs:
+            log.save()
+    MonitorRecord.objects.bulk_create([
+        MonitorRecord(
+            job=result.job,
+            timestamp=result.start_datetime,
+            records=result.records,
+            duration_seconds=(result.end_datetime - result.start_datetime).total_seconds(),
+        ) for result in results
+    ])
+    for log in logs:
+        log.job.notify_subscribers(log, stdout=log.stdout, stderr=log.stderr)
+        log.job.trim_logs()
+    return logs
+
+
+def run_monitors(jobs, workers=None, cap=None, timeout_seconds=None, dispatched=False):
+    """
+    Marks the given monitor jobs as running, evaluates them, and records
+    their results, returning their ``MonitorResult``s.
+
+    If dispatched, the jobs were claimed from the dispatch queue, and are
+    removed from it once marked running.
+
+    With more than one worker, monitors are evaluated concurrently by a pool
+    of threads, each with its own database connection.
+    """
+    if workers is None:
+        workers = _settings.CHRONIKER_MONITOR_WORKERS
+    if cap is None:
+        cap = _settings.CHRONIKER_MONITOR_COUNT_CAP
+    if timeout_seconds is None:
+        timeout_seconds = _settings.CHRONIKER_MONITOR_TIMEOUT_SECONDS
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    now = timezone.now()
+    Job.objects.filter(id__in=[_.id for _ in jobs]).update(
+        is_running=True,
+        last_run_start_timestamp=now,
+        current_hostname=socket.gethostname(),
+        last_hostname=socket.gethostname(),
+        current_pid=str(os.getpid()),
+    )
+    JobRuntime.set_state([_.id for _ in jobs], last_heartbeat=now)
+    if dispatched:
+        dispatch.unqueue(*[_.id for _ in jobs])
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda job: _check_monitor_in_thread(job, cap=cap, timeout_seconds=timeout_seconds), jobs))
+    else:
+        results = [check_monitor(job, cap=cap, timeout_seconds=timeout_seconds) for job in jobs]
+
+    record_results(results)
+    return results
@@ -0,0 +1,114 @@
+"""
+Sends the emails queued for job subscribers when ``CHRONIKER_EMAIL_OUTBOX``
+is enabled.
+
+Queued emails are sent in batches over a single SMTP connection, and error
+emails to the same subscriber can be merged into one digest per window.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Min
+from django.utils import timezone
+
+from chroniker.models import Notification, get_email_sender
+
+from . import settings as _settings
+
+logger = logging.getLogger('chroniker.notifications')
+
+DIGEST_SEPARATOR = '\n\n' + '-' * 70 + '\n\n'
+
+
+def build_message(notifications, connection=None):
+    """
+    Returns the email for notifications to the same recipient, as a digest if
+    there are several.
+    """
+    recipient = notifications[0].recipient
+    rendered = [notification.log.render_email() for notification in notifications]
+    if len(rendered) == 1:
+        subject, body = rendered[0]
+    else:
+        names = sorted({notification.log.job.name for notification in notifications})
+        subject = '%i job errors: %s' % (len(notifications), ', '.join(names))
+        body = DIGEST_SEPARATOR.join('%s\n\n%s' % _ for _ in rendered)
+    return EmailMessage(subject=subject, body=body, from_email=get_email_sender(), to=[recipient], connection=connection)
+
+
+def _send(groups, connection):
+    """
+    Sends one email for each group of notifications, deleting those sent and
+    recording the error on those that fail. Those that have failed
+    CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS times are dropped.
+
+    Returns the number of emails sent.
+    """
+    sent = 0
+    sent_ids = []
+    failed_ids = []
+    for notifications in groups:
+        try:
+            connection.send_messages([build_message(notifications, connection=connection)])
+        except Exception as e:
+            Notification.objects.filter(id__in=[_.id for _ in notifications]).update(send_attempts=F('send_attempts') + 1, last_error=str(e))
+            failed_ids.extend(_.id for _ in notifications)
+        else:
+            sent += 1
+            sent_ids.extend(_.id for _ in notifications)
+    if sent_ids:
+        Notification.objects.filter(id__in=sent_ids).delete()
+    if failed_ids:
+        dropped = Notification.objects.filter(id__in=failed_ids, send_attempts__gte=_settings.CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS)
+        for notification in dropped:
+            logger.error('Dropping email to %s after %i failed attempts: %s', notification.recipient, notification.send_attempts, notification.last_error)
+        dropped.delete()
+    return sent
+
+
+def send_notifications(batch_size=None, digest_seconds=None, now=None, connection=None):
+    """
+    Sends all queued emails over one connection, loading at most batch_size
+    at a time.
+
+    If digest_seconds is non-zero, error emails to a subscriber are held until
+    the oldest is that old, and then sent together.
+
+    Returns the number of emails sent.
+    """
+    if batch_size is None:
+        batch_size = _settings.CHRONIKER_EMAIL_OUTBOX_BATCH_SIZE
+    if digest_seconds is None:
+        digest_seconds = _settings.CHRONIKER_EMAIL_DIGEST_SECONDS
+    now = now or timezone.now()
+    connection = connection or get_connection()
+    queued = Notification.objects.select_related('log__job')
+    sent = 0
+    with connection:
+
+        if digest_seconds:
+            cutoff = now - timedelta(seconds=digest_seconds)
+            recipients = Notification.objects\
+                .filter(is_error=True)\
+                .values('recipient')\
+                .annotate(first_created=Min('created_datetime'))\
+                .filter(first_created__lte=cutoff)\
+                .order_by('recipient')\
+                .values_list('recipient', flat=True)
+            for recipient in recipients:
+                notifications = list(queued.filter(recipient=recipient, is_error=True).order_by('id'))
+                for i in range(0, len(notifications), batch_size):
+                    sent += _send([notifications[i:i + batch_size]], connection)
+            # Error emails not yet due for a digest are left queued.
+            queued = queued.filter(is_error=False)
+
+        last_id = 0
+        while True:
+            batch = list(queued.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            sent += _send([[notification] for notification in batch], connection)
+
+    return sent
@@ -0,0 +1,54 @@
+"""
+Places the due jobs of a host group on the group's least loaded hosts, when
+``CHRONIKER_HOST_PLACEMENT`` is ``least_loaded``.
+
+Hosts report their capacity and load in ``WorkerHost`` heartbeats. Only the
+dispatch planner places jobs from those reports, so each job is placed by one
+process and queued for one host. Hosts that plan their own due jobs, without
+``CHRONIKER_DISPATCH_QUEUE``, would each see different due jobs and loads and
+could disagree, so they split their group's jobs by consistent hashing instead.
+"""
+from . import settings as _settings
+
+
+def get_host_load(host, assigned=0):
+    """
+    Returns a sortable measure of how loaded a host would be with the given
+    number of jobs assigned to it, by the share of its capacity in use, then
+    its load average per CPU, then its free memory.
+    """
+    return (
+        (host.running_count + assigned) / float(max(host.capacity, 1)),
+        (host.load_average or 0) / (host.cpu_count or 1),
+        -(host.free_memory or 0),
+        host.hostname,
+    )
+
+
+def place_jobs(jobs, hosts, prefer_last_host=None):
+    """
+    Assigns each job to the least loaded host with free capacity, or to the
+    host that last ran it if preferred and it has room.
+
+    Returns a dict of {job id: hostname}, without the jobs no host had room for.
+    """
+    if prefer_last_host is None:
+        prefer_last_host = _settings.CHRONIKER_PLACEMENT_PREFER_LAST_HOST
+    hosts = list(hosts)
+    assigned = {host.hostname: 0 for host in hosts}
+    placements = {}
+    for job in sorted(jobs, key=lambda job: job.id):
+        eligible = [
+            host for host in hosts
+            if host.running_count + assigned[host.hostname] < host.capacity and (not job.hostname or job.hostname == host.hostname)
+        ]
+        if not eligible:
+            continue
+        last_hosts = [host for host in eligible if host.hostname == job.last_hostname]
+        if prefer_last_host and last_hosts:
+            host = last_hosts[0]
+        else:
+            host = min(eligible, key=lambda host: get_host_load(host, assigned[host.hostname]))
+        assigned[host.hostname] += 1
+        placements[job.id] = host.hostname
+    return placements
@@ -64,3 +64,157 @@ CHRONIKER_STALE_MINUTES = settings.CHRONIKER_STALE_MINUTES = getattr(settings, '
 CHRONIKER_AUTO_END_STALE_JOBS = settings.CHRONIKER_AUTO_END_STALE_JOBS = getattr(settings, 'CHRONIKER_AUTO_END_STALE_JOBS', True)
 
 CHRONIKER_JOB_NK = settings.CHRONIKER_JOB_NK = getattr(settings, 'CHRONIKER_JOB_NK', ('name',))
+
+# The minimum number of seconds between database writes of a running job's
+# progress. Calls to `Job.update_progress()` made more frequently than this
+# are coalesced in memory and written by the next flush.
+CHRONIKER_PROGRESS_FLUSH_SECONDS = settings.CHRONIKER_PROGRESS_FLUSH_SECONDS = getattr(settings, 'CHRONIKER_PROGRESS_FLUSH_SECONDS', 5)
+
+# The smoothing factor, between 0 and 1, of the exponentially weighted moving
+# average used to track a job's processing rate. Higher values weight recent
+# progress more heavily.
+CHRONIKER_PROGRESS_RATE_ALPHA = settings.CHRONIKER_PROGRESS_RATE_ALPHA = getattr(settings, 'CHRONIKER_PROGRESS_RATE_ALPHA', 0.3)
+
+# The number of days of scheduler tick history to keep.
+CHRONIKER_TICK_HISTORY_DAYS = settings.CHRONIKER_TICK_HISTORY_DAYS = getattr(settings, 'CHRONIKER_TICK_HISTORY_DAYS', 7)
+
+# The number of seconds between scans for new child processes of a running
+# job when measuring its CPU usage. Already known processes are sampled on
+# every check, but finding new ones requires scanning the whole process table.
+CHRONIKER_PROCESS_DISCOVERY_SECONDS = settings.CHRONIKER_PROCESS_DISCOVERY_SECONDS = getattr(settings, 'CHRONIKER_PROCESS_DISCOVERY_SECONDS', 10)
+
+# The number of seconds a job's processes are given to exit after being asked
+# to terminate, before they're forcibly killed.
+CHRONIKER_KILL_GRACE_SECONDS = settings.CHRONIKER_KILL_GRACE_SECONDS = getattr(settings, 'CHRONIKER_KILL_GRACE_SECONDS', 5)
+
+# The minimum number of seconds between scans for stalled `manage.py cron`
+# processes on each host.
+CHRONIKER_REAP_INTERVAL_SECONDS = settings.CHRONIKER_REAP_INTERVAL_SECONDS = getattr(settings, 'CHRONIKER_REAP_INTERVAL_SECONDS', 300)
+
+# The file whose modification time records this host's last scan for stalled
+# processes.
+CHRONIKER_REAP_STAMP_FN = settings.CHRONIKER_REAP_STAMP_FN = getattr(settings, 'CHRONIKER_REAP_STAMP_FN', '/tmp/chroniker-reap.stamp')
+
+# The maximum number of seconds a process reuses its cached graph of job
+# dependencies. The cache is also cleared whenever a dependency is saved or
+# deleted by the same process, and at the start of each cron run.
+CHRONIKER_DEPENDENCY_GRAPH_CACHE_SECONDS = settings.CHRONIKER_DEPENDENCY_GRAPH_CACHE_SECONDS = getattr(settings, 'CHRONIKER_DEPENDENCY_GRAPH_CACHE_SECONDS', 60)
+
+# The percentile, from 0 to 100, of a job's recent successful run durations
+# used to estimate how long it will take when estimating a job chain.
+CHRONIKER_CHAIN_DURATION_QUANTILE = settings.CHRONIKER_CHAIN_DURATION_QUANTILE = getattr(settings, 'CHRONIKER_CHAIN_DURATION_QUANTILE', 90)
+
+# The number of recent successful runs of each job used when estimating a job chain.
+CHRONIKER_CHAIN_DURATION_SAMPLES = settings.CHRONIKER_CHAIN_DURATION_SAMPLES = getattr(settings, 'CHRONIKER_CHAIN_DURATION_SAMPLES', 20)
+
+# The number of seconds a job chain's estimate is cached, outside of live mode.
+CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS = settings.CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS = getattr(settings, 'CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS', 300)
+
+# If true, the cron command starts due jobs as soon as the jobs they depend on
+# finish during the same run, instead of waiting for the next run.
+CHRONIKER_DAG_EXECUTOR = settings.CHRONIKER_DAG_EXECUTOR = getattr(settings, 'CHRONIKER_DAG_EXECUTOR', False)
+
+# The maximum number of job processes the cron command runs at once.
+# Jobs beyond this wait until a running job finishes. Zero means no limit.
+CHRONIKER_MAX_PROCESSES = settings.CHRONIKER_MAX_PROCESSES = getattr(settings, 'CHRONIKER_MAX_PROCESSES', 0)
+
+# If true, the cron command runs raw command jobs directly from its own event
+# loop, instead of forking a process per job to run them.
+CHRONIKER_ASYNC_RAW_COMMANDS = settings.CHRONIKER_ASYNC_RAW_COMMANDS = getattr(settings, 'CHRONIKER_ASYNC_RAW_COMMANDS', False)
+
+# If true, emails to job subscribers are queued when a job finishes, and sent
+# separately by the cron_send_notifications command.
+CHRONIKER_EMAIL_OUTBOX = settings.CHRONIKER_EMAIL_OUTBOX = getattr(settings, 'CHRONIKER_EMAIL_OUTBOX', False)
+
+# The maximum number of queued emails cron_send_notifications sends per batch.
+CHRONIKER_EMAIL_OUTBOX_BATCH_SIZE = settings.CHRONIKER_EMAIL_OUTBOX_BATCH_SIZE = getattr(settings, 'CHRONIKER_EMAIL_OUTBOX_BATCH_SIZE', 100)
+
+# If non-zero, queued error emails to the same subscriber are held for up to
+# this many seconds and sent together as one digest.
+CHRONIKER_EMAIL_DIGEST_SECONDS = settings.CHRONIKER_EMAIL_DIGEST_SECONDS = getattr(settings, 'CHRONIKER_EMAIL_DIGEST_SECONDS', 0)
+
+# The number of failed attempts to send a queued email after which it's
+# dropped, so an address that always fails isn't retried forever.
+CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS = settings.CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS = getattr(settings, 'CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS', 5)
+
+# The maximum number of a job's callbacks run at once after it finishes.
+CHRONIKER_CALLBACK_WORKERS = settings.CHRONIKER_CALLBACK_WORKERS = getattr(settings, 'CHRONIKER_CALLBACK_WORKERS', 4)
+
+# The number of seconds a callback may run before it's abandoned and recorded
+# as failed, so a slow callback can't keep a finished job's process alive.
+CHRONIKER_CALLBACK_TIMEOUT_SECONDS = settings.CHRONIKER_CALLBACK_TIMEOUT_SECONDS = getattr(settings, 'CHRONIKER_CALLBACK_TIMEOUT_SECONDS', 30)
+
+# If true, a finished run starts its callbacks on a background thread instead
+# of waiting for them, so the scheduler can move on while they run.
+CHRONIKER_CALLBACK_BACKGROUND = settings.CHRONIKER_CALLBACK_BACKGROUND = getattr(settings, 'CHRONIKER_CALLBACK_BACKGROUND', True)
+
+# If true, the cron command evaluates all due check_monitor jobs itself in one
+# batch, instead of running each in its own process.
+CHRONIKER_BATCH_MONITORS = settings.CHRONIKER_BATCH_MONITORS = getattr(settings, 'CHRONIKER_BATCH_MONITORS', False)
+
+# The number of threads used to evaluate monitors in a batch.
+CHRONIKER_MONITOR_WORKERS = settings.CHRONIKER_MONITOR_WORKERS = getattr(settings, 'CHRONIKER_MONITOR_WORKERS', 1)
+
+# If non-zero, monitors in a batch stop counting records past this many.
+CHRONIKER_MONITOR_COUNT_CAP = settings.CHRONIKER_MONITOR_COUNT_CAP = getattr(settings, 'CHRONIKER_MONITOR_COUNT_CAP', 0)
+
+# The maximum number of seconds each monitor's query may run in a batch,
+# where the database supports it.
+CHRONIKER_MONITOR_TIMEOUT_SECONDS = settings.CHRONIKER_MONITOR_TIMEOUT_SECONDS = getattr(settings, 'CHRONIKER_MONITOR_TIMEOUT_SECONDS', 60)
+
+# The number of days every monitor check is kept in a monitor's history.
+# Older checks are down-sampled to the one with the most records each hour.
+CHRONIKER_MONITOR_HISTORY_RAW_DAYS = settings.CHRONIKER_MONITOR_HISTORY_RAW_DAYS = getattr(settings, 'CHRONIKER_MONITOR_HISTORY_RAW_DAYS', 7)
+
+# The number of days a monitor's history is kept.
+CHRONIKER_MONITOR_HISTORY_DAYS = settings.CHRONIKER_MONITOR_HISTORY_DAYS = getattr(settings, 'CHRONIKER_MONITOR_HISTORY_DAYS', 90)
+
+# The host group this host's schedulers claim jobs for. Jobs in a group are
+# split between the group's live hosts by consistent hashing, so each runs on
+# only one of them. Jobs outside any group can run on any host, as before.
+CHRONIKER_HOST_GROUP = settings.CHRONIKER_HOST_GROUP = getattr(settings, 'CHRONIKER_HOST_GROUP', '')
+
+# The number of seconds after its last heartbeat that a host is no longer
+# considered live, and its share of its group's jobs moves to the other hosts.
+# This should be longer than the interval cron is run at.
+CHRONIKER_HOST_TIMEOUT_SECONDS = settings.CHRONIKER_HOST_TIMEOUT_SECONDS = getattr(settings, 'CHRONIKER_HOST_TIMEOUT_SECONDS', 300)
+
+# The number of positions each host is given on its group's hash ring. More
+# positions split jobs more evenly, at the cost of a longer planning query.
+CHRONIKER_HASH_RING_REPLICAS = settings.CHRONIKER_HASH_RING_REPLICAS = getattr(settings, 'CHRONIKER_HASH_RING_REPLICAS', 64)
+
+# The maximum number of seconds a process reuses its cached hash rings. The
+# cache is also cleared at the start of each cron run.
+CHRONIKER_HASH_RING_CACHE_SECONDS = settings.CHRONIKER_HASH_RING_CACHE_SECONDS = getattr(settings, 'CHRONIKER_HASH_RING_CACHE_SECONDS', 60)
+
+# How the jobs of a host group are split between its hosts. With 'hash', each
+# job goes to a fixed host by consistent hashing. With 'least_loaded', the
+# dispatch planner queues each due job for the live host with the most free
+# capacity, as of the hosts' last heartbeats. Without CHRONIKER_DISPATCH_QUEUE,
+# 'least_loaded' falls back to 'hash'.
+CHRONIKER_HOST_PLACEMENT = settings.CHRONIKER_HOST_PLACEMENT = getattr(settings, 'CHRONIKER_HOST_PLACEMENT', 'hash')
+
+# If true, jobs placed by load go back to the host that last ran them, while
+# it has free capacity, to reuse its warm caches.
+CHRONIKER_PLACEMENT_PREFER_LAST_HOST = settings.CHRONIKER_PLACEMENT_PREFER_LAST_HOST = getattr(settings, 'CHRONIKER_PLACEMENT_PREFER_LAST_HOST', True)
+
+# The number of jobs this host runs at once, as reported to the other hosts
+# for placement. Defaults to CHRONIKER_MAX_PROCESSES, or the number of CPUs.
+CHRONIKER_HOST_CAPACITY = settings.CHRONIKER_HOST_CAPACITY = getattr(settings, 'CHRONIKER_HOST_CAPACITY', 0)
+
+# The number of seconds between a running cron process's updates of its
+# host's load.
+CHRONIKER_HOST_HEARTBEAT_SECONDS = settings.CHRONIKER_HOST_HEARTBEAT_SECONDS = getattr(settings, 'CHRONIKER_HOST_HEARTBEAT_SECONDS', 30)
+
+# If true, cron runs are split into one planner and many executors. The host
+# holding the planner lease finds the due jobs for all hosts and queues them,
+# and every cron run claims and runs queued jobs it may run.
+CHRONIKER_DISPATCH_QUEUE = settings.CHRONIKER_DISPATCH_QUEUE = getattr(settings, 'CHRONIKER_DISPATCH_QUEUE', False)
+
+# The number of seconds the planner lease lasts unless renewed. If the planner's
+# host stops running cron, another host takes over once the lease lapses.
+CHRONIKER_PLANNER_LEASE_SECONDS = settings.CHRONIKER_PLANNER_LEASE_SECONDS = getattr(settings, 'CHRONIKER_PLANNER_LEASE_SECONDS', 60)
+
+# The number of seconds after which a queued job claimed by an executor that
+# never started it is queued again.
+CHRONIKER_DISPATCH_CLAIM_TIMEOUT_SECONDS = settings.CHRONIKER_DISPATCH_CLAIM_TIMEOUT_SECONDS = getattr(settings, 'CHRONIKER_DISPATCH_CLAIM_TIMEOUT_SECONDS', 300)
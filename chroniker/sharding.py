@@ -0,0 +1,109 @@
+"""
+Splits the jobs of a host group between the group's live hosts by
+consistent hashing.
+
+Every job has a fixed position on a ring of ``RING_SIZE`` positions, and every
+live host in a group is placed on the ring at ``CHRONIKER_HASH_RING_REPLICAS``
+positions hashed from its name. A job belongs to the host at the first of
+those positions at or after its own, wrapping around. Each host only plans and
+claims the jobs in its own segments of the ring, found with a range query, and
+when a host joins or leaves the group only the jobs in the segments next to
+its positions move.
+"""
+import hashlib
+import random
+import time
+from bisect import bisect_left
+
+from django.apps import apps
+from django.db.models import Q
+
+from . import settings as _settings
+
+RING_SIZE = 2**32
+
+_cache = {} # {group:(loaded timestamp, HashRing)}
+
+
+def hash_position(value):
+    """
+    Returns the ring position of a string.
+    """
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:8], 16)
+
+
+def random_ring_position():
+    return random.randrange(RING_SIZE)
+
+
+class HashRing:
+    """
+    The positions of a group's hosts on the ring.
+    """
+
+    def __init__(self, hosts, replicas=None):
+        if replicas is None:
+            replicas = _settings.CHRONIKER_HASH_RING_REPLICAS
+        self.hosts = sorted(set(hosts))
+        self.points = sorted((hash_position('%s:%i' % (host, i)), host) for host in self.hosts for i in range(replicas))
+        self.positions = [position for position, _ in self.points]
+
+    def get_host(self, position):
+        """
+        Returns the host that owns the given ring position, or None if the ring is empty.
+        """
+        if not self.points:
+            return None
+        return self.points[bisect_left(self.positions, position) % len(self.points)][1]
+
+    def get_ranges(self, host):
+        """
+        Returns the segments of the ring the host owns, as a sorted list of
+        (exclusive start, inclusive end) positions.
+        """
+        ranges = []
+        for i, (position, owner) in enumerate(self.points):
+            if owner != host:
+                continue
+            if i == 0:
+                # The first position also owns the segment wrapping around from the last.
+                ranges.append((self.positions[-1], RING_SIZE - 1))
+                ranges.append((-1, position))
+            else:
+                ranges.append((self.positions[i - 1], position))
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and merged[-1][1] >= start:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def get_q(self, host, field='ring_position'):
+        """
+        Returns a filter matching the jobs on the host's segments of the ring.
+        """
+        q = Q(pk__in=[])
+        for start, end in self.get_ranges(host):
+            q |= Q(**{field + '__gt': start, field + '__lte': end})
+        return q
+
+
+def get_hash_ring(group):
+    """
+    Returns the cached ring of the group's live hosts, reloading it if it's
+    older than CHRONIKER_HASH_RING_CACHE_SECONDS.
+    """
+    loaded, ring = _cache.get(group, (None, None))
+    if ring is None or time.time() - loaded >= _settings.CHRONIKER_HASH_RING_CACHE_SECONDS:
+        WorkerHost = apps.get_model('chroniker', 'WorkerHost')
+        ring = HashRing(WorkerHost.get_live_hostnames(group))
+        _cache[group] = (time.time(), ring)
+    return ring
+
+
+def invalidate_hash_rings():
+    """
+    Discards the cached rings, so the next use reloads them.
+    """
+    _cache.clear()
@@ -0,0 +1,303 @@
+"""
+Exports jobs to, and syncs jobs from, a declarative spec.
+
+A spec is a dict with a list of jobs, each a dict of the job's fields plus,
+optionally, the usernames of its subscribers, the references of its callbacks
+and the jobs it depends on. Jobs are identified by their natural key, as set
+by ``CHRONIKER_JOB_NK``, so the same spec can be applied to every environment.
+
+Syncing compares the spec to the database in a fixed number of queries and
+applies only the differences in bulk. Bulk writes skip ``Job.save()``, so
+next_run is only recomputed for jobs that are new or whose schedule changed.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from chroniker.graph import invalidate_dependency_graph
+from chroniker.models import SCHEDULE_FIELDS, CallbackMethod, Job, JobDependency
+
+from . import settings as _settings
+
+# Runtime state that a spec doesn't control.
+EXCLUDED_FIELDS = ('next_run', 'force_run', 'force_stop', 'is_running')
+
+DEPENDENCY_FIELDS = ('wait_for_completion', 'wait_for_success', 'wait_for_next_run')
+
+
+def get_sync_fields():
+    """
+    Returns the names of the job fields a spec can set.
+    """
+    return [f.name for f in Job._meta.concrete_fields if f.editable and not f.primary_key and f.name not in EXCLUDED_FIELDS]
+
+
+def get_key(job):
+    return tuple(getattr(job, name) for name in _settings.CHRONIKER_JOB_NK)
+
+
+def parse_key(value):
+    """
+    Returns the natural key tuple of a job reference in a spec, either a
+    single value or a list of values.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return (value,)
+
+
+def format_key(key):
+    if len(key) == 1:
+        return key[0]
+    return list(key)
+
+
+class SyncResult:
+    """
+    The changes a sync made, or would make in a dry run.
+    """
+
+    def __init__(self):
+        self.created = [] # [key]
+        self.updated = {} # {key:[field names]}
+        self.deleted = [] # [key]
+        self.rescheduled = [] # [key]
+        self.dependencies_created = 0
+        self.dependencies_updated = 0
+        self.dependencies_deleted = 0
+        self.subscribers_added = 0
+        self.subscribers_removed = 0
+        self.callbacks_added = 0
+        self.callbacks_removed = 0
+
+    @property
+    def changed(self):
+        return bool(
+            self.created or self.updated or self.deleted or self.dependencies_created or self.dependencies_updated or self.dependencies_deleted
+            or self.subscribers_added or self.subscribers_removed or self.callbacks_added or self.callbacks_removed
+        )
+
+    def summary(self):
+        return (
+            '%i jobs created, %i updated, %i deleted, %i rescheduled. '
+            'Dependencies: %i created, %i updated, %i deleted. '
+            'Subscribers: %i added, %i removed. '
+            'Callbacks: %i added, %i removed.'
+        ) % (
+            len(self.created),
+            len(self.updated),
+            len(self.deleted),
+            len(self.rescheduled),
+            self.dependencies_created,
+            self.dependencies_updated,
+            self.dependencies_deleted,
+            self.subscribers_added,
+            self.subscribers_removed,
+            self.callbacks_added,
+            self.callbacks_removed,
+        )
+
+
+def export_jobs(queryset=None):
+    """
+    Returns a spec of the given jobs, or all jobs, in a fixed number of queries.
+    """
+    jobs = list((queryset if queryset is not None else Job.objects.all()).order_by('id'))
+    job_ids = [_.id for _ in jobs]
+    fields = get_sync_fields()
+
+    subscribers = {} # {job_id:[username]}
+    username_field = get_user_model().USERNAME_FIELD
+    rows = Job.subscribers.through.objects.filter(job_id__in=job_ids).values_list('job_id', 'user__' + username_field)
+    for job_id, username in rows.order_by('job_id', 'user__' + username_field):
+        subscribers.setdefault(job_id, []).append(username)
+
+    callbacks = {} # {job_id:[reference]}
+    rows = Job.callbacks.through.objects.filter(job_id__in=job_ids).values_list('job_id', 'callbackmethod__reference')
+    for job_id, reference in rows.order_by('job_id', 'callbackmethod__reference'):
+        callbacks.setdefault(job_id, []).append(reference)
+
+    dependencies = {} # {job_id:[dependency spec]}
+    rows = JobDependency.objects.filter(dependent_id__in=job_ids).select_related('dependee').order_by('dependent_id', 'dependee_id')
+    for dep in rows:
+        spec = dict(dependee=format_key(get_key(dep.dependee)))
+        spec.update((name, getattr(dep, name)) for name in DEPENDENCY_FIELDS)
+        dependencies.setdefault(dep.dependent_id, []).append(spec)
+
+    specs = []
+    for job in jobs:
+        spec = {name: getattr(job, name) for name in fields}
+        spec['subscribers'] = subscribers.get(job.id, [])
+        spec['callbacks'] = callbacks.get(job.id, [])
+        spec['dependencies'] = dependencies.get(job.id, [])
+        specs.append(spec)
+    return dict(jobs=specs)
+
+
+def _sync_m2m(through, job_field, other_field, wanted, job_ids):
+    """
+    Makes the many-to-many rows for the given jobs match wanted, a set of
+    (job_id, other_id), returning the numbers of rows added and removed.
+    """
+    existing = {
+        (job_id, other_id): row_id
+        for row_id, job_id, other_id in through.objects.filter(**{job_field + '__in': job_ids}).values_list('id', job_field, other_field)
+    }
+    added = [pair for pair in wanted if pair not in existing]
+    removed = [row_id for pair, row_id in existing.items() if pair not in wanted]
+    through.objects.bulk_create([through(**{job_field: job_id, other_field: other_id}) for job_id, other_id in added])
+    if removed:
+        through.objects.filter(id__in=removed).delete()
+    return len(added), len(removed)
+
+
+def sync_jobs(spec, delete=False, dryrun=False, now=None):
+    """
+    Makes the jobs in the database match the spec, returning a ``SyncResult``.
+
+    Jobs missing from the spec are deleted only if delete is true. The
+    subscribers, callbacks and dependencies of a job are only changed if its
+    spec lists them. A dry run makes the same changes and rolls them back.
+
+    Raises ``ValueError`` if the spec is invalid.
+    """
+    now = now or timezone.now()
+    fields = get_sync_fields()
+    result = SyncResult()
+
+    # Validate the spec before changing anything.
+    specs = {} # {key:job spec}
+    for job_spec in spec.get('jobs', []):
+        unknown = set(job_spec) - set(fields) - {'subscribers', 'callbacks', 'dependencies'}
+        if unknown:
+            raise ValueError('Unknown job fields: %s' % ', '.join(sorted(unknown)))
+        missing = [name for name in _settings.CHRONIKER_JOB_NK if name not in job_spec]
+        if missing:
+            raise ValueError('Job missing natural key fields: %s' % ', '.join(missing))
+        key = tuple(job_spec[name] for name in _settings.CHRONIKER_JOB_NK)
+        if key in specs:
+            raise ValueError('Duplicate job: %s' % (format_key(key),))
+        specs[key] = job_spec
+
+    with transaction.atomic():
+        existing = {}
+        for job in Job.objects.all():
+            key = get_key(job)
+            if key in existing:
+                raise ValueError('Multiple jobs have the natural key %s.' % (format_key(key),))
+            existing[key] = job
+
+        # Create and update jobs.
+        new_jobs = []
+        changed_jobs = []
+        changed_fields = set()
+        for key, job_spec in specs.items():
+            values = {name: job_spec[name] for name in fields if name in job_spec}
+            job = existing.get(key)
+            if job is None:
+                job = Job(**values)
+                job.clean()
+                if job.enabled:
+                    job.next_run = job.get_scheduled_run_after(now)
+                    result.rescheduled.append(key)
+                new_jobs.append(job)
+                result.created.append(key)
+                continue
+            updated = [name for name, value in values.items() if getattr(job, name) != value]
+            if not updated:
+                continue
+            for name in updated:
+                setattr(job, name, values[name])
+            job.clean()
+            if job.enabled and (not job.next_run or set(updated) & set(SCHEDULE_FIELDS)):
+                job.next_run = job.get_scheduled_run_after(now)
+                updated.append('next_run')
+                result.rescheduled.append(key)
+            changed_jobs.append(job)
+            changed_fields.update(updated)
+            result.updated[key] = updated
+
+        deleted_ids = []
+        if delete:
+            for key, job in existing.items():
+                if key not in specs:
+                    deleted_ids.append(job.id)
+                    result.deleted.append(key)
+
+        Job.objects.bulk_create(new_jobs)
+        if changed_jobs:
+            Job.objects.bulk_update(changed_jobs, sorted(changed_fields))
+        if deleted_ids:
+            Job.objects.filter(id__in=deleted_ids).delete()
+
+        jobs = {key: job for key, job in existing.items() if job.id not in deleted_ids}
+        jobs.update((get_key(job), job) for job in new_jobs)
+        if any(job.pk is None for job in new_jobs):
+            # Not all backends set primary keys on bulk creation.
+            jobs = {get_key(job): job for job in Job.objects.all()}
+        ids = {key: jobs[key].id for key in specs}
+
+        # Subscribers.
+        listed = [key for key, job_spec in specs.items() if 'subscribers' in job_spec]
+        if listed:
+            User = get_user_model()
+            usernames = {username for key in listed for username in specs[key]['subscribers']}
+            users = dict(User.objects.filter(**{User.USERNAME_FIELD + '__in': usernames}).values_list(User.USERNAME_FIELD, 'id'))
+            missing = usernames - set(users)
+            if missing:
+                raise ValueError('Unknown subscribers: %s' % ', '.join(sorted(missing)))
+            wanted = {(ids[key], users[username]) for key in listed for username in specs[key]['subscribers']}
+            result.subscribers_added, result.subscribers_removed = _sync_m2m(
+                Job.subscribers.through, 'job_id', 'user_id', wanted, [ids[key] for key in listed]
+            )
+
+        # Callbacks, creating any missing callback methods named by their reference.
+        listed = [key for key, job_spec in specs.items() if 'callbacks' in job_spec]
+        if listed:
+            references = {reference for key in listed for reference in specs[key]['callbacks']}
+            methods = dict(CallbackMethod.objects.filter(reference__in=references).values_list('reference', 'id'))
+            CallbackMethod.objects.bulk_create([CallbackMethod(name=_, reference=_) for _ in sorted(references - set(methods))])
+            methods = dict(CallbackMethod.objects.filter(reference__in=references).values_list('reference', 'id'))
+            wanted = {(ids[key], methods[reference]) for key in listed for reference in specs[key]['callbacks']}
+            result.callbacks_added, result.callbacks_removed = _sync_m2m(
+                Job.callbacks.through, 'job_id', 'callbackmethod_id', wanted, [ids[key] for key in listed]
+            )
+
+        # Dependencies.
+        listed = [key for key, job_spec in specs.items() if 'dependencies' in job_spec]
+        if listed:
+            wanted = {} # {(dependent_id, dependee_id):{field:value}}
+            for key in listed:
+                for dep_spec in specs[key]['dependencies']:
+                    dependee_key = parse_key(dep_spec['dependee'])
+                    if dependee_key not in jobs:
+                        raise ValueError('Unknown dependee of %s: %s' % (format_key(key), dep_spec['dependee']))
+                    defaults = {name: JobDependency._meta.get_field(name).default for name in DEPENDENCY_FIELDS}
+                    defaults.update((name, dep_spec[name]) for name in DEPENDENCY_FIELDS if name in dep_spec)
+                    wanted[(ids[key], jobs[dependee_key].id)] = defaults
+            existing_deps = {(dep.dependent_id, dep.dependee_id): dep for dep in JobDependency.objects.filter(dependent_id__in=[ids[key] for key in listed])}
+            created = [JobDependency(dependent_id=pair[0], dependee_id=pair[1], **values) for pair, values in wanted.items() if pair not in existing_deps]
+            updated = []
+            for pair, values in wanted.items():
+                dep = existing_deps.get(pair)
+                if dep is not None and any(getattr(dep, name) != value for name, value in values.items()):
+                    for name, value in values.items():
+                        setattr(dep, name, value)
+                    updated.append(dep)
+            removed = [dep.id for pair, dep in existing_deps.items() if pair not in wanted]
+            JobDependency.objects.bulk_create(created)
+            if updated:
+                JobDependency.objects.bulk_update(updated, list(DEPENDENCY_FIELDS))
+            if removed:
+                JobDependency.objects.filter(id__in=removed).delete()
+            result.dependencies_created = len(created)
+            result.dependencies_updated = len(updated)
+            result.dependencies_deleted = len(removed)
+
+        # Bulk writes don't send the signals that keep the graph cache current.
+        invalidate_dependency_graph()
+
+        if dryrun:
+            transaction.set_rollback(True)
+
+    return result
@@ -93,4 +93,6 @@ TEMPLATES = [
         },
     },
 ]
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+# Background threads can't write to the database during a test's transaction.
+CHRONIKER_CALLBACK_BACKGROUND = False
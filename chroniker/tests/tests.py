@@ -5,13 +5,15 @@ Quick run with:
 
 """
 import os
+import signal
 import socket
 import sys
 import tempfile
 import time
 import warnings
 from datetime import datetime, timedelta
-from multiprocessing import Process
+from multiprocessing import Process, Queue
+from unittest.mock import patch
 
 from dateutil import zoneinfo
 
@@ -22,13 +24,20 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import mail
 from django.core.management import call_command
+from django.db import connection
 from django.db.models import Max
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.test.client import Client
 from django.utils import timezone
 
 from chroniker import constants as c, settings as _settings, utils
-from chroniker.models import Job, Log, CallbackMethod
+from chroniker.graph import DependencyGraph, get_dependency_graph, invalidate_dependency_graph
+from chroniker.metrics import render_metrics
+from chroniker.models import (
+    Job, JobDependency, JobRuntime, Log, CallbackMethod, JobContext, MonitorRecord, Notification, SchedulerTick, WorkerHost, SchedulerLease,
+    DispatchEntry, get_current_job, set_current_context
+)
 
 warnings.simplefilter('error', RuntimeWarning)
 
@@ -43,6 +52,14 @@ def job_error_callback(job, stdout, stderr):
     CALLBACK_ERRORS.append(stderr)
 
 
+def slow_callback(job, stdout, stderr):
+    time.sleep(5)
+
+
+def failing_callback(job, stdout, stderr):
+    raise Exception('Webhook unavailable')
+
+
 class JobProcess(Process):
 
     def run(self):
@@ -61,7 +78,8 @@ class JobTestCase(TestCase):
     password = 'password'
 
     def setUp(self):
-        pass
+        # Rolled back transactions don't signal the cache's invalidation.
+        invalidate_dependency_graph()
 
     def get_superuser(self):
         user = User.objects.create(
@@ -234,7 +252,8 @@ class JobTestCase(TestCase):
 
         # Everything just ran, and they shouldn't run again for an hour, so we should
         # find nothing due.
-        Job.objects.update(is_running=False, last_heartbeat=timezone.now())
+        Job.objects.update(is_running=False)
+        JobRuntime.set_state(Job.objects.values_list('id', flat=True), last_heartbeat=timezone.now())
         Job.objects.update()
         due = list(Job.objects.due_with_met_dependencies())
         print('dueB:', due)
@@ -267,8 +286,8 @@ class JobTestCase(TestCase):
         # Simulate a running job having crashed, leaving itself marked
         # as running with no further updates.
         job.is_running = True
-        job.last_heartbeat = timezone.now() - timedelta(days=60)
         job.save()
+        JobRuntime.set_state([job.id], last_heartbeat=timezone.now() - timedelta(days=60))
         self.assertEqual(job.is_running, True)
         self.assertEqual(job.is_fresh(), False)
         self.assertEqual(job.is_stale(), True)
@@ -288,8 +307,8 @@ class JobTestCase(TestCase):
         job = Job.objects.get(id=5)
         job.enabled = True
         job.is_running = True
-        job.last_heartbeat = timezone.now() - timedelta(days=30)
         job.save()
+        JobRuntime.set_state([job.id], last_heartbeat=timezone.now() - timedelta(days=30))
 
         self.assertEqual(job.is_fresh(), False)
 
@@ -709,3 +728,1167 @@ class JobTestCase(TestCase):
     def test_widgets(self):
         print('django.version:', django.VERSION)
         from chroniker import widgets # pylint: disable=unused-import,import-outside-toplevel
+
+    def testJobContext(self):
+        job = Job.objects.get(id=1)
+        job.mark_running()
+
+        context = JobContext(job_id=job.id, flush_seconds=3600)
+        set_current_context(context)
+        try:
+            # The job record is only loaded once.
+            self.assertEqual(get_current_job().id, job.id)
+            with self.assertNumQueries(0):
+                self.assertEqual(get_current_job().id, job.id)
+
+            # The first update is written immediately, later ones are coalesced.
+            Job.update_progress(total_parts=100, total_parts_complete=1)
+            self.assertEqual(Job.objects.get(id=job.id).total_parts_complete, 1)
+            with self.assertNumQueries(0):
+                for i in range(2, 10):
+                    Job.update_progress(total_parts=100, total_parts_complete=i)
+            self.assertEqual(Job.objects.get(id=job.id).total_parts_complete, 1)
+            context.flush()
+            self.assertEqual(Job.objects.get(id=job.id).total_parts_complete, 9)
+
+            # The smoothed rate drives the completion estimate.
+            context._last_sample = (time.time() - 10, 10)
+            Job.update_progress(total_parts=100, total_parts_complete=60)
+            context.flush()
+            self.assertAlmostEqual(context.rate, 5, places=0)
+            job = Job.objects.get(id=job.id)
+            self.assertAlmostEqual(job.progress_rate, context.rate)
+            self.assertAlmostEqual(job.estimated_seconds_to_completion, 40 / context.rate, places=0)
+        finally:
+            set_current_context(None)
+
+    def testConnectionLifecycle(self):
+        lifecycle = utils.connection_lifecycle
+        lifecycle.start_tick()
+        self.assertTrue(lifecycle.installed)
+        self.assertEqual(lifecycle.opens, 0)
+        Job.objects.count()
+        self.assertIsNotNone(connection.connection)
+
+        # A forked child must not reuse the parent's connection.
+        queue = Queue()
+
+        def check_child():
+            queue.put(connection.connection is None)
+
+        proc = Process(target=check_child)
+        proc.start()
+        proc.join()
+        self.assertEqual(queue.get(timeout=10), True)
+
+        # The parent's connection is still open and usable.
+        self.assertEqual(Job.objects.count(), 6)
+        self.assertEqual(lifecycle.opens, 0)
+
+    def testMetrics(self):
+        Job.objects.all().update(enabled=False)
+        job = Job.objects.create(
+            name='metrics test',
+            raw_command='ls',
+            frequency=c.HOURLY,
+            enabled=True,
+            force_run=True,
+        )
+        call_command('cron', update_heartbeat=0, sync=1)
+        self.assertEqual(SchedulerTick.objects.count(), 1)
+        self.assertEqual(SchedulerTick.objects.get().jobs_dispatched, 1)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual(job.run_count, 1)
+        self.assertEqual(job.failure_count, 0)
+
+        # Runs logged before the counters were added are counted by their migration.
+        from django.apps import apps
+        from importlib import import_module
+        Log.objects.create(job=job, run_start_datetime=timezone.now(), success=False)
+        Job.objects.filter(id=job.id).update(run_count=0, failure_count=0)
+        import_module('chroniker.migrations.0020_backfill_job_run_counts').backfill_run_counts(apps, None)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual((job.run_count, job.failure_count), (2, 1))
+        Job.objects.filter(id=job.id).update(run_count=1, failure_count=0)
+
+        # The query count doesn't depend on the number of jobs or logs.
+        with self.assertNumQueries(3):
+            content = render_metrics()
+        self.assertIn('chroniker_job_runs_total{job_id="%i",job_name="metrics test"} 1.0' % job.id, content)
+        self.assertIn('chroniker_job_last_success{job_id="%i",job_name="metrics test"} 1.0' % job.id, content)
+        self.assertIn('chroniker_jobs_running 0.0', content)
+        self.assertIn('chroniker_tick_planning_seconds{hostname="localhost"}', content)
+
+        client, user = self.get_superuser_client()
+        response = client.get('/chroniker/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'chroniker_jobs_due_not_started', response.content)
+
+    def testDispatchLag(self):
+        Job.objects.all().update(enabled=False)
+        job = Job.objects.create(
+            name='lag test',
+            raw_command='ls',
+            frequency=c.HOURLY,
+            enabled=True,
+        )
+        Job.objects.filter(id=job.id).update(next_run=timezone.now() - timedelta(seconds=30))
+        call_command('cron', update_heartbeat=0, sync=1)
+
+        log = Job.objects.get(id=job.id).logs.get()
+        self.assertTrue(log.scheduled_datetime)
+        self.assertTrue(log.scheduled_datetime <= log.claimed_datetime <= log.process_start_datetime <= log.command_start_datetime)
+        self.assertTrue(log.dispatch_lag_seconds >= 30)
+
+        stdout = StringIO()
+        call_command('cron_lag_report', hours=1, stdout=stdout)
+        rows = [_.split() for _ in stdout.getvalue().splitlines()]
+        self.assertEqual(rows[0][:4], ['group', 'name', 'stage', 'runs'])
+        self.assertIn(['job', 'lag', 'test', 'total', '1'], [_[:5] for _ in rows])
+        self.assertIn(['host', 'localhost', 'total', '1'], [_[:4] for _ in rows])
+
+    def testResourceUsage(self):
+        Job.objects.all().update(enabled=False)
+        job = Job.objects.create(
+            name='resource test',
+            raw_command='python -c "sum(range(10**6))"',
+            frequency=c.HOURLY,
+            enabled=True,
+            force_run=True,
+        )
+        call_command('cron', update_heartbeat=0, sync=1)
+
+        log = Job.objects.get(id=job.id).logs.get()
+        self.assertTrue(log.success)
+        self.assertTrue(log.cpu_user_seconds > 0)
+        self.assertTrue(log.cpu_system_seconds >= 0)
+        self.assertTrue(log.peak_rss_bytes > 0)
+        self.assertEqual(log.max_child_processes, 0)
+
+        # Memory freed before a run started isn't counted towards its peak.
+        import resource
+        data = bytearray(200 * 1024 * 1024)
+        del data
+        monitor = utils.ResourceMonitor()
+        lifetime_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.assertTrue(monitor.finish()['peak_rss_bytes'] < lifetime_peak - 100 * 1024 * 1024)
+
+        stdout = StringIO()
+        call_command('cron_resource_report', hours=1, stdout=stdout)
+        rows = [_.split() for _ in stdout.getvalue().splitlines()]
+        self.assertEqual(rows[0][:3], ['host', 'job', 'runs'])
+        self.assertEqual(rows[1][:4], ['localhost', 'resource', 'test', '1'])
+
+    def testProcessTreeSampler(self):
+        import subprocess
+        proc = subprocess.Popen(['sh', '-c', 'python -c "sum(range(10**8))" & sleep 10; wait'])
+        try:
+            sampler = utils.ProcessTreeSampler(proc.pid, discover_seconds=60)
+            time.sleep(0.5)
+            t0 = time.time()
+            sampler.sample(discover=True)
+            # Sampling never blocks to measure CPU usage.
+            self.assertTrue(time.time() - t0 < 0.5)
+            self.assertEqual(len(sampler.descendants()), 2)
+            for _ in range(20):
+                time.sleep(0.5)
+                if len(sampler.sample().descendants()) == 1:
+                    break
+            # The exited child's CPU time stays in the totals.
+            self.assertEqual(len(sampler.descendants()), 1)
+            self.assertTrue(sampler.user_seconds > 0.5)
+        finally:
+            proc.kill()
+            proc.wait()
+
+    def testProcessGroupTermination(self):
+        import subprocess
+
+        def target():
+            # The shell and its children ignore SIGTERM, forcing escalation.
+            subprocess.run(['sh', '-c', "trap '' TERM; sleep 60 & sleep 60 & wait"])
+
+        proc = utils.TimedProcess(max_seconds=60, target=target)
+        proc.start()
+        time.sleep(1)
+        self.assertEqual(os.getpgid(proc.pid), proc.pid)
+        # The sampled process tree is killed without scanning the process table.
+        with patch('psutil.process_iter', side_effect=AssertionError('Scanned the process table.')):
+            kill_info = proc.terminate(grace_seconds=0.5)
+        self.assertEqual(kill_info['processes_reaped'], 4)
+        self.assertTrue(kill_info['kill_escalated'])
+        self.assertTrue(kill_info['kill_seconds'] >= 0.5)
+        self.assertEqual(utils.get_process_group(proc.pid), [])
+        proc.join(5)
+        self.assertFalse(proc.is_alive())
+
+    def testKillStalledProcesses(self):
+        import subprocess
+        from chroniker.management.commands.cron import kill_stalled_processes
+        # Processes that ignore every polite signal are signalled together, so
+        # killing several takes no longer than killing one.
+        ignoring = 'import signal, time\nfor sig in (signal.SIGINT, signal.SIGABRT, signal.SIGTERM): signal.signal(sig, signal.SIG_IGN)\ntime.sleep(60)'
+        stubborn = [subprocess.Popen([sys.executable, '-c', ignoring]) for _ in range(3)]
+        time.sleep(0.5)
+        t0 = time.time()
+        self.assertEqual(utils.kill_processes([_.pid for _ in stubborn] + [999999999], grace_seconds=0.6), set())
+        self.assertTrue(time.time() - t0 < 1.5)
+        for proc in stubborn:
+            self.assertEqual(proc.wait(timeout=5), -signal.SIGKILL)
+
+        stalled = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)', 'manage.py', 'cron'], stderr=subprocess.DEVNULL)
+        other = subprocess.Popen(['sleep', '60'])
+        time.sleep(0.5)
+        try:
+            job1 = Job.objects.create(name='stalled', command='test_sleeper', frequency=c.HOURLY)
+            job2 = Job.objects.create(name='not cron', command='test_sleeper', frequency=c.HOURLY)
+            Job.objects.filter(id=job1.id).update(current_pid=str(stalled.pid), current_hostname='localhost')
+            Job.objects.filter(id=job2.id).update(current_pid=str(other.pid), current_hostname='localhost')
+
+            stamp_fn = os.path.join(tempfile.mkdtemp(), 'reap.stamp')
+            _settings.CHRONIKER_REAP_STAMP_FN = stamp_fn
+            try:
+                with self.assertNumQueries(1):
+                    kill_stalled_processes(dryrun=False)
+                stalled.wait(timeout=10)
+                self.assertEqual(other.poll(), None)
+                # Within the interval, no scan is done at all.
+                with self.assertNumQueries(0):
+                    kill_stalled_processes(dryrun=False)
+            finally:
+                _settings.CHRONIKER_REAP_STAMP_FN = '/tmp/chroniker-reap.stamp'
+        finally:
+            for proc in (stalled, other):
+                proc.kill()
+                proc.wait()
+
+    def testDependencyGraph(self):
+        # 2 depends on 1 and 3, and 3 depends on 4.
+        with self.assertNumQueries(1):
+            graph = get_dependency_graph()
+        with self.assertNumQueries(0):
+            self.assertIs(get_dependency_graph(), graph)
+            self.assertEqual(graph.dependees(2), {1, 3})
+            self.assertEqual(graph.dependents(4), {3})
+            self.assertEqual(graph.descendants(4), {2, 3})
+            self.assertEqual(graph.ancestors(2), {1, 3, 4})
+            self.assertEqual(graph.find_cycle(), None)
+            order = graph.topological_order([2, 3])
+            self.assertTrue(order.index(4) < order.index(3) < order.index(2))
+
+        # Only the edges downstream of the root are loaded.
+        with self.assertNumQueries(1):
+            subgraph = DependencyGraph.load(root_ids=[3])
+        self.assertEqual({(_.dependee_id, _.dependent_id) for _ in subgraph.edges}, {(3, 2)})
+
+        j4 = Job.objects.get(id=4)
+        expected = {Job.objects.get(id=2), Job.objects.get(id=3)}
+        with self.assertNumQueries(2):
+            self.assertEqual(j4.get_chained_jobs(graph=graph), expected)
+
+        # Saving a dependency invalidates the cache.
+        JobDependency.objects.create(dependent_id=4, dependee_id=2)
+        graph = get_dependency_graph()
+        self.assertEqual(graph.dependees(4), {2})
+        cycle = graph.find_cycle()
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertEqual(set(cycle), {2, 3, 4})
+
+        # A dependency added without signals isn't in the cached graph, so it's
+        # only trusted when given as loaded this tick.
+        j5 = Job.objects.get(id=5)
+        JobDependency.objects.bulk_create([JobDependency(dependent_id=5, dependee_id=4, wait_for_completion=True)])
+        Job.objects.filter(id=4).update(is_running=True)
+        self.assertFalse(get_dependency_graph().dependees(5))
+        self.assertTrue(j5.dependencies_met(graph=get_dependency_graph()))
+        self.assertFalse(j5.dependencies_met())
+
+    def testChainEstimate(self):
+        from chroniker.chains import estimate_chain
+        # 3 waits on 4, and 2 waits on 3 (and 1, which isn't in 4's chain).
+        now = timezone.now()
+        for job_id, durations in [(4, [10, 20, 30]), (3, [100]), (2, [5])]:
+            for i, seconds in enumerate(durations):
+                start = now - timedelta(days=1, hours=i)
+                Log.objects.create(job_id=job_id, run_start_datetime=start, run_end_datetime=start + timedelta(seconds=seconds), success=True)
+
+        estimate = estimate_chain(Job.objects.get(id=4), quantile=90)
+        self.assertEqual([_.job.id for _ in estimate.jobs], [4, 3, 2])
+        self.assertEqual(estimate.critical_path, [4, 3, 2])
+        self.assertEqual(round(estimate.duration_seconds), 133)
+        self.assertEqual(estimate.unestimated_job_ids, [])
+
+        # Live, 4 has finished and 3 has been running for 40 of its 100 seconds.
+        Job.objects.filter(id=4).update(last_run=now - timedelta(seconds=200), last_run_start_timestamp=now - timedelta(seconds=200), last_run_successful=True)
+        Job.objects.filter(id=3).update(is_running=True, last_run=now - timedelta(seconds=40), last_run_start_timestamp=now - timedelta(seconds=40))
+        estimate = estimate_chain(Job.objects.get(id=4), quantile=90, live=True, now=now)
+        self.assertEqual([_.state for _ in estimate.jobs], ['complete', 'running', 'pending'])
+        self.assertEqual(round(estimate.duration_seconds), 65)
+        self.assertEqual(estimate.estimated_completion_datetime, now + timedelta(seconds=estimate.duration_seconds))
+
+        client = Client()
+        client.force_login(self.get_superuser())
+        data = client.get('/chroniker/jobs/4/chain/?live=1').json()
+        self.assertEqual(data['critical_path'], [4, 3, 2])
+        self.assertTrue(data['live'])
+        response = client.get('/admin/chroniker/job/4/chain/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Estimated duration')
+        self.assertFalse(client.get('/chroniker/jobs/4/chain/?live=0').json()['live'])
+
+        # A dependency cycle is reported instead of failing the page.
+        JobDependency.objects.create(dependent_id=4, dependee_id=2)
+        response = client.get('/chroniker/jobs/4/chain/?live=1')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cycle', response.json()['error'])
+        response = client.get('/admin/chroniker/job/4/chain/?live=1', follow=True)
+        self.assertContains(response, 'has a dependency cycle')
+        JobDependency.objects.filter(dependent_id=4, dependee_id=2).delete()
+
+        stdout = StringIO()
+        call_command('calculate_job_chain', '4', quantile=90, stdout=stdout)
+        self.assertIn('critical path: 4 -> 3 -> 2', stdout.getvalue())
+
+        # Cached estimates are pruned once expired or too many.
+        from chroniker import chains
+        chains._cache.clear()
+        job = Job.objects.get(id=4)
+        with patch.object(chains, 'MAX_CACHED_ESTIMATES', 2):
+            for quantile in (50, 60, 70):
+                chains.get_chain_estimate(job, quantile=quantile)
+            self.assertEqual([_[1] for _ in chains._cache], [60, 70])
+            _settings.CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS = 0
+            try:
+                chains.get_chain_estimate(job, quantile=80)
+            finally:
+                _settings.CHRONIKER_CHAIN_ESTIMATE_CACHE_SECONDS = 300
+            self.assertEqual([_[1] for _ in chains._cache], [80])
+
+    def testDagExecutor(self):
+        Job.objects.all().update(enabled=False)
+        now = timezone.now() - timedelta(minutes=1)
+        chain = [
+            Job.objects.create(name='chain %i' % i, raw_command='true', frequency=c.HOURLY, enabled=True, next_run=now)
+            for i in range(3)
+        ]
+        for dependee, dependent in zip(chain, chain[1:]):
+            JobDependency.objects.create(dependee=dependee, dependent=dependent, wait_for_next_run=False)
+
+        # Normally, each tick only starts the jobs whose dependencies are already met.
+        call_command('cron', update_heartbeat=0, sync=1)
+        self.assertEqual([Job.objects.get(id=_.id).logs.count() for _ in chain], [1, 0, 0])
+
+        # The DAG executor starts each dependent as soon as its dependee finishes.
+        Job.objects.filter(id__in=[_.id for _ in chain]).update(next_run=now)
+        call_command('cron', update_heartbeat=0, sync=1, dag=True)
+        self.assertEqual([Job.objects.get(id=_.id).logs.count() for _ in chain], [2, 1, 1])
+        self.assertEqual(SchedulerTick.objects.order_by('-id')[0].jobs_dispatched, 3)
+
+    def testBenchmarkScheduler(self):
+        import json
+        job_count = Job.objects.count()
+        stdout = StringIO()
+        call_command('cron_benchmark', 'scheduler', jobs=20, logs=2, repeat=1, stdout=stdout)
+        results = json.loads(stdout.getvalue())['results']
+        self.assertEqual(results['jobs'], 20)
+        self.assertEqual(
+            set(results['benchmarks']), {
+                'due_with_met_dependencies_ordered',
+                'cron_dryrun',
+                'job_changelist',
+                'log_changelist',
+                'duration_graph',
+                'end_all_stale',
+                'log_cleanup',
+            }
+        )
+        for result in results['benchmarks'].values():
+            self.assertTrue(result['queries'] > 0)
+            self.assertTrue(result['peak_memory_bytes'] > 0)
+        # The generated population is rolled back.
+        self.assertEqual(Job.objects.count(), job_count)
+
+    def testTickSummary(self):
+        Job.objects.all().update(enabled=False)
+        job = Job.objects.create(name='tick test', raw_command='true', frequency=c.HOURLY, enabled=True, force_run=True)
+        profile_fn = os.path.join(tempfile.mkdtemp(), 'cron.prof')
+        call_command('cron', update_heartbeat=0, sync=1, profile=profile_fn)
+
+        tick = SchedulerTick.objects.get()
+        self.assertEqual(tick.jobs_evaluated, 1)
+        self.assertEqual(tick.jobs_skipped, 0)
+        self.assertEqual(tick.jobs_dispatched, 1)
+        self.assertEqual(set(tick.phases), {'reap', 'stale_cleanup', 'pid_check', 'planning', 'dispatch', 'wait'})
+        self.assertTrue(tick.phases['planning']['queries'] > 0)
+        self.assertEqual(tick.queries, sum(_['queries'] for _ in tick.phases.values()))
+        self.assertEqual(Job.objects.get(id=job.id).logs.count(), 1)
+
+        import pstats
+        stats = pstats.Stats(profile_fn)
+        self.assertTrue(any(func[2] == 'run_cron' for func in stats.stats))
+
+        client = Client()
+        client.force_login(self.get_superuser())
+        response = client.get('/admin/chroniker/schedulertick/%i/change/' % tick.id)
+        self.assertContains(response, 'planning')
+
+    def testAsyncRawCommandExecutor(self):
+        Job.objects.all().update(enabled=False)
+        now = timezone.now() - timedelta(minutes=1)
+        echo_job = Job.objects.create(name='echo', raw_command='echo "hello"', frequency=c.HOURLY, enabled=True, next_run=now)
+        fail_job = Job.objects.create(name='fail', raw_command='ls /nonexistent-chroniker-path', frequency=c.HOURLY, enabled=True, next_run=now)
+        slow_job = Job.objects.create(name='slow', raw_command='sleep 30', frequency=c.HOURLY, enabled=True, next_run=now, timeout_seconds=1)
+        busy_job = Job.objects.create(
+            name='busy',
+            raw_command='%s -c "import time; end = time.time() + 2; all(iter(lambda: time.time() < end, False))"' % sys.executable,
+            frequency=c.HOURLY,
+            enabled=True,
+            next_run=now,
+        )
+
+        # The commands run from the cron process itself, so no job process forks
+        # and the in-memory test database stays visible.
+        t0 = time.time()
+        call_command('cron', update_heartbeat=0, async_raw=True)
+        self.assertTrue(time.time() - t0 < 30)
+
+        echo_job = Job.objects.get(id=echo_job.id)
+        self.assertFalse(echo_job.is_running)
+        self.assertTrue(echo_job.last_run_successful)
+        self.assertTrue(echo_job.next_run > timezone.now())
+        log = echo_job.logs.get()
+        self.assertEqual(log.stdout, 'hello\n')
+        self.assertTrue(log.success)
+        self.assertTrue(log.command_start_datetime)
+
+        log = Job.objects.get(id=fail_job.id).logs.get()
+        self.assertFalse(log.success)
+        self.assertTrue('non-zero exit status' in log.stderr)
+
+        slow_job = Job.objects.get(id=slow_job.id)
+        self.assertFalse(slow_job.is_running)
+        self.assertFalse(slow_job.last_run_successful)
+        log = slow_job.logs.get()
+        self.assertFalse(log.success)
+        self.assertFalse(log.on_time)
+        self.assertTrue('Job exceeded timeout' in log.stderr)
+        self.assertEqual(log.processes_reaped, 1)
+        self.assertFalse(log.kill_escalated)
+        self.assertEqual(log.max_child_processes, 1)
+        self.assertTrue(log.peak_rss_bytes > 0)
+
+        # The resources used by the commands are sampled as they run.
+        log = Job.objects.get(id=busy_job.id).logs.get()
+        self.assertTrue(log.success)
+        self.assertTrue(log.cpu_user_seconds > 0)
+        self.assertEqual(log.max_child_processes, 1)
+
+    def testNotificationOutbox(self):
+        from chroniker.notifications import send_notifications
+        user = User.objects.create(username='subscriber', email='subscriber@localhost')
+        Job.objects.all().update(enabled=False)
+        jobs = []
+        for i in range(3):
+            job = Job.objects.create(
+                name='outbox %i' % i,
+                command='test_error',
+                frequency=c.HOURLY,
+                enabled=True,
+                force_run=True,
+                email_errors_to_subscribers=True,
+            )
+            job.subscribers.add(user)
+            jobs.append(job)
+
+        # Failures are queued instead of being emailed by each run.
+        _settings.CHRONIKER_EMAIL_OUTBOX = True
+        try:
+            call_command('cron', update_heartbeat=0, sync=1)
+        finally:
+            _settings.CHRONIKER_EMAIL_OUTBOX = False
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(is_error=True).count(), 3)
+
+        # Digests wait for the oldest failure to age.
+        self.assertEqual(send_notifications(digest_seconds=60), 0)
+        self.assertEqual(Notification.objects.count(), 3)
+
+        # Then each subscriber's failures are sent as one email.
+        self.assertEqual(send_notifications(digest_seconds=60, now=timezone.now() + timedelta(minutes=2)), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['"" <subscriber@localhost>'])
+        self.assertTrue(mail.outbox[0].subject.startswith('3 job errors'))
+        self.assertEqual(Notification.objects.count(), 0)
+
+        # Without a digest, each queued email is sent separately, in batches.
+        for job in jobs:
+            job.logs.get().enqueue_notifications()
+        stdout = StringIO()
+        call_command('cron_send_notifications', batch_size=2, digest_seconds=0, stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), 'Sent 3 emails.')
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(Notification.objects.count(), 0)
+
+        # Logs with emails still queued aren't trimmed or cleaned up.
+        log = jobs[0].logs.get()
+        log.enqueue_notifications()
+        Log.objects.filter(id=log.id).update(run_start_datetime=timezone.now() - timedelta(days=30))
+        jobs[0].maximum_log_entries = 1
+        jobs[0].save()
+        Log.objects.create(job=jobs[0], run_start_datetime=timezone.now())
+        jobs[0].trim_logs()
+        Log.cleanup(time_ago=timezone.now() - timedelta(days=1))
+        self.assertTrue(Log.objects.filter(id=log.id).exists())
+
+        # Emails that keep failing are dropped after the maximum attempts.
+        class FailingConnection:
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def send_messages(self, messages):
+                raise Exception('Connection refused')
+
+        for i in range(_settings.CHRONIKER_EMAIL_MAX_SEND_ATTEMPTS):
+            self.assertEqual(Notification.objects.filter(log=log).count(), 1)
+            self.assertEqual(send_notifications(digest_seconds=0, connection=FailingConnection()), 0)
+        self.assertEqual(Notification.objects.count(), 0)
+        Log.cleanup(time_ago=timezone.now() - timedelta(days=1))
+        self.assertFalse(Log.objects.filter(id=log.id).exists())
+
+    def testCallbackDispatcher(self):
+        from chroniker.callbacks import CallbackDispatcher, join_background
+        while CALLBACK_ERRORS:
+            CALLBACK_ERRORS.pop(0)
+        Job.objects.all().update(enabled=False)
+        job = Job.objects.create(
+            name='callbacks',
+            command='test_error',
+            frequency=c.HOURLY,
+            enabled=True,
+            force_run=True,
+            callback_errors_to_subscribers=True,
+        )
+        for name in ('job_error_callback', 'slow_callback', 'failing_callback'):
+            job.callbacks.add(CallbackMethod.objects.create(name=name, reference='chroniker.tests.tests.%s' % name))
+
+        # A slow callback is abandoned after its timeout instead of holding up the run.
+        _settings.CHRONIKER_CALLBACK_TIMEOUT_SECONDS = 0.5
+        try:
+            t0 = time.time()
+            call_command('cron', update_heartbeat=0, sync=1)
+            self.assertTrue(time.time() - t0 < 5)
+        finally:
+            _settings.CHRONIKER_CALLBACK_TIMEOUT_SECONDS = 30
+        self.assertEqual(len(CALLBACK_ERRORS), 1)
+
+        results = {_['reference'].split('.')[-1]: _ for _ in job.logs.get().callback_results}
+        self.assertTrue(results['job_error_callback']['success'])
+        self.assertTrue(results['job_error_callback']['seconds'] < 0.5)
+        self.assertFalse(results['slow_callback']['success'])
+        self.assertTrue(results['slow_callback']['error'].startswith('Timed out'))
+        self.assertFalse(results['failing_callback']['success'])
+        self.assertEqual(results['failing_callback']['error'], 'Webhook unavailable')
+
+        # Callbacks beyond the worker limit wait for a free worker.
+        results = CallbackDispatcher(max_workers=1, timeout_seconds=0.5).run(
+            ['chroniker.tests.tests.slow_callback', 'chroniker.tests.tests.job_error_callback'], job, stdout='', stderr=''
+        )
+        self.assertEqual([_['success'] for _ in results], [False, False])
+        self.assertEqual(results[1]['error'], 'Not started before other callbacks timed out.')
+
+        # Callbacks started in the background don't hold up the caller, and
+        # their results are passed on once they finish.
+        background_results = []
+        t0 = time.time()
+        CallbackDispatcher(timeout_seconds=0.5).start(
+            ['chroniker.tests.tests.slow_callback', 'chroniker.tests.tests.job_error_callback'], job, stdout='', stderr='',
+            on_done=background_results.extend,
+        )
+        self.assertTrue(time.time() - t0 < 0.5)
+        join_background()
+        self.assertEqual([_['success'] for _ in background_results], [False, True])
+
+        client = Client()
+        client.force_login(self.get_superuser())
+        response = client.get('/admin/chroniker/log/%i/change/' % job.logs.get().id)
+        self.assertContains(response, 'Webhook unavailable')
+
+    def testBatchMonitors(self):
+        from chroniker import monitors
+        Job.objects.all().update(enabled=False)
+        now = timezone.now() - timedelta(minutes=1)
+        ok = Job.objects.create(
+            name='monitor ok',
+            command='check_monitor',
+            args='imports=chroniker.models,Job query=Job.objects.filter(name="missing")',
+            is_monitor=True,
+            frequency=c.HOURLY,
+            enabled=True,
+            next_run=now,
+        )
+        bad = Job.objects.create(
+            name='monitor bad',
+            command='check_monitor',
+            args='imports=chroniker.models,Job query=Job.objects.filter(enabled=False)',
+            is_monitor=True,
+            frequency=c.HOURLY,
+            enabled=True,
+            next_run=now,
+        )
+        broken = Job.objects.create(
+            name='monitor broken',
+            command='check_monitor',
+            args='imports=chroniker.models,Job query=Job.objects.filter(nonexistent=1)',
+            is_monitor=True,
+            frequency=c.HOURLY,
+            enabled=True,
+            next_run=now,
+        )
+        disabled_count = Job.objects.filter(enabled=False).count()
+        self.assertTrue(disabled_count > 2)
+
+        # All due monitors are evaluated by the cron process itself, with capped counts.
+        _settings.CHRONIKER_MONITOR_COUNT_CAP = 2
+        try:
+            call_command('cron', update_heartbeat=0, batch_monitors=True)
+        finally:
+            _settings.CHRONIKER_MONITOR_COUNT_CAP = 0
+
+        ok = Job.objects.get(id=ok.id)
+        self.assertEqual(ok.monitor_records, 0)
+        self.assertTrue(ok.last_run_successful)
+        self.assertFalse(ok.is_running)
+        self.assertTrue(ok.next_run > timezone.now())
+        self.assertEqual(ok.logs.get().stdout, '0 records require attention.\n')
+
+        bad = Job.objects.get(id=bad.id)
+        self.assertEqual(bad.monitor_records, 3)
+        self.assertFalse(bad.last_run_successful)
+        self.assertEqual(bad.logs.get().stderr, 'More than 2 records require attention.\n')
+
+        broken = Job.objects.get(id=broken.id)
+        self.assertIsNone(broken.monitor_records)
+        self.assertFalse(broken.last_run_successful)
+        self.assertTrue('FieldError' in broken.logs.get().stderr)
+        self.assertEqual(SchedulerTick.objects.get().jobs_dispatched, 3)
+
+        # Each distinct monitor is compiled once, and a rerun counts exactly.
+        self.assertTrue(('chroniker.models,Job', 'Job.objects.filter(enabled=False)') in monitors._compiled)
+        stdout = StringIO()
+        call_command('check_monitors', force_run=True, stdout=stdout)
+        self.assertEqual(Job.objects.get(id=bad.id).monitor_records, disabled_count)
+        self.assertTrue('Evaluated 3 monitors, 2 failed.' in stdout.getvalue())
+
+        # Slow queries are interrupted.
+        with self.assertRaises(Exception):
+            with utils.statement_timeout(0.1):
+                with connection.cursor() as cursor:
+                    cursor.execute('WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM r WHERE i < 1000000000) SELECT COUNT(*) FROM r')
+
+    def testMonitorCountStrategies(self):
+        from chroniker.monitors import count_records, get_count_strategy, run_monitors
+        Job.objects.all().update(enabled=False)
+        disabled_count = Job.objects.filter(enabled=False).count()
+        self.assertTrue(disabled_count > 2)
+        q = Job.objects.filter(enabled=False)
+
+        self.assertEqual(count_records(q, strategy=c.COUNT_EXISTS), (1, c.COUNT_EXISTS))
+        self.assertEqual(count_records(q.none(), strategy=c.COUNT_EXISTS), (0, c.COUNT_EXISTS))
+        self.assertEqual(count_records(q, strategy=c.COUNT_CAPPED, cap=1), (2, c.COUNT_CAPPED))
+        # Capped counts without a cap, and estimates on SQLite without a cap,
+        # only check for any records, rather than count them all.
+        self.assertEqual(count_records(q, strategy=c.COUNT_CAPPED), (1, c.COUNT_EXISTS))
+        self.assertEqual(count_records(q, strategy=c.COUNT_ESTIMATED, cap=1), (2, c.COUNT_CAPPED))
+        self.assertEqual(count_records(q, strategy=c.COUNT_ESTIMATED), (1, c.COUNT_EXISTS))
+        self.assertEqual(count_records(q), (disabled_count, c.COUNT_EXACT))
+        self.assertEqual(count_records(q.none(), strategy=c.COUNT_ESTIMATED), (0, c.COUNT_ESTIMATED))
+
+        # Only zero vs non-zero matters, so each check costs one EXISTS query.
+        with self.assertNumQueries(1):
+            self.assertEqual(count_records(q, strategy=c.COUNT_EXISTS)[0], 1)
+
+        monitor = Job.objects.create(
+            name='monitor exists',
+            command='check_monitor',
+            args='imports=chroniker.models,Job query=Job.objects.filter(enabled=False)',
+            is_monitor=True,
+            monitor_count_strategy=c.COUNT_EXISTS,
+            frequency=c.HOURLY,
+            enabled=True,
+        )
+        run_monitors([monitor])
+        monitor = Job.objects.get(id=monitor.id)
+        self.assertEqual(monitor.monitor_records, 1)
+        self.assertEqual(monitor.monitor_records_strategy, c.COUNT_EXISTS)
+        self.assertFalse(monitor.last_run_successful)
+        self.assertEqual(monitor.logs.get().stderr, 'Records require attention.\n')
+
+        # Monitors run by check_monitor are capped by CHRONIKER_MONITOR_COUNT_CAP too.
+        self.assertEqual(get_count_strategy(Job(monitor_count_strategy=c.COUNT_EXACT)), (c.COUNT_EXACT, 0))
+        Job.objects.filter(id=monitor.id).update(monitor_count_strategy=c.COUNT_EXACT, force_run=True)
+        _settings.CHRONIKER_MONITOR_COUNT_CAP = 1
+        try:
+            self.assertEqual(get_count_strategy(Job(monitor_count_strategy=c.COUNT_EXACT)), (c.COUNT_CAPPED, 1))
+            call_command('cron', update_heartbeat=0, sync=1)
+        finally:
+            _settings.CHRONIKER_MONITOR_COUNT_CAP = 0
+        monitor = Job.objects.get(id=monitor.id)
+        self.assertEqual((monitor.monitor_records, monitor.monitor_records_strategy), (2, c.COUNT_CAPPED))
+
+    def testMonitorHistoryAlerts(self):
+        from chroniker.monitors import run_monitors, should_alert
+        Job.objects.all().update(enabled=False)
+
+        # Threshold, increase and sustained breach rules.
+        job = Job(monitor_alert_threshold=10)
+        self.assertFalse(should_alert(job, 10))
+        self.assertTrue(should_alert(job, 11))
+        job = Job(monitor_alert_increase=5)
+        self.assertFalse(should_alert(job, 50))
+        self.assertFalse(should_alert(job, 50, [46]))
+        self.assertTrue(should_alert(job, 50, [45]))
+        job = Job(monitor_alert_threshold=0, monitor_alert_sustained_checks=3)
+        self.assertFalse(should_alert(job, 1, [1]))
+        self.assertFalse(should_alert(job, 1, [1, 0]))
+        self.assertTrue(should_alert(job, 1, [1, 2]))
+        self.assertTrue(should_alert(Job(), 1))
+
+        monitor = Job.objects.create(
+            name='monitor sustained',
+            command='check_monitor',
+            args='imports=chroniker.models,Job query=Job.objects.filter(enabled=False)',
+            is_monitor=True,
+            monitor_alert_sustained_checks=2,
+            frequency=c.HOURLY,
+            enabled=True,
+        )
+        run_monitors([monitor])
+        monitor = Job.objects.get(id=monitor.id)
+        self.assertTrue(monitor.last_run_successful)
+        self.assertTrue(monitor.monitor_records > 0)
+        run_monitors([monitor])
+        monitor = Job.objects.get(id=monitor.id)
+        self.assertFalse(monitor.last_run_successful)
+        history = list(monitor.monitor_history.all())
+        self.assertEqual(len(history), 2)
+        self.assertEqual((monitor.run_count, monitor.failure_count), (2, 1))
+
+        # Backends that can't return the ids of bulk created logs save them
+        # one at a time, so their notifications can reference them.
+        monitor.email_errors_to_subscribers = True
+        monitor.save()
+        monitor.subscribers.add(User.objects.create(username='subscriber', email='subscriber@localhost'))
+        _settings.CHRONIKER_EMAIL_OUTBOX = True
+        try:
+            with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+                run_monitors([monitor])
+        finally:
+            _settings.CHRONIKER_EMAIL_OUTBOX = False
+        monitor = Job.objects.get(id=monitor.id)
+        self.assertEqual((monitor.run_count, monitor.failure_count), (3, 2))
+        self.assertEqual(Notification.objects.get().log, monitor.logs.order_by('-id')[0])
+        self.assertEqual(history[0].records, monitor.monitor_records)
+        self.assertTrue(history[0].duration_seconds >= 0)
+
+        # Old history is down-sampled to the worst check per hour, then deleted.
+        MonitorRecord.objects.all().delete()
+        now = timezone.now().replace(minute=30)
+        for days, minutes, records in ((1, 0, 1), (1, 5, 2), (10, 0, 3), (10, 5, 5), (10, 10, 4), (100, 0, 6)):
+            MonitorRecord.objects.create(job=monitor, timestamp=now - timedelta(days=days, minutes=minutes), records=records)
+        self.assertEqual(MonitorRecord.cleanup(now=now), 2)
+        self.assertEqual(sorted(MonitorRecord.objects.values_list('records', flat=True)), [1, 2, 5])
+
+    def testSyncJobs(self):
+        import json
+        from chroniker.sync import export_jobs, sync_jobs
+        user = User.objects.create(username='sync-subscriber', email='sync@localhost')
+        # Jobs are identified by name, so make them unique.
+        for job_id, name in Job.objects.values_list('id', 'name'):
+            Job.objects.filter(id=job_id).update(name='%s %i' % (name, job_id))
+        job_count = Job.objects.count()
+        self.assertTrue(job_count > 2)
+        spec = export_jobs()
+        self.assertEqual(len(spec['jobs']), job_count)
+
+        # An unchanged spec changes nothing, in a fixed number of queries.
+        with self.assertNumQueries(6):
+            result = sync_jobs(spec)
+        self.assertFalse(result.changed)
+
+        first, second = spec['jobs'][:2]
+        next_runs = dict(Job.objects.values_list('name', 'next_run'))
+        first['args'] = 'changed'
+        second['frequency'] = c.WEEKLY if second['frequency'] != c.WEEKLY else c.DAILY
+        second['subscribers'] = ['sync-subscriber']
+        spec['jobs'].append(
+            dict(
+                name='synced job',
+                raw_command='true',
+                frequency=c.HOURLY,
+                enabled=True,
+                callbacks=['chroniker.tests.tests.job_error_callback'],
+                dependencies=[dict(dependee=first['name'], wait_for_next_run=False)],
+            )
+        )
+        dependee_names = {dep['dependee'] for job_spec in spec['jobs'] for dep in job_spec['dependencies']}
+        removed = [_ for _ in spec['jobs'][2:] if _['name'] not in dependee_names][0]
+        spec['jobs'].remove(removed)
+
+        # A dry run reports the changes without saving them.
+        result = sync_jobs(spec, delete=True, dryrun=True)
+        self.assertEqual(result.created, [('synced job',)])
+        self.assertFalse(Job.objects.filter(name='synced job').exists())
+
+        stdout = StringIO()
+        spec_fn = os.path.join(tempfile.mkdtemp(), 'jobs.json')
+        with open(spec_fn, 'w') as fout:
+            json.dump(spec, fout)
+        call_command('cron_sync', spec_fn, delete=True, stdout=stdout)
+        self.assertTrue('1 jobs created, 2 updated, 1 deleted, 2 rescheduled.' in stdout.getvalue())
+        self.assertTrue('Subscribers: 1 added, 0 removed.' in stdout.getvalue())
+
+        # Only the job whose schedule changed, and the new one, were rescheduled.
+        self.assertEqual(Job.objects.get(name=first['name']).args, 'changed')
+        self.assertEqual(Job.objects.get(name=first['name']).next_run, next_runs[first['name']])
+        self.assertEqual(list(Job.objects.get(name=second['name']).subscribers.all()), [user])
+        synced = Job.objects.get(name='synced job')
+        self.assertTrue(synced.next_run > timezone.now())
+        self.assertEqual(synced.callbacks.get().reference, 'chroniker.tests.tests.job_error_callback')
+        dep = synced.dependencies.get()
+        self.assertEqual(dep.dependee.name, first['name'])
+        self.assertFalse(dep.wait_for_next_run)
+        self.assertFalse(Job.objects.filter(name=removed['name']).exists())
+        self.assertTrue(synced.id in get_dependency_graph().dependents(dep.dependee_id))
+
+        # The exported YAML spec syncs back without changes.
+        yaml_fn = os.path.join(tempfile.mkdtemp(), 'jobs.yaml')
+        call_command('cron_sync', yaml_fn, export=True)
+        stdout = StringIO()
+        call_command('cron_sync', yaml_fn, delete=True, stdout=stdout)
+        self.assertTrue('0 jobs created, 0 updated, 0 deleted' in stdout.getvalue())
+
+        # Whether a job is running isn't exported, nor changed by a sync.
+        Job.objects.filter(id=synced.id).update(is_running=True)
+        spec = export_jobs()
+        self.assertFalse(any('is_running' in job_spec for job_spec in spec['jobs']))
+        self.assertFalse(sync_jobs(spec).changed)
+        self.assertTrue(Job.objects.get(id=synced.id).is_running)
+        Job.objects.all().delete()
+        sync_jobs(spec)
+        self.assertFalse(Job.objects.get(name='synced job').is_running)
+
+    def testJobSaveChangedFields(self):
+        job = Job.objects.get(id=1)
+        next_run = job.next_run
+
+        # A status change writes only that field, in one query.
+        job.last_run_successful = not job.last_run_successful
+        with self.assertNumQueries(1):
+            job.save()
+        with self.assertNumQueries(0):
+            job.save()
+        self.assertEqual(Job.objects.get(id=1).last_run_successful, job.last_run_successful)
+
+        # Saving doesn't overwrite fields changed elsewhere.
+        Job.objects.filter(id=1).update(args='changed')
+        job.name = 'renamed'
+        job.save()
+        job = Job.objects.get(id=1)
+        self.assertEqual(job.args, 'changed')
+        self.assertEqual(job.name, 'renamed')
+        self.assertEqual(job.next_run, next_run)
+
+        # Schedule changes reschedule the job.
+        job.frequency = c.DAILY
+        job.save()
+        self.assertNotEqual(Job.objects.get(id=1).next_run, next_run)
+
+        # Saving doesn't trim logs, but runs and cleaning do.
+        for i in range(5):
+            Log.objects.create(job=job, run_start_datetime=timezone.now() - timedelta(minutes=i), run_end_datetime=timezone.now() - timedelta(minutes=i), success=True)
+        job.maximum_log_entries = 2
+        job.save()
+        self.assertEqual(job.logs.count(), 5)
+        call_command('cron_clean', 'days', 1)
+        self.assertEqual(job.logs.count(), 2)
+
+        # A job marked running the way cron's launch() does, then stopped
+        # the way an expired process is, is written as stopped.
+        job = Job.objects.get(id=1)
+        job.write_fields(is_running=True)
+        self.assertTrue(Job.objects.get(id=1).is_running)
+        job.is_running = False
+        job.save()
+        self.assertFalse(Job.objects.get(id=1).is_running)
+
+        # Saving a job after marking it running doesn't write the run's state
+        # back over a run that has since ended.
+        job.mark_running()
+        Job.objects.filter(id=1).update(is_running=False, current_pid=None)
+        job.name = 'renamed again'
+        job.save()
+        row = Job.objects.get(id=1)
+        self.assertEqual((row.name, row.is_running, row.current_pid), ('renamed again', False, None))
+
+    def testJobRuntime(self):
+        job = Job.objects.get(id=1)
+        self.assertIsNone(job.last_heartbeat)
+        self.assertEqual(job.total_parts, 0)
+        stale_copy = Job.objects.get(id=1)
+        job.mark_running()
+        self.assertTrue(job.last_heartbeat)
+
+        # Progress and heartbeats only write to the runtime table.
+        context = JobContext(job_id=job.id, flush_seconds=0)
+        with CaptureQueriesContext(connection) as queries:
+            context.update_progress(total_parts=10, total_parts_complete=4)
+        self.assertTrue(queries.captured_queries)
+        self.assertTrue(all('chroniker_jobruntime' in _['sql'] and 'UPDATE "chroniker_job"' not in _['sql'] for _ in queries.captured_queries))
+        self.assertEqual(Job.objects.get(id=1).progress_ratio, 0.4)
+
+        # Saving a copy of the job loaded before it started doesn't change its run.
+        stale_copy.name = 'renamed'
+        stale_copy.save()
+        job = Job.objects.get(id=1)
+        self.assertTrue(job.is_running)
+        self.assertEqual(job.current_pid, str(os.getpid()))
+        self.assertEqual(job.total_parts_complete, 4)
+
+        # Stale jobs are found by their runtime's heartbeat.
+        self.assertFalse(Job.objects.stale().filter(id=1).exists())
+        JobRuntime.set_state([job.id], last_heartbeat=timezone.now() - timedelta(days=1))
+        self.assertTrue(Job.objects.stale().filter(id=1).exists())
+
+        # Progress is kept on the job of a context even before its runtime row exists.
+        context = JobContext(job_id=2, flush_seconds=60)
+        self.assertFalse(JobRuntime.objects.filter(job_id=2).exists())
+        self.assertIs(context.job.get_runtime(), context.job.get_runtime())
+        context.update_progress(total_parts=10, total_parts_complete=3)
+        context.update_progress(total_parts=10, total_parts_complete=5)
+        context.pop_pending()
+        self.assertEqual((context.job.total_parts, context.job.total_parts_complete), (10, 5))
+
+        # Creating rows for some jobs still updates those that already have one.
+        JobRuntime.set_state([1, 2, 3], total_parts=7)
+        self.assertEqual(list(JobRuntime.objects.filter(job_id__in=[1, 2, 3]).values_list('total_parts', flat=True)), [7, 7, 7])
+
+    def testHostGroupSharding(self):
+        from chroniker.sharding import RING_SIZE, get_hash_ring, invalidate_hash_rings
+        hostname = socket.gethostname()
+        jobs = list(Job.objects.all())
+        for i, job in enumerate(jobs):
+            job.ring_position = i * (RING_SIZE // len(jobs)) + 12345
+        Job.objects.bulk_update(jobs, ['ring_position'])
+        Job.objects.update(host_group='workers', enabled=True, is_running=False)
+
+        # Hosts outside the group don't claim its jobs.
+        self.assertEqual(Job.objects.due().count(), 0)
+
+        _settings.CHRONIKER_HOST_GROUP = 'workers'
+        try:
+            WorkerHost.heartbeat()
+            WorkerHost.objects.create(hostname='other-host', group='workers')
+            invalidate_hash_rings()
+
+            # Each job is claimed by exactly one live host.
+            ring = get_hash_ring('workers')
+            self.assertEqual(ring.hosts, sorted([hostname, 'other-host']))
+            mine = {job.id for job in jobs if ring.get_host(job.ring_position) == hostname}
+            self.assertTrue(mine)
+            self.assertTrue(len(mine) < len(jobs))
+            self.assertEqual(set(Job.objects.due().values_list('id', flat=True)), mine)
+
+            # When a host leaves the group, its jobs move to the others.
+            WorkerHost.objects.filter(hostname='other-host').update(last_heartbeat=timezone.now() - timedelta(days=1))
+            invalidate_hash_rings()
+            self.assertEqual(Job.objects.due().count(), len(jobs))
+        finally:
+            _settings.CHRONIKER_HOST_GROUP = ''
+            invalidate_hash_rings()
+
+    def testHostPlacement(self):
+        from chroniker.placement import place_jobs
+
+        hosts = [
+            WorkerHost(hostname='busy', capacity=4, running_count=3, cpu_count=4, load_average=3),
+            WorkerHost(hostname='idle', capacity=4, running_count=0, cpu_count=4, load_average=0.5),
+        ]
+        jobs = [Job(id=i, name='job %i' % i) for i in range(1, 6)]
+        jobs[0].last_hostname = 'busy'
+
+        # Jobs go to the least loaded host with room, or back to their last host.
+        placements = place_jobs(jobs, hosts, prefer_last_host=True)
+        self.assertEqual(placements, {1: 'busy', 2: 'idle', 3: 'idle', 4: 'idle', 5: 'idle'})
+        placements = place_jobs(jobs, hosts, prefer_last_host=False)
+        self.assertEqual(placements, {1: 'idle', 2: 'idle', 3: 'idle', 4: 'idle', 5: 'busy'})
+
+        # Once every host is full, the remaining jobs wait.
+        hosts[1].capacity = 2
+        placements = place_jobs(jobs, hosts, prefer_last_host=False)
+        self.assertEqual(sorted(placements), [1, 2, 3])
+
+        # Hosts planning their own due jobs see different due sets, so without
+        # the planner they split the group's jobs by hash, each job going to
+        # exactly one host whatever the others have already started.
+        from chroniker import dispatch
+        from chroniker.sharding import get_hash_ring, invalidate_hash_rings
+        Job.objects.update(host_group='workers', enabled=True, is_running=False, hostname='')
+        WorkerHost.objects.create(hostname='host-a', group='workers', capacity=100)
+        WorkerHost.objects.create(hostname='host-b', group='workers', capacity=1)
+        invalidate_hash_rings()
+        _settings.CHRONIKER_HOST_GROUP = 'workers'
+        _settings.CHRONIKER_HOST_PLACEMENT = c.PLACEMENT_LEAST_LOADED
+        try:
+            ring = get_hash_ring('workers')
+            due_a = set(Job.objects.filter(ring.get_q('host-a')).values_list('id', flat=True))
+            Job.objects.filter(id__in=due_a).update(is_running=True)
+            due_b = set(Job.objects.filter(ring.get_q('host-b')).filter(is_running=False).values_list('id', flat=True))
+            self.assertFalse(due_a & due_b)
+            self.assertEqual(due_a | due_b, set(Job.objects.values_list('id', flat=True)))
+            Job.objects.update(is_running=False)
+
+            # With the planner, one process places every due job by load, and
+            # each host claims only those placed on it.
+            WorkerHost.heartbeat(capacity=2)
+            host = WorkerHost.objects.get(hostname=socket.gethostname())
+            self.assertEqual((host.group, host.capacity, host.running_count), ('workers', 2, 0))
+            self.assertTrue(host.free_memory)
+            invalidate_hash_rings()
+            ring = get_hash_ring('workers')
+            self.assertEqual(
+                {job.id for job in Job.objects.due()},
+                set(Job.objects.filter(ring.get_q(socket.gethostname())).values_list('id', flat=True)),
+            )
+            WorkerHost.objects.filter(hostname=socket.gethostname()).update(draining=True)
+            self.assertEqual(dispatch.plan(), Job.objects.count())
+            claimed_a = {job.id for job in dispatch.claim(hostname='host-a')}
+            claimed_b = {job.id for job in dispatch.claim(hostname='host-b')}
+            self.assertEqual(len(claimed_b), 1)
+            self.assertFalse(claimed_a & claimed_b)
+            self.assertEqual(len(claimed_a | claimed_b), Job.objects.count())
+            # The draining host is given none.
+            self.assertEqual(dispatch.claim(), [])
+        finally:
+            _settings.CHRONIKER_HOST_GROUP = ''
+            _settings.CHRONIKER_HOST_PLACEMENT = c.PLACEMENT_HASH
+            invalidate_hash_rings()
+
+    def testDispatchQueue(self):
+        from chroniker import dispatch
+
+        # Only one host holds the planner lease, until it lapses.
+        self.assertTrue(dispatch.acquire_planner_lease(holder='host-a'))
+        self.assertTrue(dispatch.acquire_planner_lease(holder='host-a'))
+        self.assertFalse(dispatch.acquire_planner_lease(holder='host-b'))
+        SchedulerLease.objects.filter(name=dispatch.PLANNER_LEASE).update(expires_datetime=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(dispatch.acquire_planner_lease(holder='host-b'))
+        self.assertFalse(dispatch.acquire_planner_lease(holder='host-a'))
+        SchedulerLease.release(dispatch.PLANNER_LEASE, holder='host-b')
+
+        # The planner queues the jobs due on every host once.
+        Job.objects.update(enabled=True, is_running=False)
+        pinned = Job.objects.get(id=1)
+        Job.objects.filter(id=pinned.id).update(hostname='other-host')
+        due_ids = {job.id for job in Job.objects.due_with_met_dependencies(any_host=True)}
+        self.assertTrue(pinned.id in due_ids)
+        self.assertFalse(pinned.id in {job.id for job in Job.objects.due_with_met_dependencies()})
+        self.assertEqual(dispatch.plan(), len(due_ids))
+        self.assertEqual(dispatch.plan(), 0)
+        self.assertEqual(DispatchEntry.objects.get(job_id=pinned.id).target_hostname, 'other-host')
+
+        # Executors claim the jobs they may run, each only once.
+        claimed = dispatch.claim(limit=2)
+        self.assertEqual(len(claimed), 2)
+        claimed += dispatch.claim()
+        self.assertEqual({job.id for job in claimed}, due_ids - {pinned.id})
+        self.assertEqual(dispatch.claim(), [])
+        self.assertEqual([job.id for job in dispatch.claim(hostname='other-host')], [pinned.id])
+
+        # Claimed jobs stay queued, so a plan before they start doesn't queue them again.
+        self.assertEqual(DispatchEntry.objects.filter(claimed_by='').count(), 0)
+        self.assertEqual(dispatch.plan(), 0)
+        self.assertEqual(dispatch.claim(hostname='host-b'), [])
+        self.assertEqual(dispatch.claim(hostname='other-host'), [])
+
+        # A job whose executor died after claiming it is requeued after the claim timeout.
+        lost = DispatchEntry.objects.filter(target_hostname='').first().job
+        DispatchEntry.objects.filter(job_id=lost.id).update(claimed_datetime=timezone.now() - timedelta(days=1))
+        self.assertEqual(dispatch.plan(), 1)
+        self.assertEqual([job.id for job in dispatch.claim(hostname='host-b')], [lost.id])
+
+        # A claimed job that isn't started is returned to the queue, and one
+        # that is started is removed from it.
+        dispatch.release(lost.id, hostname='host-b')
+        self.assertEqual([job.id for job in dispatch.claim(hostname='host-c')], [lost.id])
+        for job in Job.objects.filter(id__in=due_ids):
+            job.mark_running()
+            dispatch.unqueue(job.id)
+        self.assertFalse(DispatchEntry.objects.exists())
+        self.assertEqual(dispatch.plan(), 0)
+
+        # A cron run plans and runs the queued jobs.
+        Job.objects.update(enabled=False)
+        job = Job.objects.create(name='queued', raw_command='echo queued', frequency='MINUTELY', next_run=timezone.now() - timedelta(minutes=1))
+        call_command('cron', update_heartbeat=0, sync=1, dispatch_queue=1)
+        self.assertEqual(job.logs.get().stdout, 'queued\n')
+        self.assertEqual(SchedulerLease.objects.get(name=dispatch.PLANNER_LEASE).holder, socket.gethostname())
+        self.assertFalse(DispatchEntry.objects.exists())
+
+        # Batched monitors are removed from the queue too, so they're queued
+        # again as soon as they're next due.
+        Job.objects.update(enabled=False)
+        monitor = Job.objects.create(
+            name='queued monitor',
+            command='check_monitor',
+            args='imports=chroniker.models,Job query=Job.objects.filter(name="missing")',
+            is_monitor=True,
+            frequency='MINUTELY',
+            enabled=True,
+            next_run=timezone.now() - timedelta(minutes=1),
+        )
+        call_command('cron', update_heartbeat=0, dispatch_queue=1, batch_monitors=True)
+        self.assertTrue(Job.objects.get(id=monitor.id).last_run_successful)
+        self.assertFalse(DispatchEntry.objects.exists())
+        Job.objects.filter(id=monitor.id).update(next_run=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(dispatch.plan(), 1)
+
+
+class CallbackBackgroundTestCase(TransactionTestCase):
+    """
+    Runs callbacks in the background, as they are by default, outside a test
+    transaction so the background thread can record their results.
+    """
+
+    def testBackgroundCallbacks(self):
+        from chroniker.callbacks import join_background
+        job = Job.objects.create(
+            name='background callbacks',
+            command='test_error',
+            frequency=c.HOURLY,
+            callback_errors_to_subscribers=True,
+        )
+        for name in ('slow_callback', 'failing_callback'):
+            job.callbacks.add(CallbackMethod.objects.create(name=name, reference='chroniker.tests.tests.%s' % name))
+        log = Log.objects.create(job=job, run_start_datetime=timezone.now(), success=False)
+
+        # The finished run doesn't wait for its callbacks.
+        _settings.CHRONIKER_CALLBACK_BACKGROUND = True
+        _settings.CHRONIKER_CALLBACK_TIMEOUT_SECONDS = 0.5
+        try:
+            t0 = time.time()
+            job.notify_subscribers(log, stdout='', stderr='error')
+            self.assertTrue(time.time() - t0 < 0.5)
+            self.assertIsNone(Log.objects.get(id=log.id).callback_results)
+            join_background()
+        finally:
+            _settings.CHRONIKER_CALLBACK_BACKGROUND = False
+            _settings.CHRONIKER_CALLBACK_TIMEOUT_SECONDS = 30
+
+        # Their results are recorded once they finish.
+        results = {_['reference'].split('.')[-1]: _ for _ in Log.objects.get(id=log.id).callback_results}
+        self.assertTrue(results['slow_callback']['error'].startswith('Timed out'))
+        self.assertEqual(results['failing_callback']['error'], 'Webhook unavailable')
@@ -3,6 +3,8 @@ from django.urls import re_path as url, include
 from django.core.exceptions import ImproperlyConfigured
 from django.contrib import admin
 
+from chroniker import views
+
 admin.autodiscover()
 
 try:
@@ -15,4 +17,7 @@ except ImproperlyConfigured:
         url(r'^admin/', admin.site.urls),
     ]
 
-urlpatterns = _patterns
+urlpatterns = _patterns + [
+    url(r'^chroniker/metrics/$', views.metrics, name='chroniker_metrics'),
+    url(r'^chroniker/jobs/(?P<pk>[0-9]+)/chain/$', views.job_chain, name='chroniker_job_chain'),
+]
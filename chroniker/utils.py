@@ -1,10 +1,12 @@
 import html
 import errno
 import os
+import resource
 import signal
 import sys
 import time
 import warnings
+from contextlib import contextmanager
 from datetime import timedelta
 from importlib import import_module
 from multiprocessing import Process, current_process
@@ -18,18 +20,24 @@ import psutil
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db import connection
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.encoding import smart_str
 from django.utils.html import format_html
 
 from . import constants as c
+from . import settings as _settings
 
 
-def get_etc(complete_parts, total_parts, start_datetime, current_datetime=None, as_seconds=False):
+def get_etc(complete_parts, total_parts, start_datetime, current_datetime=None, as_seconds=False, rate=None):
     """
     Estimates a job's expected time to completion.
+
+    If a processing rate, in parts per second, is given, the remaining parts
+    are projected from the current time at that rate. Otherwise, a linear
+    projection from the start time is used.
     """
     current_datetime = current_datetime or timezone.now()
 
@@ -38,13 +46,19 @@ def get_etc(complete_parts, total_parts, start_datetime, current_datetime=None,
 
     if total_parts:
 
-        # Estimate the total seconds the task will take to complete by using
-        # a linear projection.
-        total_seconds = passed_seconds / complete_parts * total_parts
+        if rate:
+            # Project the remaining parts onto the current time using the
+            # observed processing rate.
+            remaining_seconds = max(total_parts - complete_parts, 0) / float(rate)
+            etc = current_datetime + timedelta(seconds=remaining_seconds)
+        else:
+            # Estimate the total seconds the task will take to complete by using
+            # a linear projection.
+            total_seconds = passed_seconds / complete_parts * total_parts
 
-        # Estimate the expected time of completion by projecting the duration
-        # onto the start time.
-        etc = start_datetime + timedelta(seconds=total_seconds)
+            # Estimate the expected time of completion by projecting the duration
+            # onto the start time.
+            etc = start_datetime + timedelta(seconds=total_seconds)
 
         # If we only want remaining seconds, return difference between ETC and
         # the current time in seconds.
@@ -59,6 +73,37 @@ def get_remaining_seconds(*args, **kwargs):
     return get_etc(*args, **kwargs)
 
 
+def percentile(values, pct):
+    """
+    Returns the given percentile, from 0 to 100, of a list of numbers, using
+    linear interpolation between the closest ranks.
+    Returns None if the list is empty.
+    """
+    values = sorted(values)
+    if not values:
+        return
+    k = (len(values) - 1) * pct / 100.
+    lower = int(k)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def format_table(headers, rows):
+    """
+    Returns a list of lines displaying the given rows as left-aligned columns.
+    """
+    widths = [max(len(str(_)) for _ in col) for col in zip(headers, *rows)]
+    return ['  '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip() for row in [headers] + list(rows)]
+
+
+def parse_bool(value):
+    """
+    Returns true if a request parameter's value is one of the usual true
+    strings, so "0" and "false" are false.
+    """
+    return str(value or '').strip().lower() in ('1', 'true', 't', 'yes', 'y', 'on')
+
+
 def get_admin_change_url(obj):
     ct = ContentType.objects.get_for_model(obj)
     change_url_name = 'admin:%s_%s_change' % (ct.app_label, ct.model)
@@ -192,6 +237,230 @@ class LockingManager(models.Manager):
         return cursor
 
 
+class ConnectionLifecycle:
+    """
+    Manages the database connections of the scheduler and the job processes
+    it forks.
+
+    A connection inherited across a fork shares its socket with the parent,
+    so both processes talking over it corrupts the session. Rather than
+    closing the connection before every fork, which forces a reconnect in the
+    parent, the child drops its inherited copies immediately after the fork
+    and opens its own on first use. The parent keeps reusing its connection
+    across the whole planning loop.
+
+    Also counts the connections opened in this process since the start of the
+    current tick.
+    """
+
+    def __init__(self):
+        self.installed = False
+        self.opens = 0
+        # Connections inherited from the parent. We hold on to them so the
+        # driver never finalizes them in the child, which would end the
+        # session the parent is still using.
+        self._inherited = []
+
+    def install(self):
+        """
+        Registers the fork and connection hooks. Safe to call repeatedly.
+        """
+        if self.installed:
+            return self
+        connection_created.connect(self._on_connection_created, dispatch_uid='chroniker_connection_lifecycle')
+        os.register_at_fork(after_in_child=self.after_fork_in_child)
+        self.installed = True
+        return self
+
+    def _on_connection_created(self, sender, connection, **kwargs): # pylint: disable=W0621
+        self.opens += 1
+
+    def after_fork_in_child(self):
+        """
+        Detaches this process from any connections inherited from its parent
+        without closing them.
+        """
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is not None:
+                self._inherited.append(conn.connection)
+                conn.connection = None
+        self.opens = 0
+
+    def ensure_usable(self):
+        """
+        Closes any connection that has been broken, e.g. by a server-side
+        timeout, so the next query reconnects.
+        """
+        for conn in connections.all(initialized_only=True):
+            if conn.connection is not None and not conn.is_usable():
+                conn.close()
+
+    def start_tick(self):
+        """
+        Prepares the connections for a new scheduler tick and resets the
+        open counter.
+        """
+        self.install()
+        self.ensure_usable()
+        self.opens = 0
+
+
+connection_lifecycle = ConnectionLifecycle()
+
+
+class PhaseTimer:
+    """
+    Records the wall time and number of database queries of each named phase
+    of a process.
+
+    Queries are counted with an execute wrapper on the current thread's
+    connection, so this is cheap enough to leave on and doesn't need DEBUG.
+    """
+
+    def __init__(self):
+        self.phases = {} # {name:{'seconds':float, 'queries':int}}
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times the enclosed block, adding to any previous time of the same phase.
+        """
+        stats = self.phases.setdefault(name, dict(seconds=0., queries=0))
+
+        def count_query(execute, sql, params, many, context):
+            stats['queries'] += 1
+            return execute(sql, params, many, context)
+
+        t0 = time.time()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield
+        finally:
+            stats['seconds'] += time.time() - t0
+
+    def get_seconds(self, name):
+        return self.phases.get(name, {}).get('seconds', 0.)
+
+    @property
+    def queries(self):
+        return sum(_['queries'] for _ in self.phases.values())
+
+
+@contextmanager
+def statement_timeout(seconds, using='default'):
+    """
+    Aborts any query made in the enclosed block that runs longer than the
+    given number of seconds, on backends that support it.
+
+    On PostgreSQL, the block runs in a transaction so the timeout is local to it.
+    """
+    if not seconds:
+        yield
+        return
+    conn = connections[using]
+    milliseconds = int(seconds * 1000)
+    if conn.vendor == 'postgresql':
+        with transaction.atomic(using=using):
+            with conn.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [milliseconds])
+            yield
+    elif conn.vendor == 'mysql' and not conn.mysql_is_mariadb:
+        with conn.cursor() as cursor:
+            cursor.execute('SET SESSION max_execution_time = %s', [milliseconds])
+        try:
+            yield
+        finally:
+            with conn.cursor() as cursor:
+                cursor.execute('SET SESSION max_execution_time = 0')
+    elif conn.vendor == 'sqlite':
+        # Interrupt the query from SQLite's progress handler once the time is up.
+        conn.ensure_connection()
+        deadline = time.time() + seconds
+        conn.connection.set_progress_handler(lambda: int(time.time() > deadline), 1000)
+        try:
+            yield
+        finally:
+            conn.connection.set_progress_handler(None, 0)
+    else:
+        yield
+
+
+class ResourceMonitor:
+    """
+    Tracks the resources used by the current process and all its descendants
+    over the course of a job run.
+
+    CPU time and I/O are measured as the change in ``getrusage()`` and the
+    process's I/O counters between the start and end of the run. Both include
+    every child process that has been waited on, so no per-child bookkeeping
+    is needed. Peak memory and the number of child processes can only be
+    observed while the processes exist, so ``sample()`` should be called
+    periodically, e.g. from the job's heartbeat. The lifetime ``ru_maxrss``
+    isn't used, since it includes the memory of the scheduler and of earlier
+    runs in the same process.
+    """
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.peak_rss_bytes = 0
+        self.max_child_processes = 0
+        self._start = self._snapshot()
+        self.sample()
+
+    def _snapshot(self):
+        usage_self = resource.getrusage(resource.RUSAGE_SELF)
+        usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            io = self.process.io_counters()
+            read_bytes, write_bytes = io.read_bytes, io.write_bytes
+        except (AttributeError, psutil.Error):
+            # I/O counters aren't available on all platforms, e.g. macOS.
+            read_bytes = write_bytes = None
+        return dict(
+            user=usage_self.ru_utime + usage_children.ru_utime,
+            system=usage_self.ru_stime + usage_children.ru_stime,
+            read_bytes=read_bytes,
+            write_bytes=write_bytes,
+        )
+
+    def sample(self):
+        """
+        Records the current memory usage and number of child processes.
+        """
+        try:
+            children = self.process.children(recursive=True)
+            rss = self.process.memory_info().rss
+        except psutil.Error:
+            return
+        for child in children:
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        self.max_child_processes = max(self.max_child_processes, len(children))
+
+    def finish(self):
+        """
+        Returns a dict of the resources used since this monitor was created,
+        keyed by the corresponding ``Log`` field names.
+        """
+        self.sample()
+        end = self._snapshot()
+        usage = dict(
+            cpu_user_seconds=end['user'] - self._start['user'],
+            cpu_system_seconds=end['system'] - self._start['system'],
+            peak_rss_bytes=self.peak_rss_bytes,
+            read_bytes=None,
+            write_bytes=None,
+            max_child_processes=self.max_child_processes,
+        )
+        if end['read_bytes'] is not None and self._start['read_bytes'] is not None:
+            usage['read_bytes'] = end['read_bytes'] - self._start['read_bytes']
+            usage['write_bytes'] = end['write_bytes'] - self._start['write_bytes']
+        return usage
+
+
 def pid_exists(pid):
     """
     Returns true if the process associated with the given PID is still running.
@@ -227,39 +496,251 @@ def get_cpu_usage(pid, interval=1):
     return usage
 
 
-def kill_process(pid):
+def _is_running(process):
+    try:
+        return process.is_running() and process.status() != psutil.STATUS_ZOMBIE
+    except psutil.Error:
+        return False
+
+
+def wait_for_exit(processes, timeout):
+    """
+    Waits up to timeout seconds for all the given ``psutil.Process`` handles
+    to exit, and returns those still running.
+
+    Unlike ``psutil.wait_procs()``, this never reaps our own children, so
+    ``multiprocessing`` can still collect their exit codes.
+    """
+    deadline = time.time() + timeout
+    alive = [_ for _ in processes if _is_running(_)]
+    while alive and time.time() < deadline:
+        time.sleep(0.05)
+        alive = [_ for _ in alive if _is_running(_)]
+    return alive
+
+
+def get_process_group(pgid):
+    """
+    Returns ``psutil.Process`` handles for all live processes in the given
+    process group, including any orphaned by their parents.
+
+    This scans the whole process table, so prefer the handles a
+    ``ProcessTreeSampler`` already has where there is one.
+    """
+    processes = []
+    for process in psutil.process_iter():
+        try:
+            if os.getpgid(process.pid) == pgid and _is_running(process):
+                processes.append(process)
+        except (OSError, psutil.Error):
+            pass
+    return processes
+
+
+def kill_process_group(pgid, sig=signal.SIGTERM, grace_seconds=None, processes=None):
+    """
+    Sends the signal to every process in the group, plus the given processes,
+    then waits up to grace_seconds for them to exit before killing any that
+    remain.
+
+    Only the given processes are waited on and counted, so the process table
+    isn't scanned for the group's members unless none are given.
+
+    Returns a dict with the seconds termination took, the number of processes
+    reaped and whether SIGKILL was needed.
+    """
+    if grace_seconds is None:
+        grace_seconds = _settings.CHRONIKER_KILL_GRACE_SECONDS
+    t0 = time.time()
+    if processes is None:
+        processes = get_process_group(pgid)
+    targets = list({_.pid: _ for _ in processes if _is_running(_)}.values())
+
+    def send(sig, processes):
+        try:
+            os.killpg(pgid, sig)
+        except OSError:
+            # The group has already exited, or was never created.
+            pass
+        for process in processes:
+            try:
+                process.send_signal(sig)
+            except psutil.Error:
+                pass
+
+    send(sig, targets)
+    alive = wait_for_exit(targets, grace_seconds)
+    escalated = bool(alive)
+    if alive:
+        send(signal.SIGKILL, alive)
+        alive = wait_for_exit(alive, grace_seconds)
+    return dict(
+        kill_seconds=time.time() - t0,
+        processes_reaped=len(targets) - len(alive),
+        kill_escalated=escalated,
+    )
+
+
+def kill_processes(pids, grace_seconds=None):
+    """
+    Kills the processes associated with the given PIDs, and returns the PIDs
+    of those that couldn't be killed.
+
+    Each signal is sent to every remaining process before waiting for any of
+    them, and the signals before SIGKILL share grace_seconds between them, so
+    the whole escalation takes at most twice grace_seconds however many
+    processes there are.
+    """
+    if grace_seconds is None:
+        grace_seconds = _settings.CHRONIKER_KILL_GRACE_SECONDS
+    processes = []
+    for pid in pids:
+        try:
+            processes.append(psutil.Process(int(pid)))
+        except psutil.NoSuchProcess:
+            pass
+    failed = set()
+
+    # Try sending a keyboard interrupt, then ask politely again and once
+    # more, before we've been ignored and just murder it.
+    polite = (signal.SIGINT, signal.SIGABRT, signal.SIGTERM)
+    for sig in polite + (signal.SIGKILL,):
+        for process in list(processes):
+            try:
+                process.send_signal(sig)
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.Error:
+                # Our user likely doesn't have permission to kill the process.
+                failed.add(process.pid)
+                processes.remove(process)
+        processes = wait_for_exit(processes, grace_seconds if sig == signal.SIGKILL else grace_seconds / len(polite))
+        if not processes:
+            break
+    return failed | {_.pid for _ in processes}
+
+
+def kill_process(pid, grace_seconds=None):
     """
     Kills the process associated with the given PID.
     Returns true if the process was successfully killed.
     Returns false otherwise.
     """
-    pid = int(pid)
-    try:
+    return not kill_processes([pid], grace_seconds=grace_seconds)
 
-        # Try sending a keyboard interrupt.
-        os.kill(pid, signal.SIGINT) # 2
-        if not pid_exists(pid):
-            return True
-
-        # Ask politely again.
-        os.kill(pid, signal.SIGABRT) # 6
-        if not pid_exists(pid):
-            return True
-
-        # Try once more.
-        os.kill(pid, signal.SIGTERM) # 15
-        if not pid_exists(pid):
-            return True
-
-        # We've asked nicely and we've been ignored, so just murder it.
-        os.kill(pid, signal.SIGKILL) # 9
-        if not pid_exists(pid):
-            return True
-
-    except OSError:
-        # Something strange happened.
-        # Our user likely doesn't have permission to kill the process.
-        return False
+
+class ProcessTreeSampler:
+    """
+    Incrementally tracks the CPU time used by a process and all of its
+    descendants, without blocking.
+
+    ``psutil.Process`` handles are cached between samples and CPU times are
+    accumulated as deltas, so the totals keep including descendants that have
+    since exited. Finding new descendants means scanning the whole process
+    table, so it's only done every ``discover_seconds``.
+
+    With track_usage, the tree's peak memory, I/O and number of processes are
+    also sampled, for processes whose usage ``ResourceMonitor`` can't measure
+    because they aren't children of a job's own process.
+    """
+
+    def __init__(self, pid, discover_seconds=None, track_usage=False):
+        self.pid = pid
+        if discover_seconds is None:
+            discover_seconds = _settings.CHRONIKER_PROCESS_DISCOVERY_SECONDS
+        self.discover_seconds = discover_seconds
+        self.track_usage = track_usage
+        self.user_seconds = 0.
+        self.system_seconds = 0.
+        self.cpu_percent = 0.
+        self.peak_rss_bytes = 0
+        self.max_processes = 0
+        # Left as None if I/O counters aren't available, e.g. on macOS.
+        self.read_bytes = None
+        self.write_bytes = None
+        self._root = psutil.Process(pid)
+        self._processes = {pid: self._root} # {pid:psutil.Process}
+        self._times = {} # {pid:(user_seconds, system_seconds)}
+        self._io = {} # {pid:(read_bytes, write_bytes)}
+        self._last_discovery = None
+        self._last_sample = None # (timestamp, user_seconds + system_seconds)
+
+    def discover(self):
+        """
+        Adds handles for any descendants started since the last discovery.
+        """
+        self._last_discovery = time.time()
+        try:
+            children = self._root.children(recursive=True)
+        except psutil.Error:
+            return
+        for child in children:
+            self._processes.setdefault(child.pid, child)
+
+    def descendants(self):
+        """
+        Returns the cached handles of the root's descendants that were alive at
+        the last sample.
+        """
+        return [_ for _ in self._processes.values() if _.pid != self.pid]
+
+    def sample(self, discover=False):
+        """
+        Updates the CPU totals from all known processes and returns self.
+        """
+        now = time.time()
+        if discover or self._last_discovery is None or now - self._last_discovery >= self.discover_seconds:
+            self.discover()
+        for pid, process in list(self._processes.items()):
+            try:
+                times = process.cpu_times()
+            except psutil.Error:
+                # The process has exited, but its last observed times remain
+                # in the totals.
+                del self._processes[pid]
+                self._times.pop(pid, None)
+                continue
+            last_user, last_system = self._times.get(pid, (0., 0.))
+            self.user_seconds += times.user - last_user
+            self.system_seconds += times.system - last_system
+            self._times[pid] = (times.user, times.system)
+        if self.track_usage:
+            self._sample_usage()
+        total = self.user_seconds + self.system_seconds
+        if self._last_sample is not None and now > self._last_sample[0]:
+            self.cpu_percent = (total - self._last_sample[1]) / (now - self._last_sample[0]) * 100
+        self._last_sample = (now, total)
+        return self
+
+
+    def _sample_usage(self):
+        rss = 0
+        for pid, process in list(self._processes.items()):
+            try:
+                rss += process.memory_info().rss
+                io = process.io_counters()
+            except (AttributeError, psutil.Error):
+                continue
+            last_read, last_write = self._io.get(pid, (0, 0))
+            self.read_bytes = (self.read_bytes or 0) + io.read_bytes - last_read
+            self.write_bytes = (self.write_bytes or 0) + io.write_bytes - last_write
+            self._io[pid] = (io.read_bytes, io.write_bytes)
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        self.max_processes = max(self.max_processes, len(self._processes))
+
+    def usage(self):
+        """
+        Returns the resources the tree used as of the last sample, keyed by
+        the corresponding ``Log`` field names, like ``ResourceMonitor.finish()``.
+        """
+        return dict(
+            cpu_user_seconds=self.user_seconds,
+            cpu_system_seconds=self.system_seconds,
+            peak_rss_bytes=self.peak_rss_bytes,
+            read_bytes=self.read_bytes,
+            write_bytes=self.write_bytes,
+            max_child_processes=self.max_processes,
+        )
 
 
 class TimedProcess(Process):
@@ -288,43 +769,30 @@ class TimedProcess(Process):
         self.check_freq = check_freq
         self.time_type = time_type
         self._p = None
-        self._process_times = {} # {pid:user_seconds}
-        self._last_duration_seconds = None
+        self._sampler = None
+        # The process tree's user CPU seconds as of the last sample before termination.
+        self.last_cpu_user_seconds = None
+        self.kill_info = None
 
-    def terminate(self, sig=15, *args, **kwargs):
+    def terminate(self, sig=signal.SIGTERM, grace_seconds=None, *args, **kwargs):
         """
-        sig := 6=abrt, 9=kill, 15=term
+        Signals the process's whole process group, including any descendants
+        orphaned by their parents, and kills any still running after
+        grace_seconds.
+
+        The results of ``kill_process_group()`` are stored in ``kill_info``.
         """
+        processes = None
         if self.is_alive() and self._p:
-            # Explicitly kill children since the default terminate() doesn't
-            # seem to do this very reliably.
-            try:
-                for child in self._p.get_children():
-                    # Do one last time check.
-                    self._process_times[child.pid] = child.get_cpu_times().user
-                    os.system('kill -%i %i' % (
-                        sig,
-                        child.pid,
-                    ))
-                # Sum final time.
-                self._process_times[self._p.pid] = self._p.get_cpu_times().user
-                self._last_duration_seconds = sum(self._process_times.itervalues())
-            except AttributeError:
-                for child in self._p.children():
-                    # Do one last time check.
-                    self._process_times[child.pid] = child.cpu_times().user
-                    os.system('kill -%i %i' % (
-                        sig,
-                        child.pid,
-                    ))
-                # Sum final time.
-                self._process_times[self._p.pid] = self._p.cpu_times().user
-                self._last_duration_seconds = sum(self._process_times.values())
-        os.system('kill -%i %i' % (
-            sig,
-            self._p.pid,
-        ))
-        #return super(TimedProcess, self).terminate(*args, **kwargs)
+            # Do one last time check, including any recently spawned children.
+            self._sampler.sample(discover=True)
+            self.last_cpu_user_seconds = self._sampler.user_seconds
+            # Wait on the sampled tree instead of scanning for the group's
+            # members. Descendants that started their own process group aren't
+            # reached by signalling ours, so they're signalled directly too.
+            processes = [self._p] + self._sampler.descendants()
+        self.kill_info = kill_process_group(self.pid, sig=sig, grace_seconds=grace_seconds, processes=processes)
+        return self.kill_info
 
     def get_duration_seconds_wall(self):
         if self.t1_objective is not None:
@@ -343,49 +811,19 @@ class TimedProcess(Process):
         return now - self.t0
 
     def get_duration_seconds_cpu_recursive(self):
-        # Note, this calculation will consume much user
-        # CPU time itself than simply checking clock().
-        # Recommend using larger check_freq to minimize this.
-        # Note, we must store historical child times because child
-        # processes may die, causing them to no longer be included in
-        # future calculations, possibly corrupting the total time.
-        try:
-            self._process_times[self._p.pid] = self._p.get_cpu_times().user
-            children = self._p.get_children(recursive=True)
-            for child in children:
-                self._process_times[child.pid] = child.get_cpu_times().user
-            sum_proc_times = sum(self._process_times.itervalues())
-        except AttributeError:
-            self._process_times[self._p.pid] = self._p.cpu_times().user
-            children = self._p.children(recursive=True)
-            for child in children:
-                self._process_times[child.pid] = child.cpu_times().user
-            sum_proc_times = sum(self._process_times.values())
-        # TODO:optimize by storing total sum and tracking incremental changes?
-        return sum_proc_times
-
-    def get_cpu_usage_recursive(self, interval=1):
-        usage = 0
-        try:
-            try:
-                usage = self._p.get_cpu_percent(interval=interval)
-                children = self._p.get_children(recursive=True)
-                for child in children:
-                    try:
-                        usage += child.get_cpu_percent(interval=interval)
-                    except psutil._error.NoSuchProcess:
-                        pass
-            except AttributeError:
-                usage = self._p.cpu_percent(interval=interval)
-                children = self._p.children(recursive=True)
-                for child in children:
-                    try:
-                        usage += child.cpu_percent(interval=interval)
-                    except psutil._error.NoSuchProcess:
-                        pass
-        except psutil._error.NoSuchProcess:
-            pass
-        return usage
+        """
+        Returns the user CPU seconds used by the process and all its
+        descendants, including those that have since exited.
+        """
+        return self._sampler.sample().user_seconds
+
+    def get_cpu_usage_recursive(self, interval=None):
+        """
+        Returns the CPU usage percent of the process and all its descendants
+        since the previous sample. This doesn't block, so the interval is
+        ignored and only kept for backwards compatibility.
+        """
+        return self._sampler.sample().cpu_percent
 
     def get_duration_seconds_max(self):
         return max(
@@ -426,9 +864,16 @@ class TimedProcess(Process):
     def seconds_until_timeout(self):
         return max(self.max_seconds - self.get_duration_seconds(), 0)
 
+    def run(self):
+        # Lead a new session, so that everything the target starts shares our
+        # process group and can be terminated together.
+        os.setsid()
+        super().run()
+
     def start(self, *args, **kwargs):
         super().start(*args, **kwargs)
         self._p = psutil.Process(self.pid)
+        self._sampler = ProcessTreeSampler(self.pid)
 
     def start_then_kill(self, verbose=True):
         """
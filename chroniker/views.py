@@ -1,6 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.decorators import user_passes_test
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from toposort import CircularDependencyError
 
+from chroniker import metrics as _metrics, utils
+from chroniker.chains import get_chain_estimate
 from chroniker.admin import JobAdmin
 from chroniker.models import Job
 
@@ -10,3 +15,29 @@ def job_run(request, pk):
 
 
 job_run = user_passes_test(lambda user: user.is_superuser)(job_run)
+
+
+def metrics(request):
+    """
+    Serves scheduler and job metrics in the Prometheus text format.
+    """
+    return HttpResponse(_metrics.render_metrics(), content_type=_metrics.CONTENT_TYPE)
+
+
+metrics = user_passes_test(lambda user: user.is_staff)(metrics)
+
+
+def job_chain(request, pk):
+    """
+    Serves the critical path and estimated duration of the chain of jobs
+    waiting on a job as JSON, or with ?live=1, when the running chain will finish.
+    """
+    job = get_object_or_404(Job, pk=pk)
+    try:
+        estimate = get_chain_estimate(job, live=utils.parse_bool(request.GET.get('live')))
+    except CircularDependencyError as exc:
+        return JsonResponse({'error': 'The chain has a dependency cycle: %s' % exc}, status=400)
+    return JsonResponse(estimate.as_dict())
+
+
+job_chain = user_passes_test(lambda user: user.is_staff)(job_chain)